@@ -0,0 +1,123 @@
+"""
+Generate synthetic Google Form response CSVs, and matching daily_activities_config.json variants,
+for benchmarking. The CSV has exactly the columns that Student expects.
+"""
+import argparse
+import csv
+import json
+import random
+from datetime import datetime, timedelta
+
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday"]
+ORDINALS = ["First", "Second", "Third"]
+FIRST_NAMES = ["Avery", "Blake", "Casey", "Drew", "Emerson", "Finley", "Gray", "Harper", "Indy", "Jordan",
+               "Kendall", "Logan", "Morgan", "Noel", "Oakley", "Parker", "Quinn", "Reese", "Sawyer", "Taylor"]
+LAST_NAMES = ["Adams", "Brooks", "Carter", "Diaz", "Ellis", "Foster", "Garcia", "Hayes", "Ingram", "Jensen",
+              "Kim", "Lopez", "Mitchell", "Nguyen", "Owens", "Patel", "Reyes", "Shaw", "Turner", "Walsh"]
+ACTIVITY_NAMES = ["Athletics", "Genius Grant", "Serving Seniors", "Cricut Crafts", "Robotics", "Chess", "Woodshop",
+                  "Praise Team", "Yoga", "Yearbook", "Basketball Training", "Morning Announcements",
+                  "Classic Vehicle Restoration", "Math Tutoring", "Pickleball", "ESports"]
+
+# Column headers, in the order a Google Forms export has them.
+FIELD_NAMES = (["Timestamp", "Type your first name", "Type your last name",
+                "I am currently participating in at least one LHS sport.",
+                "I understand that disciplinary issues could result in not receiving credit for Innovation Lab.",
+                "I understand that my participation and effort in the selections I have made will determine if I am able to stay in each offering."]
+               + [f"{day} {ordinal} Choice" for day in DAY_NAMES for ordinal in ORDINALS])
+
+def generate_config(student_count: int, activities_per_day: int = 10, capacity_ratio: float = 1.1,
+                    uncapped_ratio: float = 0.3, weight_factor: float = 1e-05, seed: int = 0) -> dict:
+    """
+    Generate a daily_activities_config.json structure.
+    Args:
+        student_count (int): caps are scaled to this many students
+        activities_per_day (int)
+        capacity_ratio (float): total capped seats per day, as a ratio of student_count
+        uncapped_ratio (float): share of activities with "no cap"
+        weight_factor (float): athletics weight factor
+        seed (int)
+    Returns:
+        dict
+    """
+    rnd = random.Random(seed)
+    sheets = []
+    for day in DAY_NAMES:
+        activity_names = ["Athletics"] + rnd.sample(ACTIVITY_NAMES[1:], activities_per_day - 1)
+        capped_count = max(1, round(activities_per_day * (1 - uncapped_ratio)))
+        cap = max(4, int(student_count * capacity_ratio / activities_per_day))
+        activities = []
+        for i, activity_name in enumerate(activity_names):
+            # Athletics stays uncapped, as in the shipped config.
+            is_capped = 0 < i <= capped_count
+            activities.append({"activity": activity_name, "cap": rnd.randint(cap // 2, cap) if is_capped else "no cap"})
+        sheets.append({"sheet": {"day": day, "activities": activities}})
+
+    return {"weight_rules": [{"activity": "Athletics", "when": {"in_athletics": True}, "add": weight_factor}],
+            "sheets": sheets}
+
+def generate_responses(filename: str, config_data: dict, student_count: int, popularity_skew: float = 1.0,
+                       athletics_ratio: float = 0.3, timestamp_spread_days: float = 7.0, seed: int = 0):
+    """
+    Write a CSV of synthetic form responses.
+    Args:
+        filename (str)
+        config_data (dict): config whose activities the students choose from
+        student_count (int)
+        popularity_skew (float): Zipf exponent of activity popularity. 0 is uniform.
+        athletics_ratio (float): share of students in athletics
+        timestamp_spread_days (float): responses arrive over this many days, most of them early
+        seed (int)
+    """
+    rnd = random.Random(seed)
+    form_opened = datetime(2024, 10, 21, 7, 30, 0)
+    day_activities = {}
+    for sheet_dict in config_data["sheets"]:
+        activity_names = [activity_dict["activity"] for activity_dict in sheet_dict["sheet"]["activities"]]
+        popularity = [1 / (rank + 1) ** popularity_skew for rank in range(len(activity_names))]
+        day_activities[sheet_dict["sheet"]["day"]] = (activity_names, popularity)
+
+    with open(filename, "w", newline="") as csv_file:
+        # noinspection PyTypeChecker
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(FIELD_NAMES)
+        for i in range(student_count):
+            # Most responses come soon after the form opens.
+            offset_seconds = min(rnd.expovariate(3 / timestamp_spread_days), timestamp_spread_days) * 86400
+            timestamp = form_opened + timedelta(seconds=int(offset_seconds))
+            row = [timestamp.strftime("%m/%d/%Y %H:%M:%S"),
+                   rnd.choice(FIRST_NAMES), f"{rnd.choice(LAST_NAMES)}-{i}",
+                   "Yes" if rnd.random() < athletics_ratio else "No",
+                   "I understand", "I understand"]
+            for day in DAY_NAMES:
+                activity_names, popularity = day_activities.get(day, (ACTIVITY_NAMES, None))
+                # Three different choices, picked by popularity.
+                choices = []
+                while len(choices) < min(3, len(activity_names)):
+                    choice = rnd.choices(activity_names, weights=popularity)[0]
+                    if choice not in choices:
+                        choices.append(choice)
+                row.extend(choices + [choices[-1]] * (3 - len(choices)))
+            csv_writer.writerow(row)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Generate synthetic form responses and a matching config.")
+    arg_parser.add_argument("output_csv", help="Response CSV file to write")
+    arg_parser.add_argument("output_config", help="Config JSON file to write")
+    arg_parser.add_argument("--students", type=int, default=1000)
+    arg_parser.add_argument("--activities-per-day", type=int, default=10)
+    arg_parser.add_argument("--capacity-ratio", type=float, default=1.1, help="Capped seats per day / students")
+    arg_parser.add_argument("--popularity-skew", type=float, default=1.0, help="Zipf exponent of activity popularity")
+    arg_parser.add_argument("--athletics-ratio", type=float, default=0.3)
+    arg_parser.add_argument("--timestamp-spread-days", type=float, default=7.0)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    args = arg_parser.parse_args()
+
+    config_data = generate_config(args.students, args.activities_per_day, args.capacity_ratio, seed=args.seed)
+    with open(args.output_config, "w") as config_file:
+        # noinspection PyTypeChecker
+        json.dump(config_data, config_file, indent=3)
+    generate_responses(args.output_csv, config_data, args.students, args.popularity_skew, args.athletics_ratio,
+                       args.timestamp_spread_days, args.seed)
+
+if __name__ == "__main__":
+    main()
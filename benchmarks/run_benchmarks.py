@@ -0,0 +1,150 @@
+"""
+Scaling benchmarks for the assignment pipeline.
+For each student count and engine, generates a response CSV and config, then times each phase
+(streaming the CSV into a StudentTable, assignment, a single large lottery, and the CSV writers)
+and records peak traced memory. Results are saved as JSON, and can be compared with an earlier results file.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py --sizes 1000,10000 --output bench_results.json
+"""
+import argparse
+import json
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Make the source packages importable, as when installed.
+_src_dir = str(pathlib.PurePath(__file__).parent.parent.joinpath("src"))
+if _src_dir not in sys.path:
+    sys.path.insert(0, _src_dir)
+
+from generate_responses import generate_config, generate_responses
+from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.functions import read_student_table, assign_sheets, write_output_files
+from innovation_lab_assignments import random_select
+
+LOTTERY_CANDIDATES = 2000
+LOTTERY_CAP = 8
+
+def _run_phases(csv_name: str, engine: str, output_dir: str) -> dict:
+    """
+    Run the pipeline once, the way main_loop() does.
+    Returns: dict: seconds per phase
+    """
+    phase_seconds = {}
+
+    def _timed(phase_name, function, *args):
+        start_time = time.perf_counter()
+        result = function(*args)
+        phase_seconds[phase_name] = time.perf_counter() - start_time
+        return result
+
+    config = Config.get_instance()
+    student_table = _timed("read_student_table", read_student_table, csv_name)
+    sheet_recs = [SheetRec(sheet_dict["sheet"]) for sheet_dict in config.get_sheets()]
+    lottery_rng = random_select.LotteryRng(0)
+
+    result = _timed("assign", assign_sheets, sheet_recs, student_table, engine, lottery_rng)
+
+    lottery_students = student_table.students()[0: LOTTERY_CANDIDATES]
+    lottery_activity = Activity({"activity": "Robotics", "cap": LOTTERY_CAP})
+    _timed("randomize_students", random_select.randomize_students, lottery_students, lottery_activity, lottery_rng.substream("", 0, ""))
+    _timed("select_lottery_winners", random_select.select_lottery_winners, lottery_students, lottery_activity, LOTTERY_CAP,
+           lottery_rng.substream("", 0, ""))
+
+    _timed("write_output", write_output_files, result, output_dir)
+
+    return phase_seconds
+
+def _peak_memory(csv_name: str, engine: str, output_dir: str) -> int:
+    """
+    Run the pipeline again with tracemalloc on. Tracing slows Python down, so it is kept out of the timings.
+    Returns: int: peak traced bytes
+    """
+    tracemalloc.start()
+    try:
+        _run_phases(csv_name, engine, output_dir)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_benchmarks(sizes: [int], engines: [str], work_dir: str, measure_memory: bool = True) -> dict:
+    """
+    Returns: dict: results, suitable for saving to a .json file.
+    """
+    config = Config.get_instance()
+    random_select.set_reference_time(datetime(2024, 11, 29, 12, 0, 0))
+    results = []
+    for student_count in sizes:
+        config_data = generate_config(student_count)
+        csv_name = str(pathlib.PurePath(work_dir).joinpath(f"responses_{student_count}.csv"))
+        generate_responses(csv_name, config_data, student_count)
+        config.json_data = config_data
+
+        for engine in engines:
+            phase_seconds = _run_phases(csv_name, engine, work_dir)
+            result = {"students": student_count, "engine": engine, "seconds": phase_seconds,
+                      "total_seconds": sum(phase_seconds.values())}
+            if measure_memory:
+                result["peak_memory_bytes"] = _peak_memory(csv_name, engine, work_dir)
+            print(f"{student_count:>8} {engine:<8} {result['total_seconds']:8.3f}s "
+                  + " ".join(f"{name}={seconds:.3f}" for name, seconds in phase_seconds.items()))
+            results.append(result)
+
+    return {"created": datetime.now().isoformat(), "python": platform.python_version(), "results": results}
+
+def compare_results(previous: dict, current: dict, threshold: float) -> [str]:
+    """
+    Return a message for every phase that got slower than threshold times its previous time.
+    """
+    previous_results = {(result["students"], result["engine"]): result for result in previous["results"]}
+    regressions = []
+    for result in current["results"]:
+        previous_result = previous_results.get((result["students"], result["engine"]))
+        if previous_result is None:
+            continue
+        for phase_name, seconds in result["seconds"].items():
+            previous_seconds = previous_result["seconds"].get(phase_name)
+            # Ignore phases too short to time reliably.
+            if previous_seconds is not None and seconds > 0.05 and seconds > previous_seconds * threshold:
+                regressions.append(f"{result['students']} {result['engine']} {phase_name}: "
+                                   f"{previous_seconds:.3f}s -> {seconds:.3f}s")
+    return regressions
+
+def main():
+    from innovation_lab_assignments.numpy_engine import is_numpy_available
+
+    default_engines = [Config.engine_python] + ([Config.engine_numpy] if is_numpy_available() else [])
+    arg_parser = argparse.ArgumentParser(description="Time each phase of an assignment run at several sizes.")
+    arg_parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated student counts")
+    arg_parser.add_argument("--engines", default=",".join(default_engines), help="Comma-separated engines")
+    arg_parser.add_argument("--output", default="bench_results.json", metavar="JSON file")
+    arg_parser.add_argument("--compare", default=None, metavar="JSON file", help="Earlier results to compare with")
+    arg_parser.add_argument("--threshold", type=float, default=1.25, help="Slowdown ratio reported as a regression")
+    arg_parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory pass")
+    args = arg_parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    engines = args.engines.split(",")
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(sizes, engines, work_dir, not args.no_memory)
+
+    with open(args.output, "w") as output_file:
+        # noinspection PyTypeChecker
+        json.dump(results, output_file, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as compare_file:
+            regressions = compare_results(json.load(compare_file), results, args.threshold)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,5 +10,6 @@ setup(
               "config_editor",
               "innovation_lab_assignments_ui"],
     include_package_data=True,  # Allows MANIFEST.in to control included files
-    install_requires=["my_utilities >= 1.0.0"]
+    install_requires=["my_utilities >= 1.0.0"],
+    extras_require={"numpy": ["numpy"]}
 )
\ No newline at end of file
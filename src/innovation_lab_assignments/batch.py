@@ -0,0 +1,281 @@
+"""
+Batch mode: assign many (input CSV, config, output directory) jobs, e.g. one per school building, in one invocation:
+
+    python -m innovation_lab_assignments.batch <manifest file> [--jobs N] [--summary FILE]
+
+The manifest is a JSON list of jobs (or {"jobs": [...]}). Relative paths are relative to the manifest's directory:
+
+    [
+       {"name": "north", "input": "north_responses.csv", "config": "north_config.json", "output_dir": "north"},
+       {"name": "south", "input": "south_responses.csv", "config": "south_config.json", "output_dir": "south",
+        "seed": 12345, "engine": "numpy"}
+    ]
+
+Jobs run in a pool of worker processes, each job as main_loop() runs it. Every config is compiled once in this process,
+and configs with identical contents share one CompiledConfig, which is sent once to every worker.
+A job that fails is reported in the summary, and does not stop the other jobs. The summary file has each job's
+status, timings, record count, and manual assignment count.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from json import JSONDecodeError
+from innovation_lab_assignments.functions import *
+from innovation_lab_assignments.classes import Config
+from innovation_lab_assignments.metrics import enable_metrics, disable_metrics
+
+log_file_name = "innovation_lab_batch.log"
+_JOB_KEYS = ("input", "config", "output_dir")
+
+class BatchJob:
+    """
+    One job of a batch.
+    Attributes:
+        name (str)
+        input_file_name (str)
+        config_file_name (str)
+        output_dir_name (str)
+        seed (int)
+        engine (str)
+        config_key (str): content hash of the job's config, or None if it could not be loaded
+        error (str): why the job cannot run, or None
+    """
+    def __init__(self, job_dict: dict, index: int, base_dir: str, seed: int = None, engine: str = Config.engine_python):
+        """
+        Args:
+            job_dict (dict): the job's manifest entry
+            index (int): the job's position in the manifest, for its default name
+            base_dir (str): directory that relative paths are relative to
+            seed (int): lottery seed, unless the job has its own. Defaults to a new seed per job.
+            engine (str): assignment engine, unless the job has its own
+        """
+        self.error = None
+        self.config_key = None
+        if not isinstance(job_dict, dict):
+            job_dict = {}
+        self.name = str(job_dict.get("name", f"job {index + 1}"))
+        missing_keys = [key for key in _JOB_KEYS if not isinstance(job_dict.get(key), str)]
+        if len(missing_keys) > 0:
+            self.error = f"missing {', '.join(missing_keys)}"
+        self.input_file_name, self.config_file_name, self.output_dir_name = [
+            os.path.join(base_dir, job_dict[key]) if isinstance(job_dict.get(key), str) else None for key in _JOB_KEYS]
+        self.seed = job_dict.get("seed", seed)
+        if self.seed is None:
+            self.seed = random.getrandbits(64)
+        self.engine = job_dict.get("engine", engine)
+        if not isinstance(self.seed, int):
+            self.error = f"seed {self.seed} is not a number"
+        elif self.engine not in Config.engines:
+            self.error = f"engine {self.engine} is not one of {', '.join(Config.engines)}"
+
+def read_manifest(manifest_file_name: str, seed: int = None, engine: str = Config.engine_python) -> [BatchJob]:
+    """
+    Read the jobs of the passed manifest. Jobs with errors are returned with their error set.
+    Raises:
+        FileNotFoundError
+        ValueError: the manifest is not a JSON list of jobs.
+    """
+    with open(manifest_file_name) as manifest_file:
+        manifest = json.load(manifest_file)
+    if isinstance(manifest, dict):
+        manifest = manifest.get("jobs")
+    if not isinstance(manifest, list):
+        raise ValueError(f"{manifest_file_name} is not a list of jobs")
+    base_dir = os.path.dirname(os.path.abspath(manifest_file_name))
+    return [BatchJob(job_dict, index, base_dir, seed, engine) for index, job_dict in enumerate(manifest)]
+
+def compile_configs(jobs: [BatchJob]) -> dict:
+    """
+    Compile every job's config once, and set each job's config_key. Configs with identical contents share one CompiledConfig.
+    Jobs whose config cannot be loaded get their error set.
+    Returns:
+        dict: key: config content hash, value: CompiledConfig
+    """
+    from innovation_lab_assignments.config_cache import load_compiled_config
+    compiled_configs = {}
+    config_keys = {} #key: absolute config file name, value: content hash, or an error message
+    for job in jobs:
+        if job.error is not None:
+            continue
+        config_name = os.path.abspath(job.config_file_name)
+        if config_name not in config_keys:
+            try:
+                compiled_config = load_compiled_config(config_name)
+                config_key = hashlib.sha256(json.dumps(compiled_config.json_data, sort_keys=True).encode("utf-8")).hexdigest()
+                compiled_configs.setdefault(config_key, compiled_config)
+                config_keys[config_name] = (config_key, None)
+            except FileNotFoundError:
+                config_keys[config_name] = (None, f"config file {job.config_file_name} not found")
+            except JSONDecodeError as exception:
+                config_keys[config_name] = (None, f"config file {job.config_file_name} contains invalid JSON: {exception}")
+            except (OSError, ValueError, KeyError, TypeError) as exception:
+                # e.g. a sheet without "sheet", or a cap that is not a number. Only this config's jobs fail.
+                config_keys[config_name] = (None, f"config file {job.config_file_name} is invalid: {exception!r}")
+        job.config_key, job.error = config_keys[config_name]
+        if job.config_key is not None and len(compiled_configs[job.config_key].json_data.get("sheets", [])) == 0:
+            job.error = f"config file {job.config_file_name} has no sheets"
+    return compiled_configs
+
+class _ErrorRecords(logging.Handler):
+    """
+    Keeps the messages of the ERROR records logged while a job runs, for its summary.
+    """
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord):
+        self.messages.append(record.getMessage())
+
+# Worker process state, set once per worker by _init_worker().
+_worker_compiled_configs = {}
+
+def _init_worker(compiled_configs: dict):
+    """
+    Worker process initializer. Every distinct compiled config is sent once per worker.
+    """
+    global _worker_compiled_configs
+    _worker_compiled_configs = compiled_configs
+
+def run_job(job: BatchJob, reference_time: datetime, no_cache: bool = False) -> dict:
+    """
+    Run one job as main_loop() does, in this (worker) process.
+    Args:
+        job (BatchJob)
+        reference_time (datetime): time that timestamp weights are calculated from
+        no_cache (bool): True to always parse the input file (--no-cache)
+    Returns:
+        dict: the job's summary
+    """
+    from innovation_lab_assignments.run_context import RunContext
+    summary = {"name": job.name, "input": job.input_file_name, "config": job.config_file_name, "output_dir": job.output_dir_name,
+               "seed": job.seed, "engine": job.engine}
+    error_records = _ErrorRecords()
+    logging.getLogger().addHandler(error_records)
+    metrics = enable_metrics() #Just this job's metrics.
+    start_time = time.perf_counter()
+    try:
+        context = RunContext(_worker_compiled_configs[job.config_key], job.input_file_name, job.output_dir_name, job.engine,
+                             seed=job.seed, reference_time=reference_time, no_cache=no_cache)
+        os.makedirs(job.output_dir_name, exist_ok=True)
+        logging.info("Batch job %s: %s", job.name, job.input_file_name)
+        is_succeeded = main_loop(context) == 0
+    except Exception as exception:
+        logging.exception(f"Batch job {job.name} failed: {exception}")
+        is_succeeded = False
+    finally:
+        logging.getLogger().removeHandler(error_records)
+        disable_metrics()
+
+    summary["status"] = "ok" if is_succeeded else "failed"
+    summary["seconds"] = time.perf_counter() - start_time
+    summary["records"] = metrics.counters.get("students", 0)
+    summary["manual_assignments"] = metrics.counters.get("manual_assignments", 0)
+    spans = {}
+    for (name, ignored_labels), (ignored_count, seconds) in metrics.spans.items():
+        spans[name] = spans.get(name, 0.0) + seconds
+    summary["spans"] = spans
+    if len(error_records.messages) > 0:
+        summary["errors"] = error_records.messages
+    return summary
+
+def _failed_summary(job: BatchJob, error: str) -> dict:
+    return {"name": job.name, "input": job.input_file_name, "config": job.config_file_name, "output_dir": job.output_dir_name,
+            "status": "failed", "errors": [error]}
+
+def run_batch(jobs: [BatchJob], workers: int = 1, reference_time: datetime = None, no_cache: bool = False) -> dict:
+    """
+    Run every job in a pool of worker processes.
+    A job that crashes its worker fails alone: the jobs that were running with it are run again, each in its own process.
+    Args:
+        jobs ([BatchJob])
+        workers (int): number of worker processes
+        reference_time (datetime): time that timestamp weights are calculated from, for every job. Defaults to now.
+        no_cache (bool): True to always parse the input files (--no-cache)
+    Returns:
+        dict: summary of the batch and of every job, in manifest order, suitable for saving to a .json file.
+    """
+    start_time = time.perf_counter()
+    if reference_time is None:
+        reference_time = datetime.now()
+    compiled_configs = compile_configs(jobs)
+    summaries = [_failed_summary(job, job.error) if job.error is not None else None for job in jobs]
+
+    pending_indexes = [index for index, summary in enumerate(summaries) if summary is None]
+    crashed_indexes = []
+    if len(pending_indexes) > 0:
+        with ProcessPoolExecutor(max_workers=max(min(workers, len(pending_indexes)), 1), initializer=_init_worker,
+                                 initargs=(compiled_configs,)) as executor:
+            futures = {index: executor.submit(run_job, jobs[index], reference_time, no_cache) for index in pending_indexes}
+            for index, future in futures.items():
+                try:
+                    summaries[index] = future.result()
+                except BrokenProcessPool:
+                    crashed_indexes.append(index)
+                except Exception as exception:
+                    summaries[index] = _failed_summary(jobs[index], str(exception))
+    for index in crashed_indexes:
+        with ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(compiled_configs,)) as executor:
+            try:
+                summaries[index] = executor.submit(run_job, jobs[index], reference_time, no_cache).result()
+            except Exception as exception:
+                summaries[index] = _failed_summary(jobs[index], f"worker process failed: {exception!r}")
+
+    failed_count = sum(1 for summary in summaries if summary["status"] != "ok")
+    return {"reference_time": reference_time.isoformat(), "seconds": time.perf_counter() - start_time,
+            "configs": len(compiled_configs), "jobs": len(jobs), "failed": failed_count, "results": summaries}
+
+def _parse_cmd_line_args():
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="innovation_lab_assignments.batch",
+                                         description="Runs the assignment for every (input CSV, config, output directory) job of a manifest, and writes a summary.")
+    arg_parser.add_argument("manifest", metavar="<manifest file>", help="JSON list of jobs, each with input, config and output_dir")
+    arg_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, metavar="N",
+                            help="Number of worker processes. Defaults to one per CPU.")
+    arg_parser.add_argument("--summary", default="batch_summary.json", metavar="JSON file",
+                            help="Summary file. Defaults to batch_summary.json.")
+    arg_parser.add_argument("--seed", type=int, default=None, metavar="N",
+                            help="Lottery seed of jobs without their own. Defaults to a new seed per job.")
+    arg_parser.add_argument("--engine", choices=Config.engines, default=Config.engine_python,
+                            help="Assignment engine of jobs without their own. Defaults to python.")
+    arg_parser.add_argument("--reference-time", type=Config._parse_reference_time, default=None, metavar="TIME",
+                            help="Time that timestamp weights are calculated from, for every job. Defaults to now.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Always parse the input files, without the parsed input cache.")
+    return arg_parser.parse_args()
+
+def main():
+    import pathlib
+    from my_utilities import init_log
+
+    config = Config.get_instance()
+    if config.project_root == "":
+        config.project_root = str(pathlib.PurePath(__file__).parent)
+    init_log(prepend_project_root_if_required(log_file_name, config.project_root), logging_level=logging.INFO, truncate_log=True)
+
+    args = _parse_cmd_line_args()
+    try:
+        jobs = read_manifest(args.manifest, args.seed, args.engine)
+    except FileNotFoundError:
+        logging.error("Manifest with filename " + args.manifest + " not found")
+        return die()
+    except (JSONDecodeError, ValueError) as exception:
+        logging.error(f"Manifest {args.manifest}: {exception}")
+        return die()
+
+    summary = run_batch(jobs, args.jobs, args.reference_time, args.no_cache)
+    with open(args.summary, "w") as summary_file:
+        # noinspection PyTypeChecker
+        json.dump(summary, summary_file, indent=2)
+    for job_summary in summary["results"]:
+        logging.info("%s: %s, %i records, %i manual assignments", job_summary["name"], job_summary["status"],
+                     job_summary.get("records", 0), job_summary.get("manual_assignments", 0))
+    logging.info("Done: %i of %i jobs failed", summary["failed"], summary["jobs"])
+    return 0 if summary["failed"] == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
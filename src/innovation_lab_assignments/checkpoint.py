@@ -0,0 +1,173 @@
+"""
+Checkpointed run state, for incremental re-assignment of late form responses.
+Every run saves a RunCheckpoint in its output directory: the StudentTable with everyone's selections, each sheet's
+activities with their caps and assigned rows, and the lottery seed and reference time. The lottery keys of every
+lottery are derived from the seed (see LotteryRng), so they are not stored one by one.
+
+An --incremental run loads the checkpoint, reads only the rows added to the input file since then, and places those
+students into the remaining seats, with the same priority rules as assign_sheet_activities(). Earlier students keep
+their assignments, and are not entered into the new lotteries. The outputs are written again with the new students
+appended to each activity's column.
+
+The input file is expected to only grow, as form exports do: if it still starts with the checkpointed content,
+only the bytes after it are parsed. Otherwise the whole file is parsed, and rows whose Timestamp is newer than the
+checkpoint's newest are taken as new.
+"""
+import csv
+import hashlib
+import io
+import locale
+import logging
+import os
+import pickle
+import tempfile
+from innovation_lab_assignments.classes import *
+
+CHECKPOINT_FILE_NAME = "assignment_checkpoint.pickle"
+_CHECKPOINT_VERSION = 1 #Increment when RunCheckpoint changes, to ignore older checkpoints.
+
+class RunCheckpoint:
+    """
+    The state of an assignment run.
+    Attributes:
+        student_table (StudentTable): every student so far, with their selections
+        sheets ([tuple]): (day, [(activity name, cap, [assigned rows])]) per sheet
+        seed (int): lottery seed
+        generation (int): 0 after a full run, incremented by every incremental run. See LotteryRng.
+        reference_time (datetime): reference time of the newest run's lotteries
+        newest_timestamp (float): newest Timestamp in student_table, as seconds since 1970-01-01
+        input_size (int): input file size, in bytes, when it was read
+        input_hash (str): SHA-256 of the input file's first input_size bytes
+    """
+    def __init__(self, result: AssignmentResult, seed: int, generation: int, reference_time: datetime, input_state: tuple):
+        """
+        Args:
+            result (AssignmentResult): the run's assignments
+            seed (int)
+            generation (int)
+            reference_time (datetime)
+            input_state (tuple): input_file_state() of the input file, from before it was read
+        """
+        self.student_table = result.student_table
+        self.sheets = [(sheet_rec.day, [(activity.name, activity.cap, [student.row for student in activity.students])
+                                        for activity in sheet_rec.activities])
+                       for sheet_rec in result.sheet_recs]
+        self.seed = seed
+        self.generation = generation
+        self.reference_time = reference_time
+        self.newest_timestamp = max(self.student_table.timestamps, default=0.0)
+        self.input_size, self.input_hash = input_state
+
+    def sheet_caps(self) -> list:
+        """
+        Returns: [(str, [(str, int)])]: the day and the activity names and caps of every checkpointed sheet.
+        """
+        return [(day, [(name, cap) for name, cap, ignored_rows in activities]) for day, activities in self.sheets]
+
+    def sheet_recs(self) -> [SheetRec]:
+        """
+        Returns: [SheetRec]: the checkpointed sheets, with their assigned students.
+        """
+        sheet_recs = []
+        for day, activities in self.sheets:
+            sheet_rec = SheetRec({"day": day, "activities": [{"activity": name, "cap": cap} for name, cap, ignored_rows in activities]})
+            for activity, (ignored_name, ignored_cap, rows) in zip(sheet_rec.activities, activities):
+                activity.students.extend(self.student_table.student(row) for row in rows)
+            sheet_recs.append(sheet_rec)
+        return sheet_recs
+
+def _hash_prefix(filename: str, size: int) -> str:
+    """
+    Returns: str: SHA-256 of the passed file's first size bytes.
+    """
+    file_hash = hashlib.sha256()
+    with open(filename, "rb") as input_file:
+        while size > 0 and (chunk := input_file.read(min(size, 1024 * 1024))):
+            file_hash.update(chunk)
+            size -= len(chunk)
+    return file_hash.hexdigest()
+
+def input_file_state(filename: str) -> tuple:
+    """
+    Returns: tuple: (size, SHA-256) of the passed file
+    Raises:
+        FileNotFoundError
+    """
+    size = os.path.getsize(filename)
+    return size, _hash_prefix(filename, size)
+
+def checkpoint_file_name(output_dir: str) -> str:
+    return os.path.join(output_dir, CHECKPOINT_FILE_NAME)
+
+def save_checkpoint(filename: str, checkpoint: RunCheckpoint):
+    """
+    Write the checkpoint atomically, so an interrupted run leaves the previous checkpoint.
+    """
+    file_descriptor, temp_name = tempfile.mkstemp(dir=os.path.dirname(filename) or ".", prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as checkpoint_file:
+            pickle.dump({"version": _CHECKPOINT_VERSION, "checkpoint": checkpoint}, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_name, filename)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+def load_checkpoint(filename: str) -> RunCheckpoint:
+    """
+    Returns: RunCheckpoint: the checkpoint, or None if it is missing, unreadable or from another version.
+    """
+    try:
+        with open(filename, "rb") as checkpoint_file:
+            saved = pickle.load(checkpoint_file)
+    except FileNotFoundError:
+        return None
+    except Exception as exception:
+        logging.error(f"Unable to read checkpoint {filename}: {exception}")
+        return None
+    if not isinstance(saved, dict) or saved.get("version") != _CHECKPOINT_VERSION:
+        logging.error(f"Checkpoint {filename} is from another version")
+        return None
+    return saved["checkpoint"]
+
+def read_new_rows(filename: str, checkpoint: RunCheckpoint, input_state: tuple, input_columns: dict = None) -> StudentTable:
+    """
+    Read the students whose responses were added to the input file after the checkpoint.
+    Args:
+        filename (str): CSV file name. It may be gzip-compressed, but then it is always parsed in full.
+        checkpoint (RunCheckpoint)
+        input_state (tuple): input_file_state() of the input file. Bytes added after it are left for the next run.
+        input_columns (dict): key: input field, value: column header. Defaults to INPUT_COLUMNS.
+    Returns:
+        StudentTable: the new students, with activity ids of their own. Invalid records are logged and skipped.
+    Raises:
+        FileNotFoundError
+        ValueError: a column is missing.
+    """
+    from innovation_lab_assignments.functions import open_input, is_gzip_file
+    input_size = input_state[0]
+    with open_input(filename) as input_file:
+        csv_reader = csv.reader(input_file)
+        header = next(csv_reader, None)
+        if header is None:
+            return StudentTable()
+        column_indexes = resolve_input_columns(header, input_columns)
+
+        if input_size < checkpoint.input_size or is_gzip_file(filename) or _hash_prefix(filename, checkpoint.input_size) != checkpoint.input_hash:
+            logging.info("%s was changed, not only appended to. Selecting new rows by Timestamp.", filename)
+            timestamp_index = column_indexes["timestamp"]
+            newest_timestamp = checkpoint.newest_timestamp
+
+            def _is_new(row) -> bool:
+                try:
+                    return len(row) > timestamp_index and parse_form_timestamp(row[timestamp_index]) > newest_timestamp
+                except ValueError:
+                    return True #from_rows() logs and skips it.
+
+            return StudentTable.from_rows(filter(_is_new, csv_reader), column_indexes, source=filename)
+
+    # Only the appended bytes are parsed.
+    with open(filename, "rb") as binary_file:
+        binary_file.seek(checkpoint.input_size)
+        new_text = binary_file.read(input_size - checkpoint.input_size).decode(locale.getpreferredencoding(False))
+    return StudentTable.from_rows(csv.reader(io.StringIO(new_text, newline="")), column_indexes,
+                                  source=f"{filename} from byte {checkpoint.input_size},")
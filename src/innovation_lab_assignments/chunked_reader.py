@@ -0,0 +1,158 @@
+"""
+Parallel reader for very large response exports.
+The CSV file is memory-mapped and split into chunks that end on record boundaries. A newline ends a record
+only outside quotes, and since csv escapes quotes by doubling them, a newline is outside quotes when
+an even number of quote characters come before it.
+Each worker process maps the file itself and parses its own chunk into a StudentTable, so no raw text is sent
+between processes. The chunk tables are then concatenated, renumbering their activity ids.
+
+read_student_table() selects this reader for uncompressed files of at least PARALLEL_READ_THRESHOLD bytes.
+"""
+import csv
+import io
+import locale
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.metrics import get_metrics
+
+PARALLEL_READ_THRESHOLD = 64 * 1024 * 1024 #bytes
+_CHUNKS_PER_JOB = 4
+_COUNT_STEP = 1024 * 1024 #bytes counted at a time, to bound the memory of each slice.
+
+def _count_bytes(file_map, start: int, end: int, byte: bytes = b'"') -> int:
+    """
+    Returns: int: the number of the passed byte, by default quote characters, in file_map[start: end].
+    """
+    return sum(file_map[position: min(position + _COUNT_STEP, end)].count(byte)
+               for position in range(start, end, _COUNT_STEP))
+
+def _record_end(file_map, position: int, end: int, is_in_quotes: bool) -> int:
+    """
+    Return the offset just past the first record-ending newline at or after position.
+    Args:
+        file_map (mmap)
+        position (int)
+        end (int): offset to stop searching at
+        is_in_quotes (bool): True if position is inside a quoted field
+    Returns:
+        int: offset of the next record, or end if there is none.
+    """
+    while position < end:
+        newline = file_map.find(b"\n", position, end)
+        if newline < 0:
+            return end
+        if file_map[position: newline].count(b'"') % 2 == 1:
+            is_in_quotes = not is_in_quotes
+        if not is_in_quotes:
+            return newline + 1
+        position = newline + 1
+    return end
+
+def split_records(file_map, start: int, end: int, chunk_count: int) -> [tuple]:
+    """
+    Split file_map[start: end] into about chunk_count chunks of whole records.
+    Args:
+        file_map (mmap)
+        start (int): offset of the first record. It must not be inside quotes.
+        end (int)
+        chunk_count (int)
+    Returns:
+        [tuple]: (start, end) of each non-empty chunk, in file order
+    """
+    chunk_size = max((end - start) // max(chunk_count, 1), 1)
+    chunks = []
+    chunk_start = start
+    quote_count = 0 #Quotes from start up to the current position.
+    while chunk_start < end:
+        nominal_end = chunk_start + chunk_size
+        if nominal_end >= end:
+            chunks.append((chunk_start, end))
+            break
+        quote_count += _count_bytes(file_map, chunk_start, nominal_end)
+        chunk_end = _record_end(file_map, nominal_end, end, quote_count % 2 == 1)
+        chunks.append((chunk_start, chunk_end))
+        quote_count += _count_bytes(file_map, nominal_end, chunk_end)
+        chunk_start = chunk_end
+    return chunks
+
+def parse_chunk(filename: str, start: int, end: int, column_indexes: dict, encoding: str, line_offset: int = 0) -> StudentTable:
+    """
+    Parse one chunk of records into a StudentTable with its own activity ids. Runs in a worker process.
+    Args:
+        filename (str): CSV file name
+        start (int): offset of the chunk's first record
+        end (int): offset just past the chunk's last record
+        column_indexes (dict): from resolve_input_columns()
+        encoding (str): the file's text encoding
+        line_offset (int): number of lines in the file before the chunk
+    Returns:
+        StudentTable: invalid records are logged with their line in the file, and skipped.
+    """
+    with open(filename, "rb") as input_file, mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+        chunk_text = file_map[start: end].decode(encoding)
+    return StudentTable.from_rows(csv.reader(io.StringIO(chunk_text, newline="")), column_indexes, source=filename,
+                                  line_offset=line_offset)
+
+def concatenate_tables(tables: [StudentTable], activity_names: [str] = ()) -> StudentTable:
+    """
+    Concatenate the passed tables' rows into one table. Activity ids are renumbered in first-appearance order,
+    and student ids are renumbered from 1, so the result is the same as parsing the whole file at once.
+    Args:
+        tables ([StudentTable]): chunk tables, in file order
+        activity_names ([str]): activity names to intern first. See StudentTable.__init__().
+    Returns:
+        StudentTable
+    """
+    student_table = StudentTable(activity_names)
+    for table in tables:
+        student_table.extend(table)
+    return student_table
+
+def read_student_table_chunked(filename: str, activity_names: [str] = (), input_columns: dict = None,
+                               jobs: int = 1) -> StudentTable:
+    """
+    Read a StudentTable from an uncompressed CSV file, parsing chunks of it in parallel.
+    Args:
+        filename (str): CSV file name
+        activity_names ([str]): activity names to intern first, e.g. Config.get_activity_names()
+        input_columns (dict): key: input field, value: column header. Defaults to INPUT_COLUMNS.
+        jobs (int): maximum number of worker processes. With 1, the chunks are parsed in this process.
+    Returns:
+        StudentTable
+    Raises:
+        FileNotFoundError
+        ValueError: a column is missing.
+    """
+    encoding = locale.getpreferredencoding(False) #As open() in text mode.
+    with open(filename, "rb") as input_file:
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return StudentTable(activity_names)
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+            header_end = _record_end(file_map, 0, len(file_map), False)
+            header = next(csv.reader(io.StringIO(file_map[0: header_end].decode(encoding), newline="")), [])
+            column_indexes = resolve_input_columns(header, input_columns)
+            chunks = split_records(file_map, header_end, len(file_map), jobs * _CHUNKS_PER_JOB)
+            # The lines before each chunk, so skipped records are logged with their line in the file.
+            line_offsets = []
+            line_count = 0
+            position = 0
+            for start, ignored_end in chunks:
+                line_count += _count_bytes(file_map, position, start, b"\n")
+                line_offsets.append(line_count)
+                position = start
+
+    metrics = get_metrics()
+    metrics.count("input_chunks", len(chunks))
+    if jobs <= 1 or len(chunks) <= 1:
+        tables = [parse_chunk(filename, start, end, column_indexes, encoding, line_offset)
+                  for (start, end), line_offset in zip(chunks, line_offsets)]
+    else:
+        logging.info("Reading %s in %i chunks with %i jobs", filename, len(chunks), jobs)
+        with ProcessPoolExecutor(max_workers=min(jobs, len(chunks))) as executor:
+            futures = [executor.submit(parse_chunk, filename, start, end, column_indexes, encoding, line_offset)
+                       for (start, end), line_offset in zip(chunks, line_offsets)]
+            tables = [future.result() for future in futures]
+    return concatenate_tables(tables, activity_names)
@@ -1,6 +1,11 @@
 import logging
 import sys
-from datetime import datetime
+from array import array
+from collections import Counter
+from functools import lru_cache
+from itertools import compress
+from operator import not_
+from datetime import datetime, timedelta
 from json import JSONDecodeError
 import json
 
@@ -54,10 +59,375 @@ class Activity:
         numeric_cap = cap_value if type(cap_value) == int else sys.maxsize
         return numeric_cap
 
+# Days that students make choices for. The index of a day is its column in StudentTable.
+DAYS = ["monday", "tuesday", "wednesday", "thursday"]
+_DAY_INDEXES = {day: day_index for day_index, day in enumerate(DAYS)}
+_ORDINALS = ("first", "second", "third")
+# Input fields for each day's first, second and third choice, e.g. "monday_first_choice".
+_CHOICE_FIELDS = [[f"{day}_{ordinal}_choice" for ordinal in _ORDINALS] for day in DAYS]
+# Default CSV column header of every input field. The config file's "input_columns" section overrides them,
+# because the form's question text changes each term. See Config.get_input_columns().
+INPUT_COLUMNS = {"first_name": "Type your first name",
+                 "last_name": "Type your last name",
+                 "in_athletics": "I am currently participating in at least one LHS sport.",
+                 "timestamp": "Timestamp",
+                 **{f"{day}_{ordinal}_choice": f"{day.capitalize()} {ordinal.capitalize()} Choice"
+                    for day in DAYS for ordinal in _ORDINALS}}
+
+def normalize_activity_name(activity_name: str) -> str:
+    """
+    Return the passed activity name without case, leading and trailing spaces, or repeated inner spaces,
+    so "Robotics", " robotics" and "ROBOTICS " are the same activity.
+    """
+    return " ".join(activity_name.split()).casefold()
+
+def resolve_input_columns(header: [str], input_columns: dict = None) -> dict:
+    """
+    Resolve the CSV header row into the column index of every input field, once per file.
+    Args:
+        header ([str]): CSV header row. Leading and trailing spaces are ignored.
+        input_columns (dict): key: input field, value: column header. Defaults to INPUT_COLUMNS.
+    Returns:
+        dict: key: input field, value: column index
+    Raises:
+        ValueError: a column is missing from the header.
+    """
+    if input_columns is None:
+        input_columns = INPUT_COLUMNS
+    # As with csv.DictReader, the last of duplicate columns wins.
+    header_indexes = {column_header.strip(): index for index, column_header in enumerate(header)}
+    missing_columns = [column_header for column_header in input_columns.values() if column_header.strip() not in header_indexes]
+    if len(missing_columns) > 0:
+        raise ValueError("Input columns not found: " + ", ".join(missing_columns))
+    return {field: header_indexes[column_header.strip()] for field, column_header in input_columns.items()}
+
+_EPOCH = datetime(1970, 1, 1)
+
+def day_index_of(day: str) -> int:
+    """
+    Return the StudentTable day column for the passed day name (any case).
+    """
+    return _DAY_INDEXES[day.lower()]
+
+@lru_cache(maxsize=65536)
+def parse_form_timestamp(timestamp_str: str) -> float:
+    """
+    Parse a Google Forms timestamp, e.g. "10/28/2024 17:50:32", to seconds since 1970-01-01.
+    Splitting on the fixed separators is much faster than datetime.strptime(). Anything that does not split
+    cleanly falls back to strptime(), so invalid timestamps raise the same ValueError.
+    Many responses share a timestamp string, so results are cached.
+    Args:
+        timestamp_str (str): "%m/%d/%Y %H:%M:%S"
+    Returns:
+        float: seconds since 1970-01-01
+    """
+    try:
+        month, day, year_and_time = timestamp_str.split("/")
+        year, time_str = year_and_time.split(" ")
+        hour, minute, second = time_str.split(":")
+        timestamp = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second))
+    except ValueError:
+        timestamp = datetime.strptime(timestamp_str, "%m/%d/%Y %H:%M:%S")
+    return (timestamp - _EPOCH).total_seconds()
+
+class StudentTable:
+    """
+    Compact, column-oriented storage for every student of a run.
+    Each student is a row. Instead of per-student objects, the columns are parallel arrays,
+    and activity names are interned to small integer ids.
+    Use student() to get a Student view of a row.
+
+    Attributes:
+        student_ids (array): student_id per row
+        first_names ([str])
+        last_names ([str])
+        in_athletics (bytearray): 1 if the student is in athletics, otherwise 0
+        timestamps (array): Record timestamp per row, as seconds since 1970-01-01
+        choices (array): Activity id per row, day and priority. See choice_id().
+        selections (array): int8 selection priority per row and day. 0 means not yet selected.
+            Change it with set_selection(), mark_selected(), set_day_selections() or clear_selections(),
+            which keep available_rows() up to date.
+        activity_names ([str]): Activity name per activity id. Names are interned normalized (see normalize_activity_name()),
+            and an id's name is its first spelling, so config activities keep their config spelling.
+        base_weights (array): Lottery weight per row, from its timestamp. See base_weights_for().
+        base_weights_time (datetime): Reference time that base_weights were calculated from
+    """
+    def __init__(self, activity_names: [str] = ()):
+        """
+        Args:
+            activity_names ([str]): activity names to intern first, e.g. Config.get_activity_names(),
+                so config activities have the same ids in every run.
+        """
+        self.student_ids = array("l")
+        self.first_names = []
+        self.last_names = []
+        self.in_athletics = bytearray()
+        self.timestamps = array("d")
+        self.choices = array("i")
+        self.selections = array("b")
+        self.activity_names = []
+        self._activity_ids = {} #key: activity name as spelled, value: activity id
+        self._normalized_ids = {} #key: normalized activity name, value: activity id
+        self.base_weights = array("d")
+        self.base_weights_time = None
+        self._available_rows = [None] * len(DAYS) #Per day index: dict of unselected rows (an ordered set), or None until used.
+        for activity_name in activity_names:
+            self.intern_activity(activity_name)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def __getstate__(self):
+        # The available rows are rebuilt when needed, rather than sent to worker processes.
+        state = self.__dict__.copy()
+        state["_available_rows"] = [None] * len(DAYS)
+        return state
+
+    @classmethod
+    def from_records(cls, input_records: [dict], activity_names: [str] = ()):
+        """
+        Create a StudentTable from input records. The student_id is generated using enumerate().
+        Args:
+            input_records ([dict]): Records from read_input_records()
+            activity_names ([str]): activity names to intern first. See __init__().
+        Returns:
+            StudentTable
+        """
+        table = cls(activity_names)
+        for student_id, student_dict in enumerate(input_records, 1):
+            table.append(student_dict, student_id)
+        return table
+
+    @classmethod
+    def from_rows(cls, rows, column_indexes: dict, activity_names: [str] = (), source: str = "input", line_offset: int = 0):
+        """
+        Create a StudentTable from CSV rows, one row at a time, so the rows are never all in memory.
+        The student_id is the row's position, skipping blank lines.
+        A row with too few columns or an invalid Timestamp is logged with its line number and skipped,
+        so one bad response does not stop the others from being assigned.
+        Args:
+            rows: iterable of [str], e.g. a csv.reader() after the header row. A csv.reader's line numbers are logged.
+            column_indexes (dict): from resolve_input_columns()
+            activity_names ([str]): activity names to intern first. See __init__().
+            source (str): what the rows are from, e.g. the file name, for the log
+            line_offset (int): number of file lines before the rows' first line, added to the logged line numbers
+        Returns:
+            StudentTable
+        """
+        table = cls(activity_names)
+        first_name_index = column_indexes["first_name"]
+        last_name_index = column_indexes["last_name"]
+        in_athletics_index = column_indexes["in_athletics"]
+        timestamp_index = column_indexes["timestamp"]
+        choice_indexes = [column_indexes[choice_field] for day_choice_fields in _CHOICE_FIELDS for choice_field in day_choice_fields]
+        column_count = max(column_indexes.values()) + 1
+        day_selections = bytes(len(DAYS))
+        intern_activity = table.intern_activity
+        for row in rows:
+            try:
+                if len(row) < column_count:
+                    if len(row) == 0:
+                        continue #Blank line, which csv.DictReader skipped too.
+                    raise ValueError(f"{len(row)} columns, {column_count} expected")
+                timestamp = parse_form_timestamp(row[timestamp_index]) #Before anything is added, as it may raise.
+            except ValueError as exception:
+                line = f"line {line_offset + rows.line_num}" if hasattr(rows, "line_num") else f"record {len(table) + 1}"
+                logging.error(f"Skipping {source} {line}: {exception}")
+                continue
+            table.student_ids.append(len(table) + 1)
+            table.first_names.append(row[first_name_index])
+            table.last_names.append(row[last_name_index])
+            table.in_athletics.append(1 if row[in_athletics_index] == "Yes" else 0)
+            table.timestamps.append(timestamp)
+            table.choices.extend([intern_activity(row[choice_index]) for choice_index in choice_indexes])
+            table.selections.extend(day_selections)
+        return table
+
+    def append(self, student_dict: dict, student_id: int) -> int:
+        """
+        Add a student from an input record.
+        Args:
+            student_dict (dict): input record, keyed by the INPUT_COLUMNS headers
+            student_id (int)
+        Returns:
+            int: row of the added student
+        """
+        row = len(self.student_ids)
+        self.student_ids.append(student_id)
+        self.first_names.append(student_dict[INPUT_COLUMNS["first_name"]])
+        self.last_names.append(student_dict[INPUT_COLUMNS["last_name"]])
+        self.in_athletics.append(1 if student_dict[INPUT_COLUMNS["in_athletics"]] == "Yes" else 0)
+        self.timestamps.append(parse_form_timestamp(student_dict[INPUT_COLUMNS["timestamp"]]))
+        for choice_fields in _CHOICE_FIELDS:
+            for choice_field in choice_fields:
+                self.choices.append(self.intern_activity(student_dict[INPUT_COLUMNS[choice_field]]))
+        self.selections.extend(bytes(len(DAYS)))
+        self._available_rows = [None] * len(DAYS)
+        return row
+
+    def extend(self, other):
+        """
+        Append the rows of another StudentTable to this one, renumbering their activity ids to this table's ids.
+        Student ids continue from this table's last row.
+        Args:
+            other (StudentTable)
+        """
+        activity_ids = [self.intern_activity(activity_name) for activity_name in other.activity_names]
+        if activity_ids == list(range(len(activity_ids))):
+            self.choices.extend(other.choices)
+        else:
+            self.choices.extend(array(self.choices.typecode, map(activity_ids.__getitem__, other.choices)))
+        self.student_ids.extend(range(len(self) + 1, len(self) + len(other) + 1))
+        self.first_names.extend(other.first_names)
+        self.last_names.extend(other.last_names)
+        self.in_athletics.extend(other.in_athletics)
+        self.timestamps.extend(other.timestamps)
+        self.selections.extend(other.selections)
+        self._available_rows = [None] * len(DAYS)
+
+    def compute_base_weights(self, reference_time: datetime):
+        """
+        Calculate every student's base lottery weight: the reciprocal of the seconds between their timestamp
+        and reference_time, plus 1, as in random_select._calculate_weight_using_timestamp().
+        The difference is calculated in whole microseconds, like datetime subtraction, so the weights are identical.
+        Args:
+            reference_time (datetime)
+        """
+        reference_microseconds = (reference_time - _EPOCH) // timedelta(microseconds=1)
+        # A new array, so buffers exported from the old one (e.g. NumPy views) stay valid.
+        self.base_weights = array("d", [max(1 / ((reference_microseconds - timestamp * 1e6) / 1e6 + 1), 0)
+                                        for timestamp in self.timestamps])
+        self.base_weights_time = reference_time
+
+    def base_weights_for(self, reference_time: datetime) -> array:
+        """
+        Return base_weights for the passed reference time, calculating them first if needed.
+        """
+        if self.base_weights_time != reference_time or len(self.base_weights) != len(self.student_ids):
+            self.compute_base_weights(reference_time)
+        return self.base_weights
+
+    def intern_activity(self, activity_name: str) -> int:
+        """
+        Return the id for the passed activity name, assigning a new id if its normalized name has none yet.
+        """
+        activity_id = self._activity_ids.get(activity_name)
+        if activity_id is None:
+            normalized_name = normalize_activity_name(activity_name)
+            activity_id = self._normalized_ids.get(normalized_name)
+            if activity_id is None:
+                activity_id = len(self.activity_names)
+                self._normalized_ids[normalized_name] = activity_id
+                self.activity_names.append(activity_name)
+            self._activity_ids[activity_name] = activity_id
+        return activity_id
+
+    def activity_id(self, activity_name: str) -> int:
+        """
+        Return the id for the passed activity name, in any spelling, or -1 if no student chose it.
+        """
+        activity_id = self._activity_ids.get(activity_name)
+        if activity_id is None:
+            activity_id = self._normalized_ids.get(normalize_activity_name(activity_name), -1)
+        return activity_id
+
+    def unmatched_choices(self, activity_names: [str]) -> dict:
+        """
+        Count the choices of activities that are not in activity_names, in one pass over every choice.
+        Args:
+            activity_names ([str]): known activity names, e.g. Config.get_activity_names()
+        Returns:
+            dict: key: activity name as first spelled, value: number of choices
+        """
+        known_ids = {self.activity_id(activity_name) for activity_name in activity_names}
+        choice_counts = Counter(self.choices)
+        return {self.activity_names[activity_id]: count for activity_id, count in sorted(choice_counts.items())
+                if activity_id not in known_ids}
+
+    def choice_id(self, row: int, day_index: int, priority: int) -> int:
+        """
+        Return the activity id the student at row chose for the day at the priority (1 - 3).
+        """
+        return self.choices[(row * len(DAYS) + day_index) * 3 + priority - 1]
+
+    def selection(self, row: int, day_index: int) -> int:
+        """
+        Return the priority at which the student at row was selected for the day, or 0 if not yet selected.
+        """
+        return self.selections[row * len(DAYS) + day_index]
+
+    def display_names(self) -> [str]:
+        """
+        Return the "first last" display name of every row, for the output files.
+        """
+        return [first_name + " " + last_name for first_name, last_name in zip(self.first_names, self.last_names)]
+
+    def available_rows(self, day_index: int):
+        """
+        Return the rows of the students not yet selected for the day, in row order.
+        The rows are found once per day, then kept up to date as students are selected,
+        so this costs O(remaining students) rather than O(all students).
+        Returns:
+            dict keys view: supports len(), iteration and "in". Copy it before selecting students while iterating it.
+        """
+        rows = self._available_rows[day_index]
+        if rows is None:
+            day_selections = self.selections[day_index::len(DAYS)]
+            rows = self._available_rows[day_index] = dict.fromkeys(compress(range(len(day_selections)), map(not_, day_selections)))
+        return rows.keys()
+
+    def set_selection(self, row: int, day_index: int, priority: int):
+        self.selections[row * len(DAYS) + day_index] = priority
+        rows = self._available_rows[day_index]
+        if rows is not None:
+            if priority == 0:
+                self._available_rows[day_index] = None #Rebuilt in row order when next used.
+            else:
+                rows.pop(row, None)
+
+    def mark_selected(self, rows, day_index: int, priority: int):
+        """
+        Set the selection priority (1 - 3) of the passed rows for the day.
+        """
+        selections = self.selections
+        available_rows = self._available_rows[day_index]
+        for row in rows:
+            selections[row * len(DAYS) + day_index] = priority
+            if available_rows is not None:
+                available_rows.pop(row, None)
+
+    def set_day_selections(self, day_index: int, day_selections: array):
+        """
+        Replace the selection priority of every row for the day, e.g. with a worker process's results.
+        """
+        self.selections[day_index::len(DAYS)] = day_selections
+        self._available_rows[day_index] = None
+
+    def clear_selections(self):
+        """
+        Unselect every student for every day.
+        """
+        self.selections = array("b", bytes(len(self.selections)))
+        self._available_rows = [None] * len(DAYS)
+
+    def student(self, row: int):
+        """
+        Return a Student view of the passed row.
+        """
+        return Student.view(self, row)
+
+    def students(self) -> list:
+        """
+        Return a Student view for every row, in row order.
+        """
+        return [Student.view(self, row) for row in range(len(self))]
+
 class Student:
     """
-    Student.
+    Student. A thin view of one row of a StudentTable.
+    Creating a Student from an input record creates a single-row StudentTable for it.
     Attributes:
+        student_id (int)
         timestamp (datetime): Time record was created
         first_name (str)
         last_name (str)
@@ -66,45 +436,203 @@ class Student:
         tuesday_choices ([Choice]): List of 3 choices
         wednesday_choices ([Choice]): List of 3 choices
         thursday_choices ([Choice]): List of 3 choices
+        day_selections (dict): Selection priority by day. This is a copy; use set_selection_priority_for_day() to change it.
     """
+    __slots__ = ("table", "row")
+
     def __init__(self, student_dict: dict, student_id: int):
-        self.student_id = student_id
-        self.first_name = student_dict["Type your first name"]
-        self.last_name = student_dict["Type your last name"]
-        self.in_athletics = True if student_dict["I am currently participating in at least one LHS sport."] == "Yes" else False
-        self.monday_choices =   [Choice(student_dict["Monday First Choice"], 1),
-                                 Choice(student_dict["Monday Second Choice"], 2),
-                                 Choice(student_dict["Monday Third Choice"], 3)]
-        self.tuesday_choices =  [Choice(student_dict["Tuesday First Choice"], 1),
-                                 Choice(student_dict["Tuesday Second Choice"], 2),
-                                 Choice(student_dict["Tuesday Third Choice"], 3),]
-        self.wednesday_choices =[Choice(student_dict["Wednesday First Choice"], 1),
-                                 Choice(student_dict["Wednesday Second Choice"], 2),
-                                 Choice(student_dict["Wednesday Third Choice"], 3),]
-        self.thursday_choices = [Choice(student_dict["Thursday First Choice"], 1),
-                                 Choice(student_dict["Thursday Second Choice"], 2),
-                                 Choice(student_dict["Thursday Third Choice"], 3),]
-        self.day_selections = {"monday" : 0, "tuesday" : 0, "wednesday" : 0, "thursday" : 0}
-        self.timestamp = datetime.strptime(student_dict["Timestamp"], "%m/%d/%Y %H:%M:%S")
+        self.table = StudentTable()
+        self.row = self.table.append(student_dict, student_id)
+
+    @classmethod
+    def view(cls, table: StudentTable, row: int):
+        """
+        Return a Student for the passed row of the passed table.
+        """
+        student = cls.__new__(cls)
+        student.table = table
+        student.row = row
+        return student
+
+    def __eq__(self, other):
+        return isinstance(other, Student) and self.table is other.table and self.row == other.row
+
+    def __hash__(self):
+        return hash((id(self.table), self.row))
 
     def __str__(self):
         day_selections = ""
-        keys = self.day_selections.keys()
-        for key in keys:
-            day_selections += f" day: {key}, priority: {self.day_selections[key]}"
+        for key, value in self.day_selections.items():
+            day_selections += f" day: {key}, priority: {value}"
         return f"name: {self.first_name} {self.last_name}, in athletics? {self.in_athletics} {day_selections}"
 
+    @property
+    def student_id(self) -> int:
+        return self.table.student_ids[self.row]
+
+    @property
+    def first_name(self) -> str:
+        return self.table.first_names[self.row]
+
+    @property
+    def last_name(self) -> str:
+        return self.table.last_names[self.row]
+
+    @property
+    def in_athletics(self) -> bool:
+        return self.table.in_athletics[self.row] == 1
+
+    @property
+    def timestamp(self) -> datetime:
+        return _EPOCH + timedelta(seconds=self.table.timestamps[self.row])
+
+    @property
+    def monday_choices(self):
+        return self.choices_for_day("monday")
+
+    @property
+    def tuesday_choices(self):
+        return self.choices_for_day("tuesday")
+
+    @property
+    def wednesday_choices(self):
+        return self.choices_for_day("wednesday")
+
+    @property
+    def thursday_choices(self):
+        return self.choices_for_day("thursday")
+
+    @property
+    def day_selections(self) -> dict:
+        return {day: self.table.selection(self.row, day_index) for day_index, day in enumerate(DAYS)}
+
+    def choices_for_day(self, day: str):
+        """
+        Return the student's 3 choices for the passed day.
+        Returns: [Choice]
+        """
+        day_index = day_index_of(day)
+        activity_names = self.table.activity_names
+        return [Choice(activity_names[self.table.choice_id(self.row, day_index, priority)], priority)
+                for priority in range(1, 4)]
+
     def set_selection_priority_for_day(self, priority, day: str):
         """
         Mark at which priority the passed day was selected.
         """
-        self.day_selections[day.lower()] = priority
+        self.table.set_selection(self.row, day_index_of(day), priority)
 
     def is_available_for_day(self, day: str):
         """
         Return True if the student has not yet been selected for the passed day.
         """
-        return True if self.day_selections[day.lower()] == 0 else False
+        return self.table.selection(self.row, day_index_of(day)) == 0
+
+class ChoiceIndex:
+    """
+    Index of still-available students keyed by (day, priority, activity id).
+    The index is built in one pass over a StudentTable. As students are selected for a day,
+    remove_student_for_day() drops them from that day's entries, so a lookup returns exactly
+    the students that students_with_activity_choice() would find by scanning, in the same order.
+    """
+    def __init__(self, table: StudentTable, day_indexes: [int] = None, rows=None):
+        """
+        Args:
+            table (StudentTable): students to index.
+            day_indexes ([int]): days to index. Defaults to all DAYS.
+            rows: rows to index, in ascending order. Defaults to every row.
+        """
+        self._table = table
+        self._index = {} #key: (day index, priority, activity id), value: dict of rows (used as an ordered set)
+        if day_indexes is None:
+            day_indexes = range(len(DAYS))
+        # This runs for every student and day, so the StudentTable columns are read directly.
+        choices = table.choices
+        selections = table.selections
+        for row in (range(len(table)) if rows is None else rows):
+            for day_index in day_indexes:
+                selection_index = row * len(DAYS) + day_index
+                if selections[selection_index] == 0:
+                    for priority in range(1, 4):
+                        key = (day_index, priority, choices[selection_index * 3 + priority - 1])
+                        key_rows = self._index.get(key)
+                        if key_rows is None:
+                            key_rows = self._index[key] = {}
+                        key_rows[row] = None
+
+    def students_with_activity_choice(self, activity, day: str, priority: int) -> [Student]:
+        """
+        Return the still-available students who chose the passed activity for the passed day at the passed priority.
+        Args:
+            activity (Activity): activity to be considered.
+            day (str): day to be considered.
+            priority (int): priority to be considered.
+        Returns:
+            [Student]: Students in their original order.
+        """
+        rows = self._index.get((day_index_of(day), priority, self._table.activity_id(activity.name)), ())
+        return [self._table.student(row) for row in rows]
+
+    def remove_student_for_day(self, student: Student, day: str):
+        """
+        Remove the passed student from every entry for the passed day.
+        """
+        self.remove_row_for_day(student.row, day_index_of(day))
+
+    def remove_row_for_day(self, row: int, day_index: int):
+        """
+        Remove the student at the passed row from every entry for the passed day index.
+        """
+        choice_offset = (row * len(DAYS) + day_index) * 3
+        for priority in range(1, 4):
+            rows = self._index.get((day_index, priority, self._table.choices[choice_offset + priority - 1]))
+            if rows is not None:
+                rows.pop(row, None)
+
+class AssignmentResult:
+    """
+    The outcome of assigning every sheet: each sheet's activities with their assigned students,
+    and the students still unassigned for each day, for the output files, the UI and reports.
+    Attributes:
+        sheet_recs ([SheetRec]): assigned sheets
+        student_table (StudentTable): all students, with their selections
+    """
+    def __init__(self, sheet_recs: [SheetRec], student_table: StudentTable):
+        self.sheet_recs = sheet_recs
+        self.student_table = student_table
+
+    @property
+    def days(self) -> [str]:
+        """
+        Returns: [str]: the day of every sheet, in config order.
+        """
+        return [sheet_rec.day for sheet_rec in self.sheet_recs]
+
+    def sheet_rec(self, day: str) -> SheetRec:
+        """
+        Returns: SheetRec: the sheet for the passed day (any case), or None if there is none.
+        """
+        day_index = day_index_of(day)
+        return next((sheet_rec for sheet_rec in self.sheet_recs if day_index_of(sheet_rec.day) == day_index), None)
+
+    def unassigned_rows(self, day: str):
+        """
+        Returns: the StudentTable rows of the students not assigned an activity for the passed day, in row order.
+            See StudentTable.available_rows().
+        """
+        return self.student_table.available_rows(day_index_of(day))
+
+    def unassigned_count(self, day: str) -> int:
+        return len(self.unassigned_rows(day))
+
+    def unassigned_students(self, day: str) -> [Student]:
+        """
+        Returns: [Student]: the students not assigned an activity for the passed day, in their original order.
+        """
+        return [self.student_table.student(row) for row in self.unassigned_rows(day)]
+
+    def is_assigned(self, student: Student, day: str) -> bool:
+        return not student.is_available_for_day(day)
 
 class Choice:
     '''
@@ -113,6 +641,8 @@ class Choice:
         name (str): Choice's activity name
         priority (int): Priority of choice
     '''
+    __slots__ = ("name", "priority")
+
     def __init__(self, name: str, priority: int):
         self.name = name
         self.priority = priority
@@ -161,6 +691,8 @@ class Config:
     """
     Exposes configurable items.
     This class is a singleton. Use Config.get_instance() to get the single instance.
+    Assignment runs read their settings from a RunContext (see run_context.py) instead. RunContext.from_config()
+    takes a snapshot of this instance, so runs that do not pass a RunContext use its settings.
     """
     _instance = None
     _is_initialize_allowed = False
@@ -179,7 +711,18 @@ class Config:
         self.config_json_name: str = ""
         self.project_root: str = ""
         self.json_data: dict = {}
-        self.weight_factor_dict = None
+        self.compiled_config = None #CompiledConfig of json_data, set by load_config_with().
+        self.engine: str = Config.engine_python
+        self.jobs: int = 1
+        self.seed = None #int, or None for a new seed every run.
+        self.reference_time = None #datetime, or None for the current time.
+        self.metrics_file_name = None #str, or None when metrics are disabled.
+        self.trace_file_name = None #str, or None when the lottery trace is disabled.
+        self.debug = False
+        self.no_cache = False
+        self.incremental = False
+        self.store_file_name = None #str, or None when runs are not stored.
+        self.term = None #str, or None for run_store.default_term().
         self._cmd_line_args_parsed = False
 
     @staticmethod
@@ -199,11 +742,38 @@ class Config:
         logging.info(Config.input_file_name + ":" + self.input_file_name)
         logging.info(Config.output_dir_name + ":" + self.output_dir_name)
         logging.info(Config.config_filename + ":" + self.config_json_name)
+        logging.info(Config.engine + ":" + self.engine)
+        logging.info(Config.jobs + ":" + str(self.jobs))
+        logging.info(Config.seed + ":" + str(self.seed))
+        logging.info(Config.reference_time + ":" + str(self.reference_time))
+        logging.info(Config.metrics_file_name + ":" + str(self.metrics_file_name))
+        logging.info(Config.trace_file_name + ":" + str(self.trace_file_name))
+        logging.info(Config.debug + ":" + str(self.debug))
+        logging.info(Config.no_cache + ":" + str(self.no_cache))
+        logging.info(Config.incremental + ":" + str(self.incremental))
+        logging.info(Config.store_file_name + ":" + str(self.store_file_name))
+        logging.info(Config.term + ":" + str(self.term))
 
     # Dictionary keys for parse_cmd_line_args().
     input_file_name = "input_file"
     output_dir_name = "output_dir"
     config_filename = "c"
+    engine = "engine"
+    jobs = "jobs"
+    seed = "seed"
+    reference_time = "reference_time"
+    metrics_file_name = "metrics"
+    trace_file_name = "trace"
+    debug = "debug"
+    no_cache = "no_cache"
+    incremental = "incremental"
+    store_file_name = "store"
+    term = "term"
+    # Assignment engines for the --engine option.
+    engine_python = "python"
+    engine_numpy = "numpy"
+    engine_optimal = "optimal"
+    engines = [engine_python, engine_numpy, engine_optimal]
     def parse_cmd_line_args(self):
         import argparse
         from innovation_lab_assignments.functions import prepend_project_root_if_required
@@ -218,15 +788,73 @@ class Config:
         arg_parser.add_argument("-" + Config.config_filename, help="Configuration file. Defaults to daily_activities_config.json.",
                                 default="daily_activities_config.json",
                                 metavar="JSON file")
+        arg_parser.add_argument("--" + Config.engine, choices=Config.engines,
+                                default=Config.engine_python,
+                                help="Assignment engine. python and numpy fill priority rounds by lottery; the numpy engine requires NumPy. "
+                                     "optimal solves each day as a min-cost flow, to minimize manual assignments. Defaults to python.")
+        arg_parser.add_argument("--" + Config.jobs, type=int, default=1, metavar="N",
+                                help="Number of worker processes. Each sheet (day) is assigned in its own process, and input files of 64 MB or more are parsed in chunks. Defaults to 1.")
+        arg_parser.add_argument("--" + Config.seed, type=int, default=None, metavar="N",
+                                help="Lottery seed. Use the seed logged by an earlier run to reproduce it. Defaults to a new seed.")
+        arg_parser.add_argument("--" + Config.reference_time.replace("_", "-"), type=Config._parse_reference_time,
+                                default=None, metavar="TIME", dest=Config.reference_time,
+                                help="Time that timestamp weights are calculated from, as MM/DD/YYYY HH:MM:SS or ISO 8601. Defaults to now.")
+        arg_parser.add_argument("--" + Config.metrics_file_name, default=None, metavar="FILE",
+                                help="Write phase timings and counts to FILE: Prometheus text format if FILE ends in .prom or .txt, otherwise JSON.")
+        arg_parser.add_argument("--" + Config.trace_file_name, default=None, metavar="FILE",
+                                help="Record every lottery decision in the binary trace FILE. "
+                                     "Query it with: python -m innovation_lab_assignments.lottery_trace FILE --student NAME")
+        arg_parser.add_argument("--" + Config.debug, action="store_true",
+                                help="Log at DEBUG level, including the students still unselected after every round.")
+        arg_parser.add_argument("--" + Config.no_cache.replace("_", "-"), action="store_true", dest=Config.no_cache,
+                                help="Always parse the input file, without reading or adding to the parsed input cache.")
+        arg_parser.add_argument("--" + Config.incremental, action="store_true",
+                                help="Only assign students whose responses are newer than the output directory's checkpoint, "
+                                     "into the remaining seats. Earlier students keep their assignments.")
+        arg_parser.add_argument("--" + Config.store_file_name, default=None, metavar="FILE",
+                                help="Add the run's students, choices and assignments to the SQLite store FILE, "
+                                     "and read earlier terms' outcomes from it for the config's history_weighting.")
+        arg_parser.add_argument("--" + Config.term, default=None, metavar="NAME",
+                                help="Term that the run assigns, in the store. Defaults to the reference time's year and month, e.g. 2024-11.")
         args_namespace = arg_parser.parse_args()
         args_dict = vars(args_namespace) #Convert to dict
         self.input_file_name = args_dict[Config.input_file_name]
         self.output_dir_name = args_dict[Config.output_dir_name]
         self.config_json_name = prepend_project_root_if_required(args_dict[Config.config_filename], self.project_root)
+        self.engine = args_dict[Config.engine]
+        self.jobs = args_dict[Config.jobs]
+        self.seed = args_dict[Config.seed]
+        self.reference_time = args_dict[Config.reference_time]
+        self.metrics_file_name = args_dict[Config.metrics_file_name]
+        self.trace_file_name = args_dict[Config.trace_file_name]
+        self.debug = args_dict[Config.debug]
+        self.no_cache = args_dict[Config.no_cache]
+        self.incremental = args_dict[Config.incremental]
+        self.store_file_name = args_dict[Config.store_file_name]
+        self.term = args_dict[Config.term]
 
         self._cmd_line_args_parsed = True
         self._log_me()
 
+    @staticmethod
+    def _parse_reference_time(time_str: str) -> datetime:
+        """
+        argparse type for --reference-time. Accepts the form's Timestamp format, or ISO 8601.
+        Form timestamps are naive local times, so an ISO 8601 time with an offset is converted to naive local time.
+        """
+        import argparse
+        try:
+            return datetime.strptime(time_str, "%m/%d/%Y %H:%M:%S")
+        except ValueError:
+            pass
+        try:
+            reference_time = datetime.fromisoformat(time_str)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid time: '{time_str}'")
+        if reference_time.tzinfo is not None:
+            reference_time = reference_time.astimezone().replace(tzinfo=None)
+        return reference_time
+
     def load_config(self):
         """
         Call load_config_with() self.config_json_name (set during parse_cmd_line_args()).
@@ -244,11 +872,15 @@ class Config:
         Args:
             filename (str)
         """
+        from innovation_lab_assignments.config_cache import load_compiled_config
         self.config_json_name = filename #Just in case
+        self.compiled_config = None
+        self.json_data = {} #Not the previous file's, if this one fails to load.
 
         try:
-            with open(filename) as input_file:
-                self.json_data = json.load(input_file)
+            # The compiled config is cached, so unchanged files are not parsed again.
+            self.compiled_config = load_compiled_config(filename)
+            self.json_data = self.compiled_config.json_data
         except FileNotFoundError:
             logging.error("JSON config file with filename " + filename + " not found")
         except JSONDecodeError:
@@ -265,23 +897,28 @@ class Config:
         except JSONDecodeError:
             pass
 
-    def get_weight_factor(self, activity_name) -> float:
+    def get_weight_rules(self):
         """
-        Return weight factor for the passed activity_name.
-        The weight factors are found in json_data, loaded by load_config().
-        Args:
-            activity_name (str)
+        Return the compiled weight rules of json_data.
         Returns:
-            float: weight factor
+            WeightRules
+        """
+        return self._get_compiled_config().weight_rules
+
+    def get_history_multiplier(self) -> float:
         """
-        # Lazy-load weight_factor_dict.
-        if self.weight_factor_dict is None:
-            weight_factor_dict_list = self.json_data.get("activity_weight_factors")
-            #                                       Normalize activity key to lower case.
-            self.weight_factor_dict = {weight_factor_dict["activity"].lower() : weight_factor_dict["weight_factor"]
-                                       for weight_factor_dict in weight_factor_dict_list}
+        Returns: float: the lottery weight multiplier per earlier loss of json_data's "history_weighting",
+            or None without history weighting. See run_store.py.
+        """
+        return self._get_compiled_config().history_multiplier
 
-        return self.weight_factor_dict.get(activity_name)
+    def get_input_columns(self) -> dict:
+        """
+        Return the CSV column header of every input field: INPUT_COLUMNS, overridden by json_data's "input_columns".
+        Returns:
+            dict: key: input field, value: column header
+        """
+        return self._get_compiled_config().input_columns
 
     def get_sheets(self) -> dict:
         """
@@ -289,10 +926,34 @@ class Config:
         """
         return self.json_data.get("sheets")
 
+    def get_sheet_recs(self) -> [SheetRec]:
+        """
+        Returns: [SheetRec]: a new SheetRec for every sheet in json_data.
+        """
+        return self._get_compiled_config().sheet_recs()
+
+    def get_activity_names(self) -> [str]:
+        """
+        Returns: [str]: every activity name of every sheet, once each, in config order.
+        """
+        return self._get_compiled_config().activity_names
+
+    def _get_compiled_config(self):
+        """
+        Return the CompiledConfig of json_data, compiling it first if json_data was set or changed since.
+        Returns:
+            CompiledConfig
+        """
+        from innovation_lab_assignments.config_cache import CompiledConfig
+        if self.compiled_config is None or self.compiled_config.json_data is not self.json_data:
+            self.compiled_config = CompiledConfig(self.json_data)
+        return self.compiled_config
+
     def set_sheets(self, sheets_dict: dict):
         """
         Replaces the sheets part of the json_data with the passed sheets_dict.
         Args:
             sheets_dict (dict)
         """
-        self.json_data["sheets"] = sheets_dict
\ No newline at end of file
+        self.json_data["sheets"] = sheets_dict
+        self.compiled_config = None #Compiled from the old sheets.
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""
+Compiled config cache.
+A config file is compiled once into a CompiledConfig: its JSON data, normalized sheets with integer caps,
+its activity names (interned in config order), its input columns, its compiled weight rules, and its history weighting. The CompiledConfig is pickled to
+the configs directory of the user cache directory (see input_cache.user_cache_dir()), so later loads take a single read,
+and config directories are never written to.
+
+The cache is keyed on the config file's absolute path, mtime and size. If the mtime or size changed,
+the content hash decides: a touched but unchanged file reuses the cache, and any edit recompiles it.
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from innovation_lab_assignments.classes import SheetRec, INPUT_COLUMNS, normalize_activity_name
+from innovation_lab_assignments.input_cache import user_cache_dir
+from innovation_lab_assignments.weight_rules import compile_weight_rules
+
+_CACHE_VERSION = 6 #Increment when CompiledConfig changes, to ignore older cache files.
+
+class CompiledConfig:
+    """
+    A config file, compiled for fast loading.
+    Attributes:
+        json_data (dict): config file contents
+        sheets ([tuple]): (day, [(activity name, int cap)]) per sheet
+        activity_names ([str]): every activity name of every sheet, once each (by normalized name), in config order
+        input_columns (dict): key: input field, value: CSV column header. See classes.INPUT_COLUMNS.
+        weight_rules (WeightRules)
+        history_multiplier (float): "history_weighting" multiply_per_loss, or None without history weighting. See run_store.py.
+    """
+    def __init__(self, json_data: dict):
+        self.json_data = json_data
+        self.sheets = []
+        self.activity_names = []
+        normalized_names = set()
+        for sheet_dict in json_data.get("sheets", []):
+            sheet_rec = SheetRec(sheet_dict["sheet"])
+            self.sheets.append((sheet_rec.day, [(activity.name, activity.cap) for activity in sheet_rec.activities]))
+            for activity in sheet_rec.activities:
+                normalized_name = normalize_activity_name(activity.name)
+                if normalized_name not in normalized_names:
+                    normalized_names.add(normalized_name)
+                    self.activity_names.append(activity.name)
+        self.input_columns = _compile_input_columns(json_data)
+        self.weight_rules = compile_weight_rules(json_data)
+        self.history_multiplier = _compile_history_multiplier(json_data)
+
+    def sheet_recs(self) -> [SheetRec]:
+        """
+        Returns: [SheetRec]: new SheetRecs, without students, for every sheet.
+        """
+        return [SheetRec({"day": day, "activities": [{"activity": name, "cap": cap} for name, cap in activities]})
+                for day, activities in self.sheets]
+
+def _compile_input_columns(json_data: dict) -> dict:
+    """
+    Returns: dict: INPUT_COLUMNS, overridden by the config's "input_columns" section. Unknown fields are logged and skipped.
+    """
+    input_columns = dict(INPUT_COLUMNS)
+    for field, column_header in json_data.get("input_columns", {}).items():
+        if field not in INPUT_COLUMNS:
+            logging.error(f"Unknown input column field {field}. Known fields: {', '.join(INPUT_COLUMNS)}.")
+            continue
+        input_columns[field] = column_header
+    return input_columns
+
+def _compile_history_multiplier(json_data: dict) -> float:
+    """
+    Returns: float: the config's "history_weighting" multiply_per_loss, or None if there is none, or it is invalid.
+    """
+    history_weighting = json_data.get("history_weighting")
+    if history_weighting is None:
+        return None
+    multiply_per_loss = history_weighting.get("multiply_per_loss") if isinstance(history_weighting, dict) else None
+    if not isinstance(multiply_per_loss, (int, float)) or isinstance(multiply_per_loss, bool) or multiply_per_loss <= 0:
+        logging.error(f"history_weighting {history_weighting} needs a positive numeric multiply_per_loss.")
+        return None
+    return multiply_per_loss
+
+def default_cache_dir() -> str:
+    """
+    Returns: str: the configs directory of input_cache.user_cache_dir()
+    """
+    return os.path.join(user_cache_dir(), "configs")
+
+def cache_file_name(filename: str, cache_dir: str = None) -> str:
+    """
+    Return the compiled cache file name of the passed config file name: its base name and a hash of its absolute path.
+    Args:
+        filename (str): config JSON file name
+        cache_dir (str): Defaults to default_cache_dir()
+    """
+    path = os.path.abspath(filename)
+    path_hash = hashlib.sha256(path.encode("utf-8", "surrogateescape")).hexdigest()[:16]
+    return os.path.join(cache_dir if cache_dir is not None else default_cache_dir(), f"{os.path.basename(path)}-{path_hash}.compiled")
+
+def _read_cache(cache_name: str):
+    """
+    Returns: dict: the cache file's contents, or None if it is missing, unreadable or from another version.
+    """
+    try:
+        with open(cache_name, "rb") as cache_file:
+            cache = pickle.load(cache_file)
+    except FileNotFoundError:
+        return None
+    except Exception as exception: #A corrupt or outdated cache is recompiled, never fatal.
+        logging.debug(f"Ignoring config cache {cache_name}: {exception}")
+        return None
+    return cache if isinstance(cache, dict) and cache.get("version") == _CACHE_VERSION else None
+
+def _write_cache(cache_name: str, cache: dict):
+    """
+    Write the cache file atomically. Failing to write it (e.g. a read-only directory) is not an error.
+    """
+    try:
+        os.makedirs(os.path.dirname(cache_name), exist_ok=True)
+        file_descriptor, temp_name = tempfile.mkstemp(dir=os.path.dirname(cache_name), suffix=".tmp")
+        try:
+            with os.fdopen(file_descriptor, "wb") as cache_file:
+                pickle.dump(cache, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_name, cache_name)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+    except OSError as exception:
+        logging.debug(f"Unable to write config cache {cache_name}: {exception}")
+
+def load_compiled_config(filename: str, cache_dir: str = None) -> CompiledConfig:
+    """
+    Load the passed config file, using its compiled cache when it is still valid.
+    Args:
+        filename (str): config JSON file name
+        cache_dir (str): Defaults to default_cache_dir()
+    Returns:
+        CompiledConfig
+    Raises:
+        FileNotFoundError: the config file does not exist.
+        JSONDecodeError: the config file contains invalid JSON.
+    """
+    stat = os.stat(filename)
+    cache_name = cache_file_name(filename, cache_dir)
+    cache = _read_cache(cache_name)
+    path = os.path.abspath(filename)
+    if cache is not None and cache["path"] == path and cache["mtime_ns"] == stat.st_mtime_ns and cache["size"] == stat.st_size:
+        return cache["compiled_config"]
+
+    with open(filename, "rb") as input_file:
+        content = input_file.read()
+    content_hash = hashlib.sha256(content).hexdigest()
+    if cache is not None and cache["path"] == path and cache["hash"] == content_hash:
+        compiled_config = cache["compiled_config"] #Touched, but unchanged.
+    else:
+        compiled_config = CompiledConfig(json.loads(content))
+    _write_cache(cache_name, {"version": _CACHE_VERSION, "path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                              "hash": content_hash, "compiled_config": compiled_config})
+    return compiled_config
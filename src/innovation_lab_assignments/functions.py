@@ -1,11 +1,45 @@
 import csv
+import gzip
+import os
+import random
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import zip_longest
 from pathlib import PurePath
 from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.metrics import get_metrics
+from innovation_lab_assignments.lottery_trace import get_trace, enable_trace, disable_trace, OUTCOME_LOST, OUTCOME_WON, OUTCOME_NO_LOTTERY, OUTCOME_FULL
 import logging
 
+_GZIP_MAGIC = b"\x1f\x8b"
+
+def open_input(filename: str):
+    """
+    Open a CSV input file for reading, decompressing it if it is gzip-compressed (by content, not by name).
+    Args:
+        filename (str): CSV file name, or gzip-compressed CSV file name
+    Returns:
+        text file, opened with newline="" for csv
+    Raises:
+        FileNotFoundError
+    """
+    if is_gzip_file(filename):
+        return gzip.open(filename, "rt", newline="")
+    return open(filename, "r", newline="")
+
+def is_gzip_file(filename: str) -> bool:
+    """
+    Returns: bool: True if the passed file starts with the gzip magic bytes.
+    Raises:
+        FileNotFoundError
+    """
+    with open(filename, "rb") as input_file:
+        return input_file.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC
+
 def read_input_records(filename) ->[dict]:
     """
     Read input records from a CSV file.
+    Prefer read_student_table(), which does not keep every record in memory.
     Args:
         filename (str): CSV file name
     Returns: [dict]
@@ -13,7 +47,7 @@ def read_input_records(filename) ->[dict]:
     input_records = []
 
     try:
-        with open(filename, "r") as input_file:
+        with open_input(filename) as input_file:
             csv_reader = csv.DictReader(input_file)
             if csv_reader.fieldnames is not None:
                 stripped_fieldnames = []
@@ -28,6 +62,38 @@ def read_input_records(filename) ->[dict]:
 
     return input_records
 
+def read_student_table(filename: str, activity_names: [str] = (), input_columns: dict = None, jobs: int = 1) -> StudentTable:
+    """
+    Read a StudentTable from a CSV file, streaming it one row at a time.
+    The header row is resolved into column indexes once, and each row is added to the table as it is read,
+    so memory use does not grow with the size of the file beyond the table itself.
+    Uncompressed files of at least chunked_reader.PARALLEL_READ_THRESHOLD bytes are memory-mapped instead,
+    and parsed in chunks, by worker processes if jobs > 1. See chunked_reader.
+    Args:
+        filename (str): CSV file name. It may be gzip-compressed.
+        activity_names ([str]): activity names to intern first, e.g. Config.get_activity_names()
+        input_columns (dict): key: input field, value: column header. Defaults to INPUT_COLUMNS.
+        jobs (int): worker processes for large files. With 1 (the default), they are parsed in this process.
+    Returns:
+        StudentTable: empty if the file is not found, or a column is missing.
+    """
+    from innovation_lab_assignments import chunked_reader
+    try:
+        if os.path.getsize(filename) >= chunked_reader.PARALLEL_READ_THRESHOLD and not is_gzip_file(filename):
+            return chunked_reader.read_student_table_chunked(filename, activity_names, input_columns, jobs)
+        with open_input(filename) as input_file:
+            csv_reader = csv.reader(input_file)
+            header = next(csv_reader, None)
+            if header is None:
+                return StudentTable(activity_names)
+            column_indexes = resolve_input_columns(header, input_columns)
+            return StudentTable.from_rows(csv_reader, column_indexes, activity_names, filename)
+    except FileNotFoundError:
+        logging.error("Input records with filename " + filename + " not found")
+    except ValueError as exception:
+        logging.error(f"Input records with filename {filename}: {exception}")
+    return StudentTable(activity_names)
+
 def students_with_activity_choice(students, activity_choice, day, priority) -> [Student]:
     """
     Creates list of students who have activity_choice for the passed day, at the passed priority,
@@ -41,146 +107,207 @@ def students_with_activity_choice(students, activity_choice, day, priority) -> [
         [Student]: List of students for passed in activity.
     """
     student_candidates: list[Student] = []
-
-    def choice_filter(choice):
-        """
-        Inner Filter Function for filter() call below.
-        Return True if the passed choice's priority is the priority passed into the outer function,
-        and the choice's name is the activity choice name passed into the outer function.
-        """
-        return True if choice.priority == priority and choice.name == activity_choice.name else False
+    day_index = day_index_of(day)
+    # Activity names are interned, so each choice is compared as an integer id. Students may be from different tables.
+    table = None
+    activity_id = -1
 
     for student in students:
-        if student.is_available_for_day(day):
-            # Filter all the student's choices for the day to just the passed in activity choice.
-            # This filtered list may be empty (len == 0).
-            all_student_choices = getattr(student, day.lower() + "_choices")
-            student_day_choices = list(filter(choice_filter, all_student_choices))
-            # If this student chose this activity, append to student_candidates.
-            if len(student_day_choices) > 0:
-                student_candidates.append(student)
+        if student.table is not table:
+            table = student.table
+            activity_id = table.activity_id(activity_choice.name)
+        # If this student chose this activity, and is still available, append to student_candidates.
+        if table.choice_id(student.row, day_index, priority) == activity_id and table.selection(student.row, day_index) == 0:
+            student_candidates.append(student)
 
     return student_candidates
 
-def mark_students_selected_for_day(student_candidates, day, priority):
+def log_unmatched_choices(student_table: StudentTable, activity_names: [str]):
+    """
+    Log every chosen activity name that does not match a config activity, even ignoring case and spacing.
+    Students are never assigned to such choices.
+    Args:
+        student_table (StudentTable)
+        activity_names ([str]): config activity names
+    """
+    unmatched_choices = student_table.unmatched_choices(activity_names)
+    if len(unmatched_choices) > 0:
+        logging.warning("Choices that match no config activity: " +
+                        ", ".join(f"'{activity_name}' ({count})" for activity_name, count in unmatched_choices.items()))
+    get_metrics().count("unmatched_choices", sum(unmatched_choices.values()))
+
+def mark_students_selected_for_day(student_candidates, day, priority, choice_index: ChoiceIndex = None):
     """
     Call set_selection_priority_for_day() for every student candidate.
+    If a choice_index is passed, the students are also removed from it for the day.
     """
     for student in student_candidates:
         student.set_selection_priority_for_day(priority, day)
+        if choice_index is not None:
+            choice_index.remove_student_for_day(student, day)
 
-def activities_to_rows(activities, dict_row_manager: DictRowManager):
+def _display_name(student: Student, display_names: [str]) -> str:
     """
-    For all the passed activities, for each of their respective students,
-    populate each of the activity's students using the passed dict_row_manager.
-    Args:
-          activities ([Activity])
-          dict_row_manager (DictRowManager): Instance of DictRowManager
+    Return the student's "first last" display name, from display_names if passed.
     """
-    for activity in activities:
-        students: [Student] = activity.students
-        for i in range(0, len(students)):
-            row_dict = dict_row_manager.get_row(i)
-            row_dict[activity.name] = students[i].first_name + " " + students[i].last_name
+    if display_names is None:
+        return student.first_name + " " + student.last_name
+    return display_names[student.row]
 
-def write_output_sheet(sheet_rec: SheetRec, output_dir: str):
+def write_csv_rows(csv_file, header: [str], columns: [[str]]):
     """
-    Write passed sheet_rec to a csv file named "assignment_<day>".
-    For example, if sheet_rec.day is Monday, the file name will be
-    assignment_Monday.csv.
+    Write a CSV whose columns are the passed lists to an open text file. Shorter columns are padded with empty cells.
     Args:
-        sheet_rec ([SheetRec])
-        output_dir (str): Directory name to prepend to file name.
+        csv_file: text file, opened with newline=""
+        header ([str]): heading of each column
+        columns ([[str]]): cells of each column
     """
-    csv_name = output_dir + "/assignment_" + sheet_rec.day + ".csv"
-    activity_field_names = [activity.name for activity in sheet_rec.activities]
+    csv_writer = csv.writer(csv_file)
+    csv_writer.writerow(header)
+    # Transpose the columns into rows.
+    csv_writer.writerows(zip_longest(*columns, fillvalue=""))
 
-    dict_row_manager = DictRowManager(activity_field_names)
-    activities_to_rows(sheet_rec.activities, dict_row_manager)
+def _read_umask() -> int:
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
 
-    with open(csv_name, "w", newline="") as csv_file:
-        # Ignore PyCharm's goofy 'Expected type SupportsWrite[str]'. The code works fine as-is.
-        # noinspection PyTypeChecker
-        csv_writer = csv.DictWriter(csv_file, activity_field_names)
-        csv_writer.writeheader()
-        csv_writer.writerows(dict_row_manager.get_all_rows())
+# The process umask, read once: os.umask() can only read it by setting it, which is not safe from the writer threads.
+_OUTPUT_FILE_MODE = 0o666 & ~_read_umask()
 
-def build_days_dict_row_manager(students: [Student], days)-> DictRowManager:
+def write_csv_atomically(csv_name: str, header: [str], columns: [[str]]):
     """
-    Create and return a DictRowManager whose keys are days, and rows are
-    student that is still available for a given day.
+    Write a CSV whose columns are the passed lists. Shorter columns are padded with empty cells.
+    The CSV is written to a temporary file in the same directory, then renamed, so csv_name is never half-written.
+    The file gets the permissions of a file created by open(), rather than the temporary file's owner-only permissions.
     Args:
-        students ([Student]): Students to be considered.
-        days ([str]): days to check for available students.
+        csv_name (str)
+        header ([str]): heading of each column
+        columns ([[str]]): cells of each column
+    """
+    file_descriptor, temp_name = tempfile.mkstemp(dir=os.path.dirname(csv_name) or ".", prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w", newline="") as csv_file:
+            write_csv_rows(csv_file, header, columns)
+        os.chmod(temp_name, _OUTPUT_FILE_MODE)
+        os.replace(temp_name, csv_name)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+def output_sheet_table(sheet_rec: SheetRec, display_names: [str] = None) -> tuple:
+    """
+    Return the output file of the passed sheet_rec: "assignment_<day>.csv", with a column of students per activity.
+    Args:
+        sheet_rec (SheetRec)
+        display_names ([str]): Display name per StudentTable row, e.g. StudentTable.display_names().
+            Defaults to each student's first and last name.
     Returns:
-        DictRowManager
+        tuple: (file name, [str] header, [[str]] columns)
     """
-    dict_row_manager = DictRowManager(days)
+    activity_field_names = [activity.name for activity in sheet_rec.activities]
+    columns = [[_display_name(student, display_names) for student in activity.students] for activity in sheet_rec.activities]
+    return "assignment_" + sheet_rec.day + ".csv", activity_field_names, columns
 
-    for day in days:
-        i = 0
-        for student in students:
-            if student.is_available_for_day(day):
-                row_dict = dict_row_manager.get_row(i)
-                row_dict[day] = student.first_name + " " + student.last_name
-                i += 1
+def output_day_tables(sheet_recs: [SheetRec], display_names: [str] = None) -> [tuple]:
+    """
+    Return the output file of every day: as output_sheet_table(), but the sheets of a day that has more than one
+    are written side by side in one "assignment_<day>.csv", in config order.
+    Args:
+        sheet_recs ([SheetRec])
+        display_names ([str]): Display name per StudentTable row. See output_sheet_table().
+    Returns:
+        [tuple]: (file name, [str] header, [[str]] columns) per day, in config order
+    """
+    day_tables = {} #key: file name, value: (file name, header, columns)
+    for sheet_rec in sheet_recs:
+        file_name, header, columns = output_sheet_table(sheet_rec, display_names)
+        if file_name in day_tables:
+            day_tables[file_name][1].extend(header)
+            day_tables[file_name][2].extend(columns)
+        else:
+            day_tables[file_name] = (file_name, header, columns)
+    return list(day_tables.values())
+
+def require_manual_assignment_table(result: AssignmentResult, display_names: [str] = None) -> tuple:
+    """
+    Return the "require_manual_assignment.csv" output file: a column of still available students per day.
+    Args:
+        result (AssignmentResult): assigned sheets. Their days are the CSV headings.
+        display_names ([str]): Display name per StudentTable row. See output_sheet_table().
+    Returns:
+        tuple: (file name, [str] header, [[str]] columns)
+    """
+    if display_names is None:
+        display_names = result.student_table.display_names()
+    # Only the still-unassigned students are visited.
+    columns = [[display_names[row] for row in result.unassigned_rows(day)] for day in result.days]
+    return "require_manual_assignment.csv", result.days, columns
 
-    return dict_row_manager
+def write_output_sheet(sheet_rec: SheetRec, output_dir: str, display_names: [str] = None):
+    """
+    Write passed sheet_rec to a csv file named "assignment_<day>".
+    For example, if sheet_rec.day is Monday, the file name will be
+    assignment_Monday.csv. Each activity is a column of its students.
+    Args:
+        sheet_rec ([SheetRec])
+        output_dir (str): Directory name to prepend to file name.
+        display_names ([str]): Display name per StudentTable row. See output_sheet_table().
+    """
+    file_name, header, columns = output_sheet_table(sheet_rec, display_names)
+    write_csv_atomically(output_dir + "/" + file_name, header, columns)
 
-def write_require_manual_assignment(students: [Student], days, output_dir:str):
+def write_require_manual_assignment(result: AssignmentResult, output_dir:str, display_names: [str] = None):
     """
     Write a CSV with students that are still available for each day.
     Args:
-         students ([Student]): Students to be considered.
-         days ([str]): CSV headings
+         result (AssignmentResult): assigned sheets. Their days are the CSV headings.
          output_dir (str): Directory name to prepend to csv name.
+         display_names ([str]): Display name per StudentTable row. See output_sheet_table().
     """
-    csv_name = output_dir + "/require_manual_assignment.csv"
-    dict_row_manager = build_days_dict_row_manager(students, days)
+    file_name, header, columns = require_manual_assignment_table(result, display_names)
+    write_csv_atomically(output_dir + "/" + file_name, header, columns)
 
-    with open(csv_name, "w", newline="") as csv_file:
-        # noinspection PyTypeChecker
-        csv_writer = csv.DictWriter(csv_file, days)
-        csv_writer.writeheader()
-        csv_writer.writerows(dict_row_manager.get_all_rows())
-
-def debug_log_unselected_students(students: [Student], day, priority):
-    logging.debug("Students still unselected for " + day + " after assigning priority " + str(priority) + " activities:")
-    for student in students:
-        if student.is_available_for_day(day):
-            logging.debug(student.first_name + " " + student.last_name)
-
-def cap_student_candidates(students: [Student], remaining_cap, day, priority, activity) ->[Student]:
+def write_output_files(result: AssignmentResult, output_dir: str):
     """
-    From a passed list of randomized students, returns a list of students no longer then the remaining_cap.
-    Also logs all of the passed randomized students, indicating which survived by making the cut.
+    Write every day's CSV, and the require_manual_assignment CSV, concurrently on a thread pool.
+    Display names are built once for the whole table. See output_day_tables().
     Args:
-        students ([Student]): Randomized students
-        remaining_cap (int): How many of the students that make the cut
-        day (str): day for logging
-        priority (int): priority for logging
-        activity (str): activity name for logging
-    Returns:
-        [Student] surviving_students
+        result (AssignmentResult): assigned sheets
+        output_dir (str): Directory name to prepend to file names.
     """
-    # Inner function to do the logging.
-    def _debug_log_randomized_students():
-        logging.debug("Randomized students for " + day + ", priority " + str(priority) + ", " + activity + " (* indicates selected students:)")
-        for student, indicator in students_with_indicator:
-            logging.debug(student.first_name + " " + student.last_name + indicator + "\t\t" + str(student.timestamp))
+    metrics = get_metrics()
+    display_names = result.student_table.display_names()
+
+    def _timed(file_name, header, columns):
+        with metrics.span("write_output", file=file_name):
+            write_csv_atomically(output_dir + "/" + file_name, header, columns)
 
-    # Create list of students plus an initially empty indicator.
-    students_with_indicator = [[student, ""] for student in students]
-    # Cap-off the students list.
-    surviving_students = students[0: remaining_cap]
+    # One file per day, so two sheets of the same day are not both renamed onto it.
+    output_tables = output_day_tables(result.sheet_recs, display_names)
+    output_tables.append(require_manual_assignment_table(result, display_names))
+    with ThreadPoolExecutor(max_workers=len(output_tables)) as executor:
+        futures = [executor.submit(_timed, file_name, header, columns) for file_name, header, columns in output_tables]
+        for future in futures:
+            future.result() #Raise the first error, if any.
 
-    # Update the indicator for the surviving students with an "*".
-    for i in range(len(surviving_students)):
-        students_with_indicator[i][1] = "*"
+def debug_log_unselected_students(student_table: StudentTable, day, priority):
+    if not logging.getLogger().isEnabledFor(logging.DEBUG):
+        return
 
-    _debug_log_randomized_students()
+    logging.debug("Students still unselected for " + day + " after assigning priority " + str(priority) + " activities:")
+    for row in student_table.available_rows(day_index_of(day)):
+        logging.debug(student_table.first_names[row] + " " + student_table.last_names[row])
 
-    return surviving_students
+def trace_candidates(day_index: int, priority: int, student_candidates: [Student], activity: Activity, outcome: int):
+    """
+    Record the passed candidates, all with the same outcome, in the lottery trace.
+    Nothing is recorded unless tracing is enabled (--trace).
+    """
+    trace = get_trace()
+    if trace.enabled and len(student_candidates) > 0:
+        trace.record(day_index, priority, student_candidates[0].table.activity_id(activity.name),
+                     [student.row for student in student_candidates], outcome)
 
 #TODO Change to NOT pass in project_root.
 def prepend_project_root_if_required(filename: str, project_root: str) -> str:
@@ -200,54 +327,340 @@ def die():
     logging.error("Unable to continue")
     return 1
 
-def main_loop():
-    from innovation_lab_assignments.random_select import randomize_students
-    from innovation_lab_assignments.classes import Config
-    config = Config.get_instance()
-    success = 0
-
-    input_records_dict_list = read_input_records(config.input_file_name)
-    logging.info("%i records to process", len(input_records_dict_list))
-    if len(input_records_dict_list) == 0:
-        return die()
-
-    # Create a list of Student from input_records_dict_list. The student_id is generated using enumerate().
-    students = [Student(student_dict, student_id) for student_id, student_dict in enumerate(input_records_dict_list, 1)]
-
-    # Create a list of Sheet_Rec from sheets data in config.json_data.
-    sheet_recs = [SheetRec(sheet_dict["sheet"]) for sheet_dict in config.get_sheets()]
-
-    for sheet_rec in sheet_recs:
-        for priority in range(1, 4):
+def assign_sheet_activities(sheet_rec: SheetRec, student_table: StudentTable, choice_index: ChoiceIndex, lottery_rng, context=None):
+    """
+    Assign students to the passed sheet_rec's activities, one priority at a time.
+    Activities are filled in config order. When an activity has more candidates than its remaining cap,
+    a weighted lottery selects only as many candidates as the remaining cap.
+    Args:
+        sheet_rec (SheetRec): sheet (day) to assign.
+        student_table (StudentTable): all students, used for logging those still unselected.
+        choice_index (ChoiceIndex): index of still-available students' choices.
+        lottery_rng (LotteryRng): source of each lottery's random values.
+        context (RunContext): the run's weighting. Defaults to random_select.default_context().
+    """
+    from innovation_lab_assignments.random_select import lottery_weights_and_keys, select_winners_by_key, default_context
+    if context is None:
+        context = default_context()
+    metrics = get_metrics()
+    trace = get_trace()
+    day_index = day_index_of(sheet_rec.day)
+
+    for priority in range(1, 4):
+        with metrics.span("assign_round", day=sheet_rec.day, priority=priority):
             for activity in sheet_rec.activities:
                 # If activity cap has not yet been reached...
                 if len(activity.students) < activity.cap:
                     # Get all still-available students who want this activity at the current priority.
-                    student_candidates = students_with_activity_choice(students, activity, sheet_rec.day, priority)
+                    student_candidates = choice_index.students_with_activity_choice(activity, sheet_rec.day, priority)
+                    metrics.count("candidates_scanned", len(student_candidates))
                     # If the number of student candidates exceeds the activity's remaining cap,
-                    # randomize_students() using the candidates, then select from that list up to the remaining cap value,
-                    # starting with beginning of the list.
+                    # select the lottery winners from the candidates, up to the remaining cap value.
                     remaining_cap = activity.cap - len(activity.students)
                     if len(student_candidates) > remaining_cap:
-                        student_candidates = randomize_students(student_candidates, activity)
-                        # Use only the first student through the remaining cap.
-                        student_candidates = cap_student_candidates(student_candidates, remaining_cap, sheet_rec.day, priority, activity.name)
+                        rng = lottery_rng.substream(sheet_rec.day, priority, activity.name)
+                        # Only the winners up to the remaining cap are selected, so there is no need to order everyone.
+                        with metrics.span("lottery", day=sheet_rec.day, priority=priority):
+                            weights, keys = lottery_weights_and_keys(student_candidates, activity, rng, context)
+                            lottery_winners = select_winners_by_key(student_candidates, keys, remaining_cap)
+                        metrics.count("lotteries_run")
+                        metrics.count("students_capped_out", len(student_candidates) - len(lottery_winners))
+                        if trace.enabled:
+                            winners = set(lottery_winners)
+                            trace.record(day_index, priority, student_candidates[0].table.activity_id(activity.name),
+                                         [student.row for student in student_candidates],
+                                         [OUTCOME_WON if student in winners else OUTCOME_LOST for student in student_candidates],
+                                         weights, keys)
+                        student_candidates = lottery_winners
+                    else:
+                        trace_candidates(day_index, priority, student_candidates, activity, OUTCOME_NO_LOTTERY)
 
                     activity.students.extend(student_candidates)
-                    mark_students_selected_for_day(student_candidates, sheet_rec.day, priority)
+                    mark_students_selected_for_day(student_candidates, sheet_rec.day, priority, choice_index)
+                elif trace.enabled:
+                    trace_candidates(day_index, priority, choice_index.students_with_activity_choice(activity, sheet_rec.day, priority),
+                                     activity, OUTCOME_FULL)
 
-            debug_log_unselected_students(students, sheet_rec.day, priority)
+        debug_log_unselected_students(student_table, sheet_rec.day, priority)
 
-    '''
-    Output a sheet CSV for every sheet_rec.
-    '''
+def assign_sheet(sheet_rec: SheetRec, student_table: StudentTable, engine: str, lottery_rng, choice_index: ChoiceIndex = None,
+                 context=None):
+    """
+    Assign students to the passed sheet_rec's activities using the passed engine.
+    Args:
+        sheet_rec (SheetRec): sheet (day) to assign.
+        student_table (StudentTable): all students.
+        engine (str): One of Config.engines
+        lottery_rng (LotteryRng): source of each lottery's random values.
+        choice_index (ChoiceIndex): python engine only. If None, one is built for the sheet's day.
+        context (RunContext): the run's weighting. Defaults to random_select.default_context().
+    """
+    if engine == Config.engine_numpy:
+        from innovation_lab_assignments.numpy_engine import assign_sheet_activities_numpy
+        assign_sheet_activities_numpy(sheet_rec, student_table, lottery_rng, context)
+    elif engine == Config.engine_optimal:
+        from innovation_lab_assignments.optimal_engine import assign_sheet_activities_optimal
+        assign_sheet_activities_optimal(sheet_rec, student_table, lottery_rng, context)
+    else:
+        if choice_index is None:
+            choice_index = ChoiceIndex(student_table, [day_index_of(sheet_rec.day)])
+        assign_sheet_activities(sheet_rec, student_table, choice_index, lottery_rng, context)
+
+def assign_sheets(sheet_recs: [SheetRec], student_table: StudentTable, engine: str, lottery_rng, jobs: int = 1,
+                  context=None) -> AssignmentResult:
+    """
+    Assign students to every sheet's activities, in config order, or in parallel worker processes if jobs > 1.
+    Args:
+        sheet_recs ([SheetRec]): sheets (days) to assign.
+        student_table (StudentTable): all students.
+        engine (str): One of Config.engines
+        lottery_rng (LotteryRng): source of each lottery's random values.
+        jobs (int): maximum number of worker processes
+        context (RunContext): the run's weighting. Defaults to random_select.default_context().
+    Returns:
+        AssignmentResult
+    """
+    if context is None:
+        from innovation_lab_assignments.random_select import default_context
+        context = default_context() #Once for every sheet.
+    if jobs > 1 and len(sheet_recs) > 1:
+        from innovation_lab_assignments.parallel import assign_sheets_in_parallel
+        assign_sheets_in_parallel(sheet_recs, student_table, lottery_rng, engine, jobs, context)
+    else:
+        choice_index = None
+        if engine == Config.engine_python:
+            # Index every student's choices once, rather than scanning all students for every activity.
+            with get_metrics().span("build_choice_index"):
+                choice_index = ChoiceIndex(student_table)
+
+        for sheet_rec in sheet_recs:
+            assign_sheet(sheet_rec, student_table, engine, lottery_rng, choice_index, context)
+    return AssignmentResult(sheet_recs, student_table)
+
+def assign_new_students(sheet_recs: [SheetRec], student_table: StudentTable, new_rows, lottery_rng, context=None) -> AssignmentResult:
+    """
+    Assign only the passed rows' students into the remaining seats of the passed, already assigned, sheets,
+    with the same priority rules as assign_sheet_activities(). Other students keep their assignments,
+    and are not candidates, even if they are unassigned.
+    Args:
+        sheet_recs ([SheetRec]): assigned sheets (days)
+        student_table (StudentTable): all students
+        new_rows: rows of the students to assign, in ascending order
+        lottery_rng (LotteryRng): source of each lottery's random values. Use a new generation for each incremental run.
+        context (RunContext): the run's weighting. Defaults to random_select.default_context().
+    Returns:
+        AssignmentResult
+    """
+    if context is None:
+        from innovation_lab_assignments.random_select import default_context
+        context = default_context()
+    choice_index = ChoiceIndex(student_table, rows=new_rows)
     for sheet_rec in sheet_recs:
-        write_output_sheet(sheet_rec, config.output_dir_name)
+        assign_sheet_activities(sheet_rec, student_table, choice_index, lottery_rng, context)
+    return AssignmentResult(sheet_recs, student_table)
+
+def incremental_loop(checkpoint, context) -> int:
+    """
+    Assign the students whose responses were added since the passed checkpoint, then write the outputs
+    and the next checkpoint. See checkpoint.py.
+    Args:
+        checkpoint (RunCheckpoint): the previous run's checkpoint
+        context (RunContext): the run's settings
+    Returns:
+        int: 0 on success
+    """
+    from innovation_lab_assignments.random_select import LotteryRng
+    from innovation_lab_assignments.checkpoint import RunCheckpoint, read_new_rows, input_file_state
+    metrics = get_metrics()
+    #New students only fill seats next to the earlier placements, so the checkpoint's sheets and engine stay in effect.
+    if context.engine != Config.engine_python:
+        logging.warning("--incremental assigns new students with the %s engine; %s is ignored", Config.engine_python, context.engine)
+    config_caps = [(sheet_rec.day, [(activity.name, activity.cap) for activity in sheet_rec.activities])
+                   for sheet_rec in context.get_sheet_recs()]
+    if config_caps != checkpoint.sheet_caps():
+        logging.warning("The config's sheets or caps differ from the checkpoint's; the checkpoint's are used. "
+                        "Run without --incremental to apply the config's.")
+
+    try:
+        input_state = input_file_state(context.input_file_name)
+        with metrics.span("read_new_rows"):
+            new_table = read_new_rows(context.input_file_name, checkpoint, input_state, context.get_input_columns())
+    except FileNotFoundError:
+        logging.error("Input records with filename " + context.input_file_name + " not found")
+        return die()
+    except ValueError as exception:
+        logging.error(f"Input records with filename {context.input_file_name}: {exception}")
+        return die()
+    logging.info("%i new records to process", len(new_table))
+    metrics.count("new_students", len(new_table))
+    log_unmatched_choices(new_table, context.get_activity_names())
+
+    student_table = checkpoint.student_table
+    new_rows = range(len(student_table), len(student_table) + len(new_table))
+    student_table.extend(new_table)
+    metrics.count("students", len(student_table))
+
+    # The checkpoint's seed, with the next generation, so the new lotteries do not repeat the earlier ones.
+    generation = checkpoint.generation + 1
+    reference_time = context.reference_time
+    lottery_rng = LotteryRng(checkpoint.seed, generation)
+    logging.info("Lottery seed: %i, generation: %i, reference time: %s", checkpoint.seed, generation, reference_time.isoformat())
+    run_store = _open_run_store(student_table, context)
+    if run_store is None and context.store_file_name is not None:
+        return die()
+    if context.trace_file_name is not None:
+        enable_trace(context.trace_file_name, student_table,
+                     seed=checkpoint.seed, generation=generation, reference_time=reference_time.isoformat(), engine=Config.engine_python)
+
+    with metrics.span("assign_new_students"):
+        result = assign_new_students(checkpoint.sheet_recs(), student_table, new_rows, lottery_rng, context)
+    disable_trace()
+    metrics.count("manual_assignments", sum(result.unassigned_count(day) for day in result.days))
+
+    with metrics.span("write_outputs"):
+        write_output_files(result, context.output_dir_name)
+    _save_checkpoint(RunCheckpoint(result, checkpoint.seed, generation, reference_time, input_state), context)
+    _save_run(run_store, result, context, checkpoint.seed, generation, Config.engine_python)
+    return 0
+
+def _save_checkpoint(checkpoint, context):
+    """
+    Save the run's checkpoint in the output directory, for the next --incremental run.
+    Failing to save it is not an error for this run.
+    """
+    from innovation_lab_assignments.checkpoint import checkpoint_file_name, save_checkpoint
+    with get_metrics().span("save_checkpoint"):
+        try:
+            save_checkpoint(checkpoint_file_name(context.output_dir_name), checkpoint)
+        except OSError as exception:
+            logging.warning(f"Unable to save checkpoint: {exception}")
+
+def _open_run_store(student_table: StudentTable, context):
+    """
+    Open the context's run store, and set the context's history weights of the passed students from it,
+    if the config has history_weighting.
+    Returns:
+        RunStore: the open store, or None without a store, or if it cannot be opened.
+    """
+    import sqlite3
+    from innovation_lab_assignments.run_store import RunStore, default_term, load_history_weights
+    history_multiplier = context.get_history_multiplier()
+    context.history_weights = None
+    if context.store_file_name is None:
+        if history_multiplier is not None:
+            logging.warning("history_weighting requires --" + Config.store_file_name + ". Lottery weights are not adjusted.")
+        return None
+
+    run_store = None
+    try:
+        run_store = RunStore(context.store_file_name)
+        if history_multiplier is not None:
+            term = context.term if context.term is not None else default_term(context.reference_time)
+            with get_metrics().span("load_history_weights"):
+                history_weights = load_history_weights(run_store, student_table, term, history_multiplier)
+            context.history_weights = history_weights
+            logging.info("%i students lost activities in terms before %s", len(set().union(*history_weights.row_losses.values())), term)
+    except sqlite3.Error as exception:
+        logging.error(f"Unable to read store {context.store_file_name}: {exception}")
+        if run_store is not None:
+            run_store.close()
+        return None
+    return run_store
+
+def _save_run(run_store, result: AssignmentResult, context, seed: int, generation: int, engine: str):
+    """
+    Add the run to the passed run store, in one transaction, and close it. Does nothing without a store.
+    """
+    import sqlite3
+    from innovation_lab_assignments.run_store import default_term
+    if run_store is None:
+        return
+    reference_time = context.reference_time
+    term = context.term if context.term is not None else default_term(reference_time)
+    with get_metrics().span("save_run_store"):
+        try:
+            run_id = run_store.save_run(result, term, seed, generation, reference_time, engine, context.input_file_name)
+            logging.info("Saved run %i of term %s in %s", run_id, term, run_store.filename)
+        except sqlite3.Error as exception:
+            logging.error(f"Unable to save run in store {run_store.filename}: {exception}")
+        finally:
+            run_store.close()
+
+def main_loop(context=None) -> int:
+    """
+    Assign the students of the context's input file, and write the outputs.
+    Args:
+        context (RunContext): the run's settings. Defaults to a snapshot of the Config singleton, see RunContext.from_config().
+            Concurrent runs must each pass their own.
+    Returns:
+        int: 0 on success
+    """
+    import copy
+    from innovation_lab_assignments.random_select import LotteryRng
+    from innovation_lab_assignments.run_context import RunContext
+    # The run's own copy: its history weights are set for its students, and the passed context may be shared by other runs.
+    context = copy.copy(context) if context is not None else RunContext.from_config()
+    metrics = get_metrics()
+    success = 0
+
+    from innovation_lab_assignments.checkpoint import RunCheckpoint, checkpoint_file_name, load_checkpoint, input_file_state
+    if context.incremental:
+        checkpoint = load_checkpoint(checkpoint_file_name(context.output_dir_name))
+        if checkpoint is not None:
+            return incremental_loop(checkpoint, context)
+        logging.warning("No checkpoint in " + context.output_dir_name + ". Assigning every student.")
+
+    # The input file's state before it is read, for the checkpoint.
+    try:
+        input_state = input_file_state(context.input_file_name)
+    except FileNotFoundError:
+        input_state = None
+
+    # Create a compact StudentTable of the input records, parsed or from the input cache.
+    from innovation_lab_assignments.input_cache import load_student_table
+    student_table = load_student_table(context.input_file_name, context.get_activity_names(), use_cache=not context.no_cache,
+                                       input_columns=context.get_input_columns(), jobs=context.jobs)
+    logging.info("%i records to process", len(student_table))
+    if len(student_table) == 0:
+        return die()
+    metrics.count("students", len(student_table))
+    log_unmatched_choices(student_table, context.get_activity_names())
+
+    # Create a list of Sheet_Rec from the config's sheets.
+    sheet_recs = context.get_sheet_recs()
+
+    if context.engine == Config.engine_numpy:
+        from innovation_lab_assignments.numpy_engine import is_numpy_available
+        if not is_numpy_available():
+            logging.error("The " + Config.engine_numpy + " engine requires NumPy, which is not installed.")
+            return die()
+
+    # Every lottery gets its own random stream derived from the seed, so a run can be reproduced bit-for-bit,
+    # and the results do not depend on how many jobs are used.
+    seed = context.seed if context.seed is not None else random.getrandbits(64)
+    reference_time = context.reference_time
+    lottery_rng = LotteryRng(seed)
+    logging.info("Lottery seed: %i, reference time: %s", seed, reference_time.isoformat())
+    # Weight every student once, rather than every time they enter a lottery.
+    with metrics.span("compute_base_weights"):
+        student_table.compute_base_weights(reference_time)
+    run_store = _open_run_store(student_table, context)
+    if run_store is None and context.store_file_name is not None:
+        return die()
+    if context.trace_file_name is not None:
+        enable_trace(context.trace_file_name, student_table,
+                     seed=seed, reference_time=reference_time.isoformat(), engine=context.engine)
+
+    result = assign_sheets(sheet_recs, student_table, context.engine, lottery_rng, context.jobs, context)
+    disable_trace()
+    metrics.count("manual_assignments", sum(result.unassigned_count(day) for day in result.days))
 
     '''
-    Write CSV with students not selected for any activities by day.
+    Output a sheet CSV for every sheet_rec, and a CSV with students not selected for any activities by day.
     '''
-    days = [sheet_rec.day for sheet_rec in sheet_recs ]
-    write_require_manual_assignment(students, days, config.output_dir_name)
+    with metrics.span("write_outputs"):
+        write_output_files(result, context.output_dir_name)
+    _save_checkpoint(RunCheckpoint(result, seed, 0, reference_time, input_state), context)
+    _save_run(run_store, result, context, seed, 0, context.engine)
 
     return success
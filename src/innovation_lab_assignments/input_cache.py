@@ -0,0 +1,204 @@
+"""
+Content-addressed cache of parsed form responses.
+A parsed StudentTable is saved in a memory-mappable file, named by the hash of the CSV's content and of the column
+mapping used to read it. Running again on the same responses (with other caps, seeds or configs) maps the file
+instead of parsing the CSV.
+
+File layout: MAGIC, then each column's raw bytes at an 8-byte aligned offset, then a JSON header
+(row count, activity names, and the offset and size of every column), then the header's offset as 8 bytes.
+First and last names are stored as UTF-8, separated by NUL characters, which csv cannot read from a CSV.
+
+The cache directory is trimmed to a size limit after each write, removing the least recently used files first.
+"""
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.metrics import get_metrics
+
+MAGIC = b"ILTABLE1"
+_FORMAT_VERSION = 2
+_CACHE_SUFFIX = ".table"
+DEFAULT_SIZE_LIMIT = 512 * 1024 * 1024 #bytes
+_offset_struct = struct.Struct("<Q")
+# (StudentTable attribute, array typecode) of the numeric columns.
+_ARRAY_COLUMNS = (("student_ids", "l"), ("timestamps", "d"), ("choices", "i"))
+_NAME_COLUMNS = ("first_names", "last_names")
+
+def user_cache_dir() -> str:
+    """
+    Returns: str: $XDG_CACHE_HOME/innovation_lab_assignments, or ~/.cache/innovation_lab_assignments
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "innovation_lab_assignments")
+
+def default_cache_dir() -> str:
+    """
+    Returns: str: the inputs directory of user_cache_dir()
+    """
+    return os.path.join(user_cache_dir(), "inputs")
+
+def _hash_file(filename: str) -> str:
+    file_hash = hashlib.sha256()
+    with open(filename, "rb") as input_file:
+        while chunk := input_file.read(1024 * 1024):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+def cache_key(filename: str, input_columns: dict = None) -> str:
+    """
+    Return the cache key of the passed CSV: a hash of its content, the column mapping, and the file format.
+    Args:
+        filename (str): CSV file name
+        input_columns (dict): column mapping. Defaults to INPUT_COLUMNS.
+    Raises:
+        FileNotFoundError
+    """
+    # The array item sizes are platform dependent, so they are part of the format.
+    file_format = [_FORMAT_VERSION, sys.byteorder] + [array(typecode).itemsize for ignored_name, typecode in _ARRAY_COLUMNS]
+    mapping = json.dumps([INPUT_COLUMNS if input_columns is None else input_columns, file_format], sort_keys=True)
+    return hashlib.sha256((_hash_file(filename) + mapping).encode("utf-8")).hexdigest()
+
+def write_table(filename: str, student_table: StudentTable):
+    """
+    Write the passed StudentTable to filename, atomically. Selections and base weights are not saved.
+    """
+    directory = os.path.dirname(filename)
+    os.makedirs(directory, exist_ok=True)
+    columns = {name: getattr(student_table, name).tobytes() for name, ignored_typecode in _ARRAY_COLUMNS}
+    columns["in_athletics"] = bytes(student_table.in_athletics)
+    for name in _NAME_COLUMNS:
+        columns[name] = "\0".join(getattr(student_table, name)).encode("utf-8")
+
+    file_descriptor, temp_name = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "wb") as table_file:
+            table_file.write(MAGIC)
+            offset = len(MAGIC)
+            column_offsets = {}
+            for name, column_bytes in columns.items():
+                padding = -offset % 8
+                table_file.write(bytes(padding))
+                offset += padding
+                column_offsets[name] = [offset, len(column_bytes)]
+                table_file.write(column_bytes)
+                offset += len(column_bytes)
+            header = {"rows": len(student_table), "activity_names": student_table.activity_names, "columns": column_offsets}
+            table_file.write(json.dumps(header).encode("utf-8"))
+            table_file.write(_offset_struct.pack(offset))
+        os.replace(temp_name, filename)
+    except BaseException:
+        os.unlink(temp_name)
+        raise
+
+def read_table(filename: str, activity_names: [str] = ()) -> StudentTable:
+    """
+    Read a StudentTable written by write_table(). The file is memory-mapped, and each column is copied out in one piece.
+    Args:
+        filename (str)
+        activity_names ([str]): activity names that should have ids, e.g. Config.get_activity_names()
+    Returns:
+        StudentTable
+    Raises:
+        ValueError: filename is not a table file, or is truncated or corrupt.
+    """
+    with open(filename, "rb") as table_file, mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ) as table_map:
+        if len(table_map) < len(MAGIC) + _offset_struct.size or table_map[0: len(MAGIC)] != MAGIC:
+            raise ValueError(filename + " is not a student table file")
+        header_offset = _offset_struct.unpack(table_map[-_offset_struct.size:])[0]
+        if not len(MAGIC) <= header_offset <= len(table_map) - _offset_struct.size:
+            raise ValueError(f"{filename} is truncated: header offset {header_offset} is out of range")
+        header = json.loads(table_map[header_offset: -_offset_struct.size].decode("utf-8"))
+
+        def _column_bytes(name):
+            offset, size = header["columns"][name]
+            if not (len(MAGIC) <= offset and 0 <= size and offset + size <= header_offset):
+                raise ValueError(f"{filename} is corrupt: column {name} is out of range")
+            return table_map[offset: offset + size]
+
+        student_table = StudentTable(header["activity_names"])
+        for name, typecode in _ARRAY_COLUMNS:
+            getattr(student_table, name).frombytes(_column_bytes(name))
+        student_table.in_athletics = bytearray(_column_bytes("in_athletics"))
+        for name in _NAME_COLUMNS:
+            setattr(student_table, name, _column_bytes(name).decode("utf-8").split("\0") if header["rows"] > 0 else [])
+    student_table.selections = array("b", bytes(header["rows"] * len(DAYS)))
+    # Config activities that no student chose get ids too, and every config activity is named as spelled in the config.
+    for activity_name in activity_names:
+        student_table.activity_names[student_table.intern_activity(activity_name)] = activity_name
+    return student_table
+
+def evict(cache_dir: str, size_limit: int):
+    """
+    Remove the least recently used cache files until the cache directory is no larger than size_limit bytes.
+    """
+    cache_files = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(_CACHE_SUFFIX):
+            entry_stat = entry.stat()
+            cache_files.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+    total_size = sum(size for ignored_mtime, size, ignored_path in cache_files)
+    for ignored_mtime, size, path in sorted(cache_files):
+        if total_size <= size_limit:
+            break
+        try:
+            os.unlink(path)
+            total_size -= size
+        except OSError as exception:
+            logging.debug(f"Unable to evict {path}: {exception}")
+
+def load_student_table(filename: str, activity_names: [str] = (), use_cache: bool = True, cache_dir: str = None,
+                       size_limit: int = DEFAULT_SIZE_LIMIT, input_columns: dict = None, jobs: int = 1) -> StudentTable:
+    """
+    Return a StudentTable of the passed CSV's form responses, from the cache if it has them.
+    Otherwise the CSV is parsed, and the table is added to the cache.
+    Args:
+        filename (str): CSV file name
+        activity_names ([str]): activity names to intern first, e.g. Config.get_activity_names()
+        use_cache (bool): False to always parse the CSV, and leave the cache alone (--no-cache)
+        cache_dir (str): Defaults to default_cache_dir()
+        size_limit (int): cache directory size limit in bytes
+        input_columns (dict): column mapping, e.g. Config.get_input_columns(). Defaults to INPUT_COLUMNS.
+        jobs (int): worker processes for parsing large files. See read_student_table().
+    Returns:
+        StudentTable: empty if the CSV is not found.
+    """
+    from innovation_lab_assignments.functions import read_student_table
+    metrics = get_metrics()
+    cache_name = None
+    if use_cache:
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        try:
+            cache_name = os.path.join(cache_dir, cache_key(filename, input_columns) + _CACHE_SUFFIX)
+        except FileNotFoundError:
+            logging.error("Input records with filename " + filename + " not found")
+            return StudentTable(activity_names)
+        try:
+            with metrics.span("read_input_cache"):
+                student_table = read_table(cache_name, activity_names)
+            os.utime(cache_name) #Most recently used.
+            metrics.count("input_cache_hits")
+            logging.info("Read %i parsed records from cache %s", len(student_table), cache_name)
+            return student_table
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, struct.error) as exception:
+            logging.warning(f"Ignoring unreadable input cache {cache_name}: {exception}")
+
+    with metrics.span("read_student_table"):
+        student_table = read_student_table(filename, activity_names, input_columns, jobs)
+
+    if cache_name is not None and len(student_table) > 0:
+        try:
+            write_table(cache_name, student_table)
+            evict(cache_dir, size_limit)
+        except OSError as exception:
+            logging.warning(f"Unable to write input cache {cache_name}: {exception}")
+    return student_table
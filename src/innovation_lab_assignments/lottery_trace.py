@@ -0,0 +1,302 @@
+"""
+Structured lottery decision trace.
+Every candidate of every assignment round is recorded as (day, priority, activity_id, row, weight, key, outcome)
+in a compact append-only binary file, instead of formatting log lines while assigning.
+Text is only formatted when the trace is queried:
+
+    python -m innovation_lab_assignments.lottery_trace <trace file> --student "First Last" [--activity NAME] [--day DAY]
+
+File layout: MAGIC, a 4-byte little-endian header length, a JSON header (run info, activity names, and
+student_id, first name and last name per row), then blocks. Each block is a 4-byte record count followed by
+one column per field, in _COLUMNS order.
+"""
+import json
+import math
+import struct
+import sys
+from array import array
+from contextvars import ContextVar
+from innovation_lab_assignments.classes import *
+
+MAGIC = b"ILTRACE1"
+
+# Record outcomes.
+OUTCOME_LOST = 0 #Lost the lottery.
+OUTCOME_WON = 1 #Won the lottery.
+OUTCOME_NO_LOTTERY = 2 #Selected without a lottery; every candidate fit under the cap.
+OUTCOME_FULL = 3 #The activity was already full.
+OUTCOME_FLOW = 4 #Placed by the optimal engine's min-cost flow.
+OUTCOME_MANUAL = 5 #The optimal engine found no seat; requires manual assignment.
+
+# (name, array typecode) of each record field.
+_COLUMNS = (("day_index", "b"), ("priority", "b"), ("activity_id", "i"), ("row", "i"),
+            ("weight", "d"), ("key", "d"), ("outcome", "B"))
+_BLOCK_RECORDS = 65536 #Records buffered before a block is written.
+_count_struct = struct.Struct("<I")
+
+class LotteryTrace:
+    """
+    Records lottery decisions. Records are buffered in columns, and written to the file in blocks.
+    A LotteryTrace without a file (e.g. in a worker process) keeps its records, to be added to another one with extend().
+    Attributes:
+        columns (dict): key: field name, value: array of buffered records
+    """
+    enabled = True
+
+    def __init__(self, filename: str = None, header: dict = None):
+        self.columns = {name: array(typecode) for name, typecode in _COLUMNS}
+        self._file = None
+        if filename is not None:
+            header_bytes = json.dumps(header if header is not None else {}).encode("utf-8")
+            self._file = open(filename, "wb")
+            self._file.write(MAGIC + _count_struct.pack(len(header_bytes)) + header_bytes)
+
+    def record(self, day_index: int, priority: int, activity_id: int, rows, outcomes, weights=None, keys=None):
+        """
+        Record one round of candidates for an activity.
+        Args:
+            day_index (int)
+            priority (int)
+            activity_id (int)
+            rows ([int]): candidate rows
+            outcomes (int or [int]): outcome of every candidate, or one outcome for all of them
+            weights ([float]): lottery weights, or None if there was no lottery
+            keys ([float]): lottery keys, or None if there was no lottery
+        """
+        count = len(rows)
+        if count == 0:
+            return
+        columns = self.columns
+        columns["day_index"].extend([day_index] * count)
+        columns["priority"].extend([priority] * count)
+        columns["activity_id"].extend([activity_id] * count)
+        columns["row"].extend(rows)
+        columns["weight"].extend(weights if weights is not None else [math.nan] * count)
+        columns["key"].extend(keys if keys is not None else [math.nan] * count)
+        columns["outcome"].extend([outcomes] * count if isinstance(outcomes, int) else outcomes)
+        if self._file is not None and len(columns["row"]) >= _BLOCK_RECORDS:
+            self.flush()
+
+    def extend(self, other):
+        """
+        Add the records of another LotteryTrace, e.g. from a worker process.
+        """
+        for name, column in other.columns.items():
+            self.columns[name].extend(column)
+        if self._file is not None and len(self.columns["row"]) >= _BLOCK_RECORDS:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered records to the file as one block.
+        """
+        count = len(self.columns["row"])
+        if self._file is None or count == 0:
+            return
+        self._file.write(_count_struct.pack(count))
+        for name, typecode in _COLUMNS:
+            column = self.columns[name]
+            if sys.byteorder != "little":
+                column.byteswap()
+            self._file.write(column.tobytes())
+            self.columns[name] = array(typecode)
+
+    def close(self):
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # Pickle only the records, so a worker's trace can be returned to the parent process.
+    def __getstate__(self):
+        return {"columns": self.columns, "_file": None}
+
+class _DisabledLotteryTrace:
+    """
+    Stand-in for LotteryTrace while tracing is disabled. Every method does nothing.
+    """
+    enabled = False
+
+    def record(self, day_index: int, priority: int, activity_id: int, rows, outcomes, weights=None, keys=None):
+        pass
+
+    def extend(self, other):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+_disabled_trace = _DisabledLotteryTrace()
+_trace = ContextVar("lottery_trace", default=_disabled_trace) #Per thread or asyncio task, as concurrent runs each trace their own.
+
+def get_trace():
+    """
+    Returns: LotteryTrace: the active LotteryTrace of this thread or task, or a do-nothing stand-in if tracing is disabled.
+    """
+    return _trace.get()
+
+def enable_trace(filename: str = None, student_table: StudentTable = None, **run_info) -> LotteryTrace:
+    """
+    Start recording lottery decisions in a new LotteryTrace, and return it.
+    Args:
+        filename (str): trace file name, or None to keep the records in memory.
+        student_table (StudentTable): students to name in the file header.
+        run_info: other JSON values to save in the file header, e.g. the seed.
+    """
+    header = dict(run_info)
+    if student_table is not None:
+        header["activity_names"] = list(student_table.activity_names)
+        header["students"] = [[student_id, first_name, last_name] for student_id, first_name, last_name
+                              in zip(student_table.student_ids, student_table.first_names, student_table.last_names)]
+    trace = LotteryTrace(filename, header)
+    _trace.set(trace)
+    return trace
+
+def disable_trace():
+    """
+    Write any buffered records, and stop tracing.
+    """
+    _trace.get().close()
+    _trace.set(_disabled_trace)
+
+def read_trace(filename: str) -> (dict, dict):
+    """
+    Read a trace file.
+    Args:
+        filename (str)
+    Returns:
+        tuple: (dict header, dict columns: key: field name, value: array of all records)
+    """
+    columns = {name: array(typecode) for name, typecode in _COLUMNS}
+    with open(filename, "rb") as trace_file:
+        if trace_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(filename + " is not a lottery trace file")
+        header_length = _count_struct.unpack(trace_file.read(_count_struct.size))[0]
+        header = json.loads(trace_file.read(header_length).decode("utf-8"))
+        while len(count_bytes := trace_file.read(_count_struct.size)) == _count_struct.size:
+            count = _count_struct.unpack(count_bytes)[0]
+            for name, typecode in _COLUMNS:
+                block_column = array(typecode)
+                block_column.frombytes(trace_file.read(count * block_column.itemsize))
+                if sys.byteorder != "little":
+                    block_column.byteswap()
+                columns[name].extend(block_column)
+    return header, columns
+
+def _describe_record(columns: dict, i: int, activity_names: [str], group_stats: dict) -> str:
+    """
+    Returns: str: one line explaining record i.
+    """
+    day = DAYS[columns["day_index"][i]].capitalize()
+    priority = columns["priority"][i]
+    activity_id = columns["activity_id"][i]
+    activity_name = activity_names[activity_id] if 0 <= activity_id < len(activity_names) else "(no activity)"
+    outcome = columns["outcome"][i]
+    prefix = f"{day}, choice {priority}, {activity_name}: "
+    if outcome in (OUTCOME_LOST, OUTCOME_WON):
+        winner_count, candidate_count, cutoff_key = group_stats[(columns["day_index"][i], priority, activity_id)]
+        result = "won" if outcome == OUTCOME_WON else "lost"
+        return (prefix + f"{result} the lottery with key {columns['key'][i]:.6g} (weight {columns['weight'][i]:.6g}). "
+                f"{winner_count} of {candidate_count} candidates won; the highest winning key was {cutoff_key:.6g}.")
+    if outcome == OUTCOME_NO_LOTTERY:
+        return prefix + "selected; every candidate fit under the cap, so there was no lottery."
+    if outcome == OUTCOME_FULL:
+        return prefix + "not selected; the activity was already full before this round."
+    if outcome == OUTCOME_FLOW:
+        return (f"{day}: placed in {activity_name} (choice {priority}) by the optimal engine, "
+                f"in lottery order by key {columns['key'][i]:.6g} (weight {columns['weight'][i]:.6g}).")
+    if outcome == OUTCOME_MANUAL:
+        return (f"{day}: requires manual assignment; the optimal engine found no seat for any choice, "
+                f"in lottery order by key {columns['key'][i]:.6g} (weight {columns['weight'][i]:.6g}).")
+    return prefix + f"unknown outcome {outcome}."
+
+def explain(header: dict, columns: dict, rows: [int], activity_name: str = None, day: str = None) -> [str]:
+    """
+    Explain the recorded decisions for the passed student rows, optionally only for one activity and/or day.
+    Args:
+        header (dict): from read_trace()
+        columns (dict): from read_trace()
+        rows ([int]): student rows
+        activity_name (str): activity name, or None for all activities
+        day (str): day, or None for all days
+    Returns:
+        [str]: lines of text
+    """
+    activity_names = header.get("activity_names", [])
+    students = header.get("students", [])
+    activity_ids = None
+    if activity_name is not None:
+        activity_ids = {activity_id for activity_id, name in enumerate(activity_names) if name.casefold() == activity_name.casefold()}
+    day_index = day_index_of(day) if day is not None else None
+
+    def is_wanted(i) -> bool:
+        return (day_index is None or columns["day_index"][i] == day_index) and \
+            (activity_ids is None or columns["activity_id"][i] in activity_ids or columns["outcome"][i] == OUTCOME_MANUAL)
+
+    # Find the records of the wanted rows, then summarize each lottery they were in.
+    row_set = set(rows)
+    record_indexes = [i for i, row in enumerate(columns["row"]) if row in row_set and is_wanted(i)]
+    lotteries = {(columns["day_index"][i], columns["priority"][i], columns["activity_id"][i])
+                 for i in record_indexes if columns["outcome"][i] in (OUTCOME_LOST, OUTCOME_WON)}
+    group_stats = {}
+    for i in range(len(columns["row"])):
+        lottery = (columns["day_index"][i], columns["priority"][i], columns["activity_id"][i])
+        if columns["outcome"][i] in (OUTCOME_LOST, OUTCOME_WON) and lottery in lotteries:
+            winner_count, candidate_count, cutoff_key = group_stats.get(lottery, (0, 0, -math.inf))
+            if columns["outcome"][i] == OUTCOME_WON:
+                winner_count += 1
+                cutoff_key = max(cutoff_key, columns["key"][i])
+            group_stats[lottery] = (winner_count, candidate_count + 1, cutoff_key)
+
+    lines = []
+    for row in rows:
+        student_id, first_name, last_name = students[row] if row < len(students) else (row, "", "")
+        lines.append(f"{first_name} {last_name} (student {student_id}):")
+        row_record_indexes = [i for i in record_indexes if columns["row"][i] == row]
+        for i in row_record_indexes:
+            lines.append("  " + _describe_record(columns, i, activity_names, group_stats))
+        if len(row_record_indexes) == 0:
+            lines.append("  No decisions recorded. The student did not choose " +
+                         (activity_name if activity_name is not None else "any activity") +
+                         (" on " + day if day is not None else "") +
+                         ", or was already assigned an earlier choice that day.")
+    return lines
+
+def find_rows(header: dict, student_name: str = None, student_id: int = None) -> [int]:
+    """
+    Returns: [int]: rows of the students with the passed "First Last" name (case-insensitive) or student_id.
+    """
+    rows = []
+    for row, (row_student_id, first_name, last_name) in enumerate(header.get("students", [])):
+        if student_id is not None and row_student_id == student_id:
+            rows.append(row)
+        elif student_name is not None and (first_name + " " + last_name).casefold() == " ".join(student_name.split()).casefold():
+            rows.append(row)
+    return rows
+
+def main():
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="innovation_lab_assignments.lottery_trace",
+                                         description="Explains why a student did or did not get an activity, from a --trace file.")
+    arg_parser.add_argument("trace_file", metavar="<trace file>", help="Trace file written by --trace")
+    student_group = arg_parser.add_mutually_exclusive_group(required=True)
+    student_group.add_argument("--student", metavar="NAME", help='Student name, as "First Last"')
+    student_group.add_argument("--student-id", type=int, metavar="N", help="Student id")
+    arg_parser.add_argument("--activity", metavar="NAME", help="Only explain this activity")
+    arg_parser.add_argument("--day", choices=[day.capitalize() for day in DAYS], help="Only explain this day")
+    args = arg_parser.parse_args()
+
+    header, columns = read_trace(args.trace_file)
+    rows = find_rows(header, args.student, args.student_id)
+    if len(rows) == 0:
+        print("No student found in " + args.trace_file)
+        return 1
+    for line in explain(header, columns, rows, args.activity, args.day):
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
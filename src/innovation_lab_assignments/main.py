@@ -1,5 +1,6 @@
 from innovation_lab_assignments.functions import *
 from innovation_lab_assignments.classes import Config
+from innovation_lab_assignments.metrics import get_metrics, enable_metrics
 from my_utilities import init_log
 import logging
 
@@ -10,15 +11,23 @@ log_file_name = "innovation_lab_assignment.log"
 
 def main():
     config = Config.get_instance()
-    init_log(prepend_project_root_if_required(log_file_name, config.project_root), logging_level=logging.DEBUG, truncate_log=True)
+    init_log(prepend_project_root_if_required(log_file_name, config.project_root), logging_level=logging.INFO, truncate_log=True)
 
     config.parse_cmd_line_args()
+    if config.debug:
+        logging.getLogger().setLevel(logging.DEBUG)
+    if config.metrics_file_name is not None:
+        enable_metrics()
 
-    config.load_config()
+    with get_metrics().span("load_config"):
+        config.load_config()
     logging.info("Config file contents:\n" + str(config.json_data))
     if len(config.json_data) == 0:
         return die()
 
     main_loop()
 
+    if config.metrics_file_name is not None:
+        get_metrics().write(config.metrics_file_name)
+
     logging.info("Done")
\ No newline at end of file
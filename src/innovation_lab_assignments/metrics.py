@@ -0,0 +1,143 @@
+"""
+Per-phase timing instrumentation and counters for assignment runs.
+Metrics are disabled unless enable_metrics() is called (--metrics FILE). While disabled, get_metrics()
+returns a shared do-nothing instance, so instrumented code costs one method call per span or count.
+The active Metrics is a context variable, so concurrent runs in other threads or asyncio tasks each have their own.
+"""
+import json
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+class _Span:
+    """
+    Context manager that adds its elapsed time to a Metrics span.
+    """
+    __slots__ = ("_metrics", "_key", "_start_time")
+
+    def __init__(self, metrics, key):
+        self._metrics = metrics
+        self._key = key
+        self._start_time = 0.0
+
+    def __enter__(self):
+        self._start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._metrics.add_span_time(self._key, time.perf_counter() - self._start_time)
+        return False
+
+class Metrics:
+    """
+    Span timings and counters for one run.
+    Spans with the same name and labels are summed, e.g. every lottery for the same day and priority.
+    Attributes:
+        spans (dict): key: (name, labels tuple), value: [count, total seconds]
+        counters (dict): key: name, value: int
+    """
+    enabled = True
+
+    def __init__(self):
+        self.spans = {}
+        self.counters = {}
+
+    def span(self, name: str, **labels):
+        """
+        Returns: context manager that times the code it wraps.
+        """
+        return _Span(self, (name, tuple(sorted(labels.items()))))
+
+    def add_span_time(self, key, seconds: float):
+        span = self.spans.get(key)
+        if span is None:
+            span = self.spans[key] = [0, 0.0]
+        span[0] += 1
+        span[1] += seconds
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other):
+        """
+        Add another Metrics' spans and counters, e.g. from a worker process, to this one.
+        """
+        for key, (count, seconds) in other.spans.items():
+            span = self.spans.setdefault(key, [0, 0.0])
+            span[0] += count
+            span[1] += seconds
+        for name, amount in other.counters.items():
+            self.count(name, amount)
+
+    def to_dict(self) -> dict:
+        """
+        Returns: dict: suitable for saving to a .json file.
+        """
+        return {"spans": [{"name": name, "labels": dict(labels), "count": count, "seconds": seconds}
+                          for (name, labels), (count, seconds) in self.spans.items()],
+                "counters": dict(self.counters)}
+
+    def to_prometheus(self) -> str:
+        """
+        Returns: str: Prometheus text exposition format.
+        """
+        def _labels_str(labels) -> str:
+            return ",".join(f'{label}="{str(value).replace(chr(34), chr(39))}"' for label, value in labels)
+
+        lines = ["# TYPE innovation_lab_span_seconds_total counter"]
+        for (name, labels), (count, seconds) in self.spans.items():
+            lines.append(f'innovation_lab_span_seconds_total{{span="{name}"{"," if labels else ""}{_labels_str(labels)}}} {seconds}')
+        lines.append("# TYPE innovation_lab_span_count_total counter")
+        for (name, labels), (count, seconds) in self.spans.items():
+            lines.append(f'innovation_lab_span_count_total{{span="{name}"{"," if labels else ""}{_labels_str(labels)}}} {count}')
+        for name, amount in self.counters.items():
+            lines.append(f"# TYPE innovation_lab_{name}_total counter")
+            lines.append(f"innovation_lab_{name}_total {amount}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename: str):
+        """
+        Write the metrics to filename. Files ending in .prom or .txt get Prometheus text format, others get JSON.
+        """
+        with open(filename, "w") as output_file:
+            if filename.endswith((".prom", ".txt")):
+                output_file.write(self.to_prometheus())
+            else:
+                # noinspection PyTypeChecker
+                json.dump(self.to_dict(), output_file, indent=2)
+
+class _DisabledMetrics:
+    """
+    Stand-in for Metrics while metrics are disabled. Every method does nothing.
+    """
+    enabled = False
+    _null_span = nullcontext()
+
+    def span(self, name: str, **labels):
+        return self._null_span
+
+    def count(self, name: str, amount: int = 1):
+        pass
+
+    def merge(self, other):
+        pass
+
+_disabled_metrics = _DisabledMetrics()
+_metrics = ContextVar("metrics", default=_disabled_metrics)
+
+def get_metrics():
+    """
+    Returns: Metrics: the active Metrics of this thread or task, or a do-nothing stand-in if metrics are disabled.
+    """
+    return _metrics.get()
+
+def enable_metrics() -> Metrics:
+    """
+    Start collecting metrics in a new Metrics, and return it. Other threads do not collect in it.
+    """
+    metrics = Metrics()
+    _metrics.set(metrics)
+    return metrics
+
+def disable_metrics():
+    _metrics.set(_disabled_metrics)
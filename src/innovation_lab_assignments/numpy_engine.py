@@ -0,0 +1,161 @@
+"""
+Optional NumPy assignment backend.
+A whole (day, priority) round is resolved with array operations over the StudentTable columns,
+instead of looping over students and choices in Python.
+Given the same random values, the assignment is the same as assign_sheet_activities().
+"""
+import logging
+from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.metrics import get_metrics
+from innovation_lab_assignments.lottery_trace import get_trace, OUTCOME_LOST, OUTCOME_WON, OUTCOME_NO_LOTTERY, OUTCOME_FULL
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def is_numpy_available() -> bool:
+    """
+    Returns: bool: True if NumPy can be imported.
+    """
+    return np is not None
+
+class StudentArrays:
+    """
+    NumPy views of a StudentTable's columns. No data is copied, so setting selections
+    here also sets them in the StudentTable.
+    Attributes:
+        choices (ndarray): Activity ids, shape (students, days, 3)
+        selections (ndarray): int8 selection priorities, shape (students, days)
+        timestamps (ndarray): float64 seconds since 1970-01-01
+        base_weights (ndarray): float64 lottery weights from the timestamps
+        in_athletics (ndarray): bool
+        weight_rules (WeightRules): the run's compiled weight rules
+        history_weights (HistoryWeights): the run's history weights, or None
+    """
+    def __init__(self, table: StudentTable, context=None):
+        """
+        Args:
+            table (StudentTable)
+            context (RunContext): Defaults to random_select.default_context().
+        """
+        from innovation_lab_assignments.random_select import default_context
+        if context is None:
+            context = default_context()
+        student_count = len(table)
+        choices_dtype = np.dtype(f"i{table.choices.itemsize}")
+        self.choices = np.frombuffer(table.choices, dtype=choices_dtype).reshape(student_count, len(DAYS), 3)
+        self.selections = np.frombuffer(table.selections, dtype=np.int8).reshape(student_count, len(DAYS))
+        self.timestamps = np.frombuffer(table.timestamps, dtype=np.float64)
+        self.base_weights = np.frombuffer(table.base_weights_for(context.reference_time), dtype=np.float64)
+        self.in_athletics = np.frombuffer(table.in_athletics, dtype=np.bool_)
+        self.weight_rules = context.weight_rules
+        self.history_weights = context.history_weights
+
+def _lottery_weights_and_keys(candidate_rows, student_table: StudentTable, student_arrays: StudentArrays, activity: Activity, rng):
+    """
+    Vectorized lottery_weights_and_keys(). One random value is drawn per candidate, in row order.
+    Args:
+        candidate_rows (ndarray): rows of the candidates, in ascending order
+        student_table (StudentTable)
+        student_arrays (StudentArrays): arrays of student_table
+        activity (Activity)
+        rng (random.Random): source of random values
+    Returns:
+        tuple: (ndarray weights, ndarray keys)
+    """
+    weights = student_arrays.base_weights[candidate_rows]
+    activity_weights = student_arrays.weight_rules.for_activity(activity.name)
+    if activity_weights is not None:
+        weights = activity_weights.apply_array(student_table, candidate_rows, weights)
+    if student_arrays.history_weights is not None:
+        weights = student_arrays.history_weights.apply_array(candidate_rows, activity.name, weights)
+    random_values = np.fromiter((rng.random() for _ in range(len(candidate_rows))), dtype=np.float64, count=len(candidate_rows))
+    return weights, weights * random_values
+
+def _select_winners_by_key(candidate_rows, keys, remaining_cap: int):
+    """
+    Vectorized select_winners_by_key(). The remaining_cap smallest keys win. Ties are broken by row, as the stable sort would.
+    Args:
+        candidate_rows (ndarray): rows of the candidates, in ascending order
+        keys (ndarray): lottery key of each candidate
+        remaining_cap (int)
+    Returns:
+        ndarray: rows of the winners, in lottery order
+    """
+    # argpartition() finds the cut-off key without sorting every candidate.
+    cutoff_key = keys[np.argpartition(keys, remaining_cap - 1)[remaining_cap - 1]]
+    below_cutoff = np.flatnonzero(keys < cutoff_key)
+    at_cutoff = np.flatnonzero(keys == cutoff_key)[0: remaining_cap - len(below_cutoff)]
+    winners = np.concatenate((below_cutoff, at_cutoff))
+    # Order the winners by key, then by row.
+    winners = winners[np.lexsort((winners, keys[winners]))]
+    return candidate_rows[winners]
+
+def assign_sheet_activities_numpy(sheet_rec: SheetRec, student_table: StudentTable, lottery_rng, context=None):
+    """
+    NumPy version of assign_sheet_activities().
+    For each priority round, the still-available students are grouped by their choice for that priority
+    with one stable argsort, then each activity's group is capped by lottery.
+    Args:
+        sheet_rec (SheetRec): sheet (day) to assign.
+        student_table (StudentTable): all students.
+        lottery_rng (LotteryRng): source of each lottery's random values.
+        context (RunContext): the run's weighting. Defaults to random_select.default_context().
+    """
+    from innovation_lab_assignments.functions import debug_log_unselected_students
+
+    student_arrays = StudentArrays(student_table, context)
+    day_index = day_index_of(sheet_rec.day)
+    is_debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    metrics = get_metrics()
+    trace = get_trace()
+
+    for priority in range(1, 4):
+        with metrics.span("assign_round", day=sheet_rec.day, priority=priority):
+            # One vectorized pass is faster here than converting StudentTable.available_rows() to an array.
+            available_rows = np.flatnonzero(student_arrays.selections[:, day_index] == 0)
+            chosen_ids = student_arrays.choices[available_rows, day_index, priority - 1]
+            # Group the available rows by chosen activity id. The stable sort keeps each group in row order.
+            order = np.argsort(chosen_ids, kind="stable")
+            sorted_ids = chosen_ids[order]
+            group_ids, group_starts, group_counts = np.unique(sorted_ids, return_index=True, return_counts=True)
+            candidates_by_id = {int(group_id): available_rows[order[start: start + count]]
+                                for group_id, start, count in zip(group_ids, group_starts, group_counts)}
+
+            for activity in sheet_rec.activities:
+                activity_id = student_table.activity_id(activity.name)
+                candidate_rows = candidates_by_id.get(activity_id)
+                if candidate_rows is None or len(candidate_rows) == 0:
+                    continue
+                if len(activity.students) >= activity.cap:
+                    if trace.enabled:
+                        trace.record(day_index, priority, activity_id, candidate_rows.tolist(), OUTCOME_FULL)
+                else:
+                    metrics.count("candidates_scanned", len(candidate_rows))
+                    remaining_cap = activity.cap - len(activity.students)
+                    selected_rows = candidate_rows
+                    if len(candidate_rows) > remaining_cap:
+                        with metrics.span("lottery", day=sheet_rec.day, priority=priority):
+                            weights, keys = _lottery_weights_and_keys(candidate_rows, student_table, student_arrays, activity,
+                                                                      lottery_rng.substream(sheet_rec.day, priority, activity.name))
+                            selected_rows = _select_winners_by_key(candidate_rows, keys, remaining_cap)
+                        metrics.count("lotteries_run")
+                        metrics.count("students_capped_out", len(candidate_rows) - len(selected_rows))
+                        if trace.enabled:
+                            outcomes = np.where(np.isin(candidate_rows, selected_rows), OUTCOME_WON, OUTCOME_LOST)
+                            trace.record(day_index, priority, activity_id, candidate_rows.tolist(), outcomes.tolist(),
+                                         weights.tolist(), keys.tolist())
+                        # An activity may be listed twice for a day. Leave the losers for its next listing.
+                        candidates_by_id[activity_id] = np.setdiff1d(candidate_rows, selected_rows, assume_unique=True)
+                    else:
+                        if trace.enabled:
+                            trace.record(day_index, priority, activity_id, candidate_rows.tolist(), OUTCOME_NO_LOTTERY)
+                        candidates_by_id[activity_id] = candidate_rows[0:0]
+
+                    selected_rows = selected_rows.tolist()
+                    student_table.mark_selected(selected_rows, day_index, priority)
+                    activity.students.extend(student_table.student(row) for row in selected_rows)
+
+        if is_debug:
+            debug_log_unselected_students(student_table, sheet_rec.day, priority)
@@ -0,0 +1,188 @@
+"""
+Optimal assignment engine.
+Instead of filling priority rounds greedily, each day is solved as a min-cost flow problem:
+students -> their three choices (cost = priority) -> activities (capacity = Activity.cap),
+with manual assignment as a costly overflow. The result has the fewest students requiring
+manual assignment, and among those assignments, the lowest total choice priority.
+
+Students are added one at a time in weighted lottery order, and each is routed along the shortest
+path in the residual graph (successive shortest paths), which keeps the flow min-cost after every student.
+Moving a student between two activities only depends on the activities, so shortest paths are found
+over a graph of just the day's activities, not the students.
+"""
+import heapq
+from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.metrics import get_metrics
+from innovation_lab_assignments.lottery_trace import get_trace, OUTCOME_FLOW, OUTCOME_MANUAL
+
+def _manual_assignment_cost(activity_count: int) -> int:
+    """
+    Cost of a student requiring manual assignment. A shortest path moves at most one student out of each activity,
+    each move costing at most 2, so any path to an open seat is cheaper than manual assignment.
+    """
+    return 2 * activity_count + 4
+
+class _DayFlow:
+    """
+    Residual flow state of one day.
+    Node i < activity_count is the i-th distinct activity of the sheet; node activity_count is manual assignment.
+    """
+    def __init__(self, activity_caps: [int], manual_cost: int):
+        self.node_count = len(activity_caps) + 1
+        self.manual_node = len(activity_caps)
+        self.caps = activity_caps + [sys.maxsize]
+        self.manual_cost = manual_cost
+        self.node_rows = [dict() for _ in range(self.node_count)] #Rows in each node, in insertion order.
+        self.row_node = {} #key: row, value: node
+        self.row_costs = {} #key: row, value: {node: cost}
+        self.row_orders = {} #key: row, value: lottery order
+        # Heaps of (cost of moving a row from node a to node b, -lottery order, row), for rows in node a.
+        # On equal cost, the row latest in the lottery is moved, so lottery winners keep their choices.
+        self._move_heaps = [[[] for _ in range(self.node_count)] for _ in range(self.node_count)]
+
+    def _move_cost(self, from_node: int, to_node: int):
+        """
+        Return (cost, row) of the cheapest move of a row from from_node to to_node, or None if no row can move.
+        """
+        move_heap = self._move_heaps[from_node][to_node]
+        # Entries are removed lazily: skip rows that are no longer in from_node.
+        while len(move_heap) > 0 and self.row_node.get(move_heap[0][2]) != from_node:
+            heapq.heappop(move_heap)
+        if len(move_heap) == 0:
+            return None
+        return move_heap[0][0], move_heap[0][2]
+
+    def _place(self, row: int, node: int):
+        previous_node = self.row_node.get(row)
+        if previous_node is not None:
+            del self.node_rows[previous_node][row]
+        self.row_node[row] = node
+        self.node_rows[node][row] = None
+        row_costs = self.row_costs[row]
+        negative_order = -self.row_orders[row]
+        for other_node, cost in row_costs.items():
+            if other_node != node:
+                heapq.heappush(self._move_heaps[node][other_node], (cost - row_costs[node], negative_order, row))
+
+    def add_row(self, row: int, choice_costs: dict, lottery_order: int):
+        """
+        Route one more row along the shortest path of the residual graph.
+        Args:
+            row (int): student row
+            choice_costs (dict): key: node, value: cost, for each of the student's choices in this day
+            lottery_order (int): the student's position in the lottery, used to break ties
+        """
+        manual_node = self.manual_node
+        row_costs = dict(choice_costs)
+        row_costs[manual_node] = self.manual_cost
+        self.row_costs[row] = row_costs
+        self.row_orders[row] = lottery_order
+
+        # Bellman-Ford from the new row over the activity graph.
+        # Edges between nodes are moves of already-placed rows, and cannot form negative cycles.
+        distances = [None] * self.node_count
+        predecessors = [None] * self.node_count #(previous node, moved row)
+        for node, cost in row_costs.items():
+            distances[node] = cost
+        move_costs = [[self._move_cost(from_node, to_node) if from_node != to_node else None
+                       for to_node in range(self.node_count)]
+                      for from_node in range(self.node_count)]
+        for _ in range(self.node_count):
+            is_changed = False
+            for from_node in range(self.node_count):
+                if distances[from_node] is None:
+                    continue
+                for to_node, move_cost in enumerate(move_costs[from_node]):
+                    if move_cost is not None:
+                        distance = distances[from_node] + move_cost[0]
+                        if distances[to_node] is None or distance < distances[to_node]:
+                            distances[to_node] = distance
+                            predecessors[to_node] = (from_node, move_cost[1])
+                            is_changed = True
+            if not is_changed:
+                break
+
+        # The path ends at the cheapest node with a free seat. Manual assignment always has one.
+        end_node = manual_node
+        for node in range(manual_node):
+            if distances[node] is not None and len(self.node_rows[node]) < self.caps[node] \
+                    and distances[node] < distances[end_node]:
+                end_node = node
+
+        # Walk the path backwards, moving each displaced row forward one node.
+        node = end_node
+        while predecessors[node] is not None:
+            previous_node, moved_row = predecessors[node]
+            self._place(moved_row, node)
+            node = previous_node
+        self._place(row, node)
+
+def assign_sheet_activities_optimal(sheet_rec: SheetRec, student_table: StudentTable, lottery_rng, context=None):
+    """
+    Optimal version of assign_sheet_activities(). The students still available for the sheet's day
+    are ordered by weighted lottery, then added to a min-cost flow one at a time.
+    Args:
+        sheet_rec (SheetRec): sheet (day) to assign.
+        student_table (StudentTable): all students.
+        lottery_rng (LotteryRng): source of lottery random values.
+        context (RunContext): the run's weighting. Defaults to random_select.default_context().
+    """
+    from innovation_lab_assignments.random_select import _activity_weights, default_context
+    if context is None:
+        context = default_context() #Once, rather than once per first choice.
+
+    day_index = day_index_of(sheet_rec.day)
+    # Map each activity id of the sheet to a node. If an activity is listed twice, the first listing is used.
+    activity_nodes = {}
+    node_activities = []
+    for activity in sheet_rec.activities:
+        activity_id = student_table.activity_id(activity.name)
+        if activity_id not in activity_nodes:
+            activity_nodes[activity_id] = len(node_activities)
+            node_activities.append(activity)
+
+    day_flow = _DayFlow([activity.cap - len(activity.students) for activity in node_activities],
+                        _manual_assignment_cost(len(node_activities)))
+
+    # Order the available students by lottery. Each is weighted as in the lottery for their first choice.
+    # The weights are calculated in one batch per first choice, then the random values are drawn in row order.
+    rng = lottery_rng.substream(sheet_rec.day, 0, "optimal")
+    other_activity = Activity({"activity": "", "cap": 0})
+    first_choice_rows = {} #key: first choice node (None if not on the sheet), value: [row]
+    available_rows = list(student_table.available_rows(day_index))
+    for row in available_rows:
+        first_choice_node = activity_nodes.get(student_table.choice_id(row, day_index, 1))
+        first_choice_rows.setdefault(first_choice_node, []).append(row)
+    row_weights = {}
+    for first_choice_node, rows in first_choice_rows.items():
+        first_choice = node_activities[first_choice_node] if first_choice_node is not None else other_activity
+        row_weights.update(zip(rows, _activity_weights([student_table.student(row) for row in rows], first_choice, context)))
+    lottery_keys = [(row_weights[row] * rng.random(), row) for row in available_rows]
+    lottery_keys.sort()
+
+    metrics = get_metrics()
+    metrics.count("candidates_scanned", len(lottery_keys))
+    with metrics.span("assign_flow", day=sheet_rec.day):
+        for lottery_order, (ignored_key, row) in enumerate(lottery_keys):
+            choice_costs = {}
+            for priority in range(3, 0, -1):
+                node = activity_nodes.get(student_table.choice_id(row, day_index, priority))
+                if node is not None:
+                    choice_costs[node] = priority
+            day_flow.add_row(row, choice_costs, lottery_order)
+
+    for node, activity in enumerate(node_activities):
+        for row in day_flow.node_rows[node]:
+            activity.students.append(student_table.student(row))
+            student_table.set_selection(row, day_index, day_flow.row_costs[row][node])
+
+    trace = get_trace()
+    if trace.enabled:
+        # Record every student's placement, in lottery order.
+        for lottery_key, row in lottery_keys:
+            node = day_flow.row_node[row]
+            if node == day_flow.manual_node:
+                trace.record(day_index, 0, -1, [row], OUTCOME_MANUAL, [row_weights[row]], [lottery_key])
+            else:
+                trace.record(day_index, day_flow.row_costs[row][node], student_table.activity_id(node_activities[node].name),
+                             [row], OUTCOME_FLOW, [row_weights[row]], [lottery_key])
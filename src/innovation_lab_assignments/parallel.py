@@ -0,0 +1,88 @@
+"""
+Assign each sheet (day) in its own worker process.
+Each sheet only reads and writes its own day's selections and its own activities,
+so the sheets are independent, and the per-day results are merged back in the parent process.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.metrics import get_metrics, enable_metrics
+from innovation_lab_assignments.lottery_trace import get_trace, enable_trace
+
+# Worker process state, set once per worker by _init_worker().
+_worker_student_table = None
+_worker_context = None
+
+def _init_worker(student_table: StudentTable, context, is_metrics_enabled: bool, is_trace_enabled: bool):
+    """
+    Worker process initializer. The student table is sent once per worker instead of once per sheet.
+    The run's RunContext is copied from the parent, so every worker weights students alike.
+    """
+    global _worker_student_table, _worker_context
+    _worker_student_table = student_table
+    _worker_context = context
+    if is_metrics_enabled:
+        enable_metrics()
+    if is_trace_enabled:
+        enable_trace()
+
+def _assign_sheet_in_worker(sheet_dict: dict, lottery_rng, engine: str):
+    """
+    Assign one sheet in a worker process.
+    Args:
+        sheet_dict (dict): sheet from the config file
+        lottery_rng (LotteryRng): source of each lottery's random values
+        engine (str)
+    Returns:
+        tuple: ([[int]] assigned rows per activity, array day selections column, Metrics or None, LotteryTrace or None)
+    """
+    from innovation_lab_assignments.functions import assign_sheet
+    metrics = enable_metrics() if get_metrics().enabled else None #New Metrics for just this sheet.
+    trace = enable_trace() if get_trace().enabled else None #In-memory trace of just this sheet, written by the parent.
+    sheet_rec = SheetRec(sheet_dict)
+    assign_sheet(sheet_rec, _worker_student_table, engine, lottery_rng, context=_worker_context)
+    activity_rows = [[student.row for student in activity.students] for activity in sheet_rec.activities]
+    day_index = day_index_of(sheet_rec.day)
+    return activity_rows, _worker_student_table.selections[day_index::len(DAYS)], metrics, trace
+
+def assign_sheets_in_parallel(sheet_recs: [SheetRec], student_table: StudentTable, lottery_rng, engine: str, jobs: int,
+                              context=None):
+    """
+    Assign every sheet_rec in a pool of worker processes, then merge each sheet's assigned students
+    and day selections into the passed sheet_recs and student_table.
+    Sheets for the same day depend on each other, so they are assigned one after another instead.
+    Args:
+        sheet_recs ([SheetRec])
+        student_table (StudentTable)
+        lottery_rng (LotteryRng): source of each lottery's random values
+        engine (str)
+        jobs (int): maximum number of worker processes
+        context (RunContext): the run's weighting. Defaults to random_select.default_context().
+    """
+    from innovation_lab_assignments.functions import assign_sheet
+    from innovation_lab_assignments.random_select import default_context
+    if context is None:
+        context = default_context()
+
+    day_indexes = [day_index_of(sheet_rec.day) for sheet_rec in sheet_recs]
+    if len(set(day_indexes)) != len(day_indexes):
+        logging.warning("More than one sheet for the same day. Sheets are assigned one after another.")
+        for sheet_rec in sheet_recs:
+            assign_sheet(sheet_rec, student_table, engine, lottery_rng, context=context)
+        return
+
+    # Sheets are rebuilt from their config dicts in the workers; only rows come back.
+    sheet_dicts = [{"day": sheet_rec.day,
+                    "activities": [{"activity": activity.name, "cap": activity.cap} for activity in sheet_rec.activities]}
+                   for sheet_rec in sheet_recs]
+    init_args = (student_table, context, get_metrics().enabled, get_trace().enabled)
+    with ProcessPoolExecutor(max_workers=min(jobs, len(sheet_recs)), initializer=_init_worker, initargs=init_args) as executor:
+        futures = [executor.submit(_assign_sheet_in_worker, sheet_dict, lottery_rng, engine) for sheet_dict in sheet_dicts]
+        for sheet_rec, day_index, future in zip(sheet_recs, day_indexes, futures):
+            activity_rows, day_selections, worker_metrics, worker_trace = future.result()
+            if worker_metrics is not None:
+                get_metrics().merge(worker_metrics)
+            if worker_trace is not None:
+                get_trace().extend(worker_trace)
+            for activity, rows in zip(sheet_rec.activities, activity_rows):
+                activity.students.extend(student_table.student(row) for row in rows)
+            student_table.set_day_selections(day_index, day_selections)
@@ -1,8 +1,78 @@
+import hashlib
+import heapq
 import random
 from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.run_context import RunContext
 
 _current_time = datetime.now() #datetime(month=11, day=29, year=2024, hour=12, minute=0, second=0)
 
+def set_reference_time(reference_time: datetime):
+    """
+    Set the time that timestamp weights are calculated from, for lotteries without a RunContext.
+    Defaults to the time this module was imported. Pinning it (--reference-time) makes a run reproducible.
+    Args:
+        reference_time (datetime)
+    """
+    global _current_time
+    _current_time = reference_time
+
+def get_reference_time() -> datetime:
+    return _current_time
+
+_history_weights = None #HistoryWeights, or None without history weighting.
+
+def set_history_weights(history_weights):
+    """
+    Set the earlier terms' losses that adjust every lottery weight, after the weight rules, for lotteries without a RunContext.
+    None to stop adjusting.
+    Args:
+        history_weights (HistoryWeights): see run_store.load_history_weights()
+    """
+    global _history_weights
+    _history_weights = history_weights
+
+def get_history_weights():
+    return _history_weights
+
+def default_context() -> RunContext:
+    """
+    Return the RunContext of lotteries that are not passed one: the Config singleton's config,
+    with the reference time and history weights set in this module.
+    Returns:
+        RunContext
+    """
+    return RunContext(Config.get_instance()._get_compiled_config(), reference_time=_current_time, history_weights=_history_weights)
+
+class LotteryRng:
+    """
+    Reproducible source of lottery random values.
+    Each (day, priority, activity) lottery draws from its own random.Random substream, derived from the run's seed
+    by hashing. A lottery's values therefore do not depend on which lotteries ran before it, or in which process.
+    Attributes:
+        seed (int): run seed
+        generation (int): 0 for a full run. Each incremental run of the same seed uses the next generation,
+            so its lotteries draw new streams.
+    """
+    def __init__(self, seed: int, generation: int = 0):
+        self.seed = seed
+        self.generation = generation
+
+    def substream(self, day: str, priority: int, activity_name: str) -> random.Random:
+        """
+        Return a new random.Random for the passed lottery. The same arguments always return the same stream.
+        Args:
+            day (str)
+            priority (int)
+            activity_name (str)
+        Returns:
+            random.Random
+        """
+        lottery_key = f"{self.seed}|{day.lower()}|{priority}|{activity_name}"
+        if self.generation > 0:
+            lottery_key += f"|{self.generation}"
+        digest = hashlib.sha256(lottery_key.encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[0:8], "big"))
+
 def _calculate_weight_using_timestamp(input_timestamp: datetime):
     """
     Calculate difference between current_time and input_timestamp in seconds,
@@ -16,73 +86,91 @@ def _calculate_weight_using_timestamp(input_timestamp: datetime):
     # Add 1 to prevent division by zero, however unlikely.
     return max(1 / (time_diff_seconds + 1), 0)
 
-def _add_activity_weight(activity: Activity, student_with_weight_tuple):
+def _activity_weights(student_candidates: [Student], activity: Activity, context: RunContext = None) -> [float]:
     """
-    This function is unconditionally called to conditionally add an additional weight.
+    Return the lottery weight of every candidate for the passed activity: their base weight,
+    adjusted by the activity's compiled weight rules (see weight_rules.py) and the history weights in one batch.
     Args:
+        student_candidates ([Student]): students of the same StudentTable
         activity (Activity): activity to be considered.
-        student_with_weight_tuple (tuple): tuple from randomize_students()
+        context (RunContext): the run's config, reference time and history weights. Defaults to default_context().
     Returns:
-        float: activity_weight
-    """
-    activity_weight = student_with_weight_tuple[1] #Initialize returned activity weight to current weight.
-    # If the passed activity is in the match-case below,
-    # perform whatever action is needed to calculate a new activity_weight.
-    match activity.name:
-        case "Athletics":
-            activity_weight = _athletics_weight(student_with_weight_tuple)
-        # Any future activity weights can be added as additional cases.
-        #case "Robotics":
-        #    activity_weight = _robotics_weight()
-
-    return activity_weight
+        [float]: weights
+    """
+    if len(student_candidates) == 0:
+        return []
+    if context is None:
+        context = default_context()
+    student_table = student_candidates[0].table
+    base_weights = student_table.base_weights_for(context.reference_time)
+    rows = [student.row for student in student_candidates]
+    weights = [base_weights[row] for row in rows]
+    activity_weights = context.weight_rules.for_activity(activity.name)
+    if activity_weights is not None:
+        weights = activity_weights.apply(student_table, rows, weights)
+    if context.history_weights is not None:
+        weights = context.history_weights.apply(rows, activity.name, weights)
+    return weights
 
-def _athletics_weight(student_tuple):
+def randomize_students(student_candidates: [Student], activity: Activity, rng=random, context: RunContext = None) -> [Student]:
     """
-    If the passed student is in_athletics, add more weight to their weight.
+    Randomize the passed students. The full ordering is returned, so it can be used as a ranked waitlist.
+    Use select_lottery_winners() when only the winners are needed.
     Args:
-        student_tuple (tuple)
+        student_candidates ([Student])
+        activity (Activity)
+        rng (random.Random): source of random values. Defaults to the random module.
+        context (RunContext): Defaults to default_context().
     Returns:
-        float: adjusted_weight
-    """
-    student, weight = student_tuple
-    adjusted_weight = weight
-    if student.in_athletics:
-        weight_factor_key = "athletics"
-        weight_factor: float = Config.get_instance().get_weight_factor(weight_factor_key)
-        if weight_factor is None:
-            logging.error(f"Weight factor for {weight_factor_key} is None. Check {Config.get_instance().config_json_name}.")
-        else:
-            adjusted_weight = weight + weight_factor
-
-    return adjusted_weight
+        [Student]: List of randomized students.
+    """
+    # The random values are drawn in candidate order, as in select_lottery_winners(). The sort is stable.
+    weights, keys = lottery_weights_and_keys(student_candidates, activity, rng, context)
+    return [student_candidates[i] for i in sorted(range(len(keys)), key=keys.__getitem__)]
 
-def randomize_students(student_candidates: [Student], activity: Activity) -> [Student]:
+def select_lottery_winners(student_candidates: [Student], activity: Activity, remaining_cap: int, rng=random,
+                           context: RunContext = None) -> [Student]:
     """
-    Randomize the passed students.
+    Select remaining_cap students from the passed students by weighted lottery.
+    This is the same as randomize_students(student_candidates, activity)[0: remaining_cap],
+    but uses heap-based top-k selection in a single pass instead of sorting every candidate.
     Args:
         student_candidates ([Student])
         activity (Activity)
+        remaining_cap (int): How many students to select
+        rng (random.Random): source of random values. Defaults to the random module.
+        context (RunContext): Defaults to default_context().
     Returns:
-        [Student]: List of randomized students.
+        [Student]: The winners, in lottery order.
     """
-    # Create a list of tuples using each student and their calculated weights. Each tuple is a student and weight.
-    students_with_weights = [(student, _calculate_weight_using_timestamp(student.timestamp)) for student in student_candidates]
-
-    students_with_weights = [(student_tuple[0], _add_activity_weight(activity, student_tuple)) for student_tuple in students_with_weights]
-
-    # Multiply each weight by a random value.
-    students_with_weights = [(student, weight * random.random()) for student, weight in students_with_weights]
+    weights, keys = lottery_weights_and_keys(student_candidates, activity, rng, context)
+    return select_winners_by_key(student_candidates, keys, remaining_cap)
 
-    # Sort the tuples by weights.
-    # sorted() returns a new list (of above tuples in this case). The key is the weight part of the tuple.
-    sorted_students = sorted(students_with_weights, key=lambda student_tuple: student_tuple[1])
-    # Iterate sorted_students, with the student going to student, and the weight going to weight (which is ignored)
-    # during each iteration.
-    # Finally, create a list of just students (not the student tuples) using each student via list comprehension.
-    sorted_students = [student for student, ignored_weight in sorted_students]
-
-    # Randomize the sorted list
-    #random.shuffle(sorted_students)
+def lottery_weights_and_keys(student_candidates: [Student], activity: Activity, rng=random,
+                             context: RunContext = None) -> ([float], [float]):
+    """
+    Return every candidate's lottery weight and key, drawing the random values in the same order as select_lottery_winners().
+    Args:
+        student_candidates ([Student])
+        activity (Activity)
+        rng (random.Random): source of random values. Defaults to the random module.
+        context (RunContext): Defaults to default_context().
+    Returns:
+        tuple: ([float] weights, [float] keys)
+    """
+    weights = _activity_weights(student_candidates, activity, context)
+    keys = [weight * rng.random() for weight in weights]
+    return weights, keys
 
-    return sorted_students
\ No newline at end of file
+def select_winners_by_key(student_candidates: [Student], keys: [float], remaining_cap: int) -> [Student]:
+    """
+    Select the remaining_cap students with the smallest keys, in lottery order. Ties are broken by candidate order,
+    as a stable sort would.
+    Args:
+        student_candidates ([Student])
+        keys ([float]): lottery key of each candidate
+        remaining_cap (int): How many students to select
+    Returns:
+        [Student]: The winners, in lottery order.
+    """
+    return [student_candidates[i] for i in heapq.nsmallest(remaining_cap, range(len(keys)), key=keys.__getitem__)]
@@ -0,0 +1,110 @@
+"""
+Per-run settings.
+A RunContext holds everything one assignment run reads: its compiled config, its files, engine and seed,
+the reference time of its timestamp weights, and its history weights. main_loop(), the engines and the lottery
+functions take the run's RunContext explicitly, so runs in different threads or asyncio tasks of one process
+do not share any state, and starting a run does not reload or recompile anything.
+
+The Config singleton remains the command line's and the GUIs' settings. RunContext.from_config() takes a snapshot of it,
+and code that does not pass a RunContext gets random_select.default_context(): the singleton's config, with the reference time
+and history weights set by random_select.set_reference_time() and set_history_weights().
+"""
+from datetime import datetime
+from innovation_lab_assignments.classes import Config, SheetRec
+
+class RunContext:
+    """
+    Settings of one assignment run. Share a RunContext between runs only if they should weight students alike.
+    Attributes:
+        compiled_config (CompiledConfig): the run's config. See config_cache.py.
+        input_file_name (str)
+        output_dir_name (str)
+        engine (str): One of Config.engines
+        jobs (int): maximum number of worker processes
+        seed (int): lottery seed, or None for a new seed every run
+        reference_time (datetime): time that timestamp weights are calculated from
+        history_weights (HistoryWeights): earlier terms' losses, or None. See run_store.py.
+        no_cache (bool): True to always parse the input file
+        incremental (bool): True to only assign responses newer than the output directory's checkpoint
+        trace_file_name (str): lottery trace file, or None
+        store_file_name (str): SQLite run store, or None
+        term (str): term of the run in the store, or None for run_store.default_term()
+    """
+    def __init__(self, compiled_config, input_file_name: str = "", output_dir_name: str = "", engine: str = Config.engine_python,
+                 jobs: int = 1, seed: int = None, reference_time: datetime = None, history_weights=None, no_cache: bool = False,
+                 incremental: bool = False, trace_file_name: str = None, store_file_name: str = None, term: str = None):
+        """
+        Args:
+            compiled_config (CompiledConfig)
+            reference_time (datetime): Defaults to now.
+            Other arguments: see the attributes.
+        """
+        self.compiled_config = compiled_config
+        self.input_file_name = input_file_name
+        self.output_dir_name = output_dir_name
+        self.engine = engine
+        self.jobs = jobs
+        self.seed = seed
+        self.reference_time = reference_time if reference_time is not None else datetime.now()
+        self.history_weights = history_weights
+        self.no_cache = no_cache
+        self.incremental = incremental
+        self.trace_file_name = trace_file_name
+        self.store_file_name = store_file_name
+        self.term = term
+
+    @staticmethod
+    def from_config(config: Config = None, **settings):
+        """
+        Return a new RunContext with the settings of the passed Config, by default the singleton.
+        Later changes to the Config do not change the RunContext.
+        Args:
+            config (Config)
+            settings: attributes to set instead of the Config's, e.g. reference_time=...
+        Returns:
+            RunContext
+        """
+        if config is None:
+            config = Config.get_instance()
+        context_settings = {"input_file_name": config.input_file_name, "output_dir_name": config.output_dir_name,
+                            "engine": config.engine, "jobs": config.jobs, "seed": config.seed,
+                            "reference_time": config.reference_time, "no_cache": config.no_cache,
+                            "incremental": config.incremental, "trace_file_name": config.trace_file_name,
+                            "store_file_name": config.store_file_name, "term": config.term}
+        context_settings.update(settings)
+        return RunContext(config._get_compiled_config(), **context_settings)
+
+    @property
+    def json_data(self) -> dict:
+        return self.compiled_config.json_data
+
+    @property
+    def weight_rules(self):
+        """
+        Returns: WeightRules: the config's compiled weight rules
+        """
+        return self.compiled_config.weight_rules
+
+    def get_sheet_recs(self) -> [SheetRec]:
+        """
+        Returns: [SheetRec]: a new SheetRec for every sheet of the config.
+        """
+        return self.compiled_config.sheet_recs()
+
+    def get_activity_names(self) -> [str]:
+        """
+        Returns: [str]: every activity name of every sheet, once each, in config order.
+        """
+        return self.compiled_config.activity_names
+
+    def get_input_columns(self) -> dict:
+        """
+        Returns: dict: key: input field, value: CSV column header. See Config.get_input_columns().
+        """
+        return self.compiled_config.input_columns
+
+    def get_history_multiplier(self) -> float:
+        """
+        Returns: float: the lottery weight multiplier per earlier loss, or None without history weighting.
+        """
+        return self.compiled_config.history_multiplier
@@ -0,0 +1,269 @@
+"""
+Optional SQLite store of assignment runs, for questions across runs and terms (--store FILE).
+At the end of every run, its students, choices and assignments are added in one transaction:
+
+    runs(run_id, term, created_at, seed, generation, reference_time, engine, input_file)
+    students(run_id, row, student_id, student_key, first_name, last_name, in_athletics, timestamp)
+    choices(run_id, row, day, priority, activity_key)
+    activities(run_id, day, activity, activity_key, cap)
+    assignments(run_id, row, day, activity, priority)
+
+student_key and activity_key are normalized names (see student_key() and normalize_activity_name()), so a student
+or activity is matched across terms however it was spelled. assignments has a row per student and sheet day:
+priority is the choice the student got, or 0 with a NULL activity if they require manual assignment.
+A term can be run more than once; only its latest run counts as the term's outcome.
+
+The config's "history_weighting" section lowers the lottery weights of students who lost an activity in earlier terms,
+so they are more likely to win it now:
+
+    "history_weighting": {"multiply_per_loss": 0.5}
+
+A loss is a choice of the activity that the student was not placed in, at that or a higher priority.
+"""
+import logging
+import sqlite3
+from datetime import datetime
+from innovation_lab_assignments.classes import *
+from innovation_lab_assignments.classes import _ORDINALS
+
+_SCHEMA_VERSION = 1 #PRAGMA user_version of the current schema.
+#Seeds are stored as text, since they can exceed SQLite's signed 64-bit integers.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, term TEXT NOT NULL, created_at TEXT NOT NULL,
+    seed TEXT, generation INTEGER NOT NULL, reference_time TEXT, engine TEXT, input_file TEXT);
+CREATE TABLE IF NOT EXISTS students (run_id INTEGER NOT NULL, row INTEGER NOT NULL, student_id INTEGER NOT NULL,
+    student_key TEXT NOT NULL, first_name TEXT, last_name TEXT, in_athletics INTEGER, timestamp REAL,
+    PRIMARY KEY (run_id, row)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS choices (run_id INTEGER NOT NULL, row INTEGER NOT NULL, day TEXT NOT NULL, priority INTEGER NOT NULL,
+    activity_key TEXT NOT NULL, PRIMARY KEY (run_id, row, day, priority)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS activities (run_id INTEGER NOT NULL, day TEXT NOT NULL, activity TEXT NOT NULL,
+    activity_key TEXT NOT NULL, cap INTEGER, PRIMARY KEY (run_id, day, activity_key)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS assignments (run_id INTEGER NOT NULL, row INTEGER NOT NULL, day TEXT NOT NULL,
+    activity TEXT, priority INTEGER NOT NULL, PRIMARY KEY (run_id, row, day)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_term ON runs (term, run_id);
+CREATE INDEX IF NOT EXISTS students_student_key ON students (student_key, run_id);
+CREATE INDEX IF NOT EXISTS choices_activity_key ON choices (activity_key, run_id, day, priority);
+"""
+_LOOKUP_BATCH = 500 #Student keys per query, below SQLite's host parameter limit.
+_CAP_NONE = -1 #Stored cap of activities without a cap.
+
+def student_key(first_name: str, last_name: str) -> str:
+    """
+    Returns: str: the student's name in one case and spacing, to match them across terms.
+    """
+    return normalize_activity_name(first_name + " " + last_name)
+
+def default_term(reference_time: datetime) -> str:
+    """
+    Returns: str: the term of a run without --term: its reference time's year and month, e.g. "2024-11".
+    """
+    return reference_time.strftime("%Y-%m")
+
+class RunStore:
+    """
+    A SQLite run store. Use as a context manager, or close() it.
+    """
+    def __init__(self, filename: str):
+        """
+        Open the store, creating it if needed.
+        Raises:
+            sqlite3.Error
+        """
+        self.filename = filename
+        self._connection = sqlite3.connect(filename)
+        try:
+            user_version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if user_version not in (0, _SCHEMA_VERSION):
+                raise sqlite3.DatabaseError(f"{filename} has schema version {user_version}, not {_SCHEMA_VERSION}")
+            with self._connection:
+                self._connection.executescript(_SCHEMA)
+                self._connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+        except BaseException:
+            self._connection.close()
+            raise
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def save_run(self, result: AssignmentResult, term: str, seed: int = None, generation: int = 0,
+                 reference_time: datetime = None, engine: str = None, input_file: str = None) -> int:
+        """
+        Add a run's students, choices, activities and assignments, in one transaction.
+        Args:
+            result (AssignmentResult): the run's assignments
+            term (str): the term that the run assigns, e.g. default_term()
+            seed (int): lottery seed
+            generation (int): see LotteryRng
+            reference_time (datetime)
+            engine (str)
+            input_file (str)
+        Returns:
+            int: the new run_id
+        """
+        student_table = result.student_table
+        activity_keys = [normalize_activity_name(activity_name) for activity_name in student_table.activity_names]
+        days = [(day, day_index_of(day)) for day in dict.fromkeys(result.days)] #Once each, if a day has more than one sheet.
+        choices = student_table.choices
+        with self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO runs (term, created_at, seed, generation, reference_time, engine, input_file) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (term, datetime.now().isoformat(timespec="seconds"), str(seed) if seed is not None else None, generation,
+                 reference_time.isoformat() if reference_time is not None else None, engine, input_file))
+            run_id = cursor.lastrowid
+            self._connection.executemany(
+                "INSERT INTO students VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((run_id, row, student_id, student_key(first_name, last_name), first_name, last_name, in_athletics, timestamp)
+                 for row, (student_id, first_name, last_name, in_athletics, timestamp)
+                 in enumerate(zip(student_table.student_ids, student_table.first_names, student_table.last_names,
+                                  student_table.in_athletics, student_table.timestamps))))
+            self._connection.executemany(
+                "INSERT INTO choices VALUES (?, ?, ?, ?, ?)",
+                ((run_id, row, day, priority + 1, activity_key)
+                 for row in range(len(student_table))
+                 for day, day_index in days
+                 for priority in range(len(_ORDINALS))
+                 if (activity_key := activity_keys[choices[(row * len(DAYS) + day_index) * len(_ORDINALS) + priority]]) != ""))
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO activities VALUES (?, ?, ?, ?, ?)",
+                ((run_id, sheet_rec.day, activity.name, normalize_activity_name(activity.name),
+                  activity.cap if activity.cap != sys.maxsize else _CAP_NONE)
+                 for sheet_rec in result.sheet_recs for activity in sheet_rec.activities))
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO assignments VALUES (?, ?, ?, ?, ?)",
+                ((run_id, student.row, sheet_rec.day, activity.name, student_table.selection(student.row, day_index_of(sheet_rec.day)))
+                 for sheet_rec in result.sheet_recs for activity in sheet_rec.activities for student in activity.students))
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO assignments VALUES (?, ?, ?, NULL, 0)",
+                ((run_id, row, day) for day, ignored_day_index in days for row in result.unassigned_rows(day)))
+        return run_id
+
+    def term_runs(self, exclude_term: str = None) -> [int]:
+        """
+        Returns: [int]: the latest run_id of every term, except exclude_term, oldest first.
+        """
+        return [run_id for run_id, in self._connection.execute(
+            "SELECT MAX(run_id) FROM runs WHERE term IS NOT ? GROUP BY term ORDER BY MAX(run_id)", (exclude_term,))]
+
+    def lottery_losses(self, student_keys, exclude_term: str = None) -> dict:
+        """
+        Count how often each of the passed students lost each activity, in the latest run of every other term.
+        Students are looked up by the student_key index, in batches.
+        Args:
+            student_keys: student_key() of each student
+            exclude_term (str): the current term, whose runs are not history
+        Returns:
+            dict: key: student_key, value: dict of key: activity_key, value: number of losses.
+                Students without losses are not included.
+        """
+        losses = {}
+        run_ids = self.term_runs(exclude_term)
+        if len(run_ids) == 0:
+            return losses
+        self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS history_runs (run_id INTEGER PRIMARY KEY)")
+        self._connection.execute("DELETE FROM history_runs")
+        self._connection.executemany("INSERT INTO history_runs VALUES (?)", ((run_id,) for run_id in run_ids))
+        student_keys = list(dict.fromkeys(student_keys))
+        for start in range(0, len(student_keys), _LOOKUP_BATCH):
+            batch = student_keys[start: start + _LOOKUP_BATCH]
+            for key, activity_key, count in self._connection.execute(
+                f"""SELECT students.student_key, choices.activity_key, COUNT(*)
+                    FROM students
+                    JOIN history_runs ON history_runs.run_id = students.run_id
+                    JOIN choices ON choices.run_id = students.run_id AND choices.row = students.row
+                    JOIN assignments ON assignments.run_id = choices.run_id AND assignments.row = choices.row
+                                        AND assignments.day = choices.day
+                    WHERE students.student_key IN ({", ".join("?" * len(batch))})
+                      AND (assignments.priority = 0 OR assignments.priority > choices.priority)
+                    GROUP BY students.student_key, choices.activity_key""", batch):
+                losses.setdefault(key, {})[activity_key] = count
+        return losses
+
+    def oversubscribed_activities(self) -> [tuple]:
+        """
+        Compare each activity's first choice requests with its cap, in the latest run of every term.
+        Returns:
+            [tuple]: (activity, terms oversubscribed, terms offered) per activity, most often oversubscribed first
+        """
+        return self._connection.execute(
+            """SELECT MAX(activity), SUM(is_oversubscribed), COUNT(*) FROM (
+                   SELECT activities.activity_key, MAX(activities.activity) AS activity,
+                          MAX(activities.cap != ? AND activities.cap <
+                              (SELECT COUNT(*) FROM choices
+                               WHERE choices.activity_key = activities.activity_key AND choices.run_id = activities.run_id
+                                 AND choices.day = activities.day AND choices.priority = 1)) AS is_oversubscribed
+                   FROM activities JOIN runs ON runs.run_id = activities.run_id
+                   WHERE activities.run_id IN (SELECT MAX(run_id) FROM runs GROUP BY term)
+                   GROUP BY activities.activity_key, runs.term)
+               GROUP BY activity_key
+               ORDER BY SUM(is_oversubscribed) DESC, MAX(activity)""", (_CAP_NONE,)).fetchall()
+
+class HistoryWeights:
+    """
+    Lottery weight adjustment by earlier terms' losses: each candidate's weight is multiplied by
+    multiply_per_loss for every earlier loss of the activity. See RunContext.history_weights.
+    Attributes:
+        multiply_per_loss (float)
+        row_losses (dict): key: activity_key, value: dict of key: row, value: number of losses
+    """
+    def __init__(self, multiply_per_loss: float, row_losses: dict):
+        self.multiply_per_loss = multiply_per_loss
+        self.row_losses = row_losses
+
+    def apply(self, rows, activity_name: str, weights: [float]) -> [float]:
+        """
+        Return the adjusted weights of the passed candidates.
+        Args:
+            rows ([int]): candidate rows
+            activity_name (str)
+            weights ([float]): weight of each candidate
+        Returns:
+            [float]: adjusted weights
+        """
+        losses = self.row_losses.get(normalize_activity_name(activity_name))
+        if losses is None:
+            return weights
+        multiply_per_loss = self.multiply_per_loss
+        return [weight * multiply_per_loss ** losses[row] if row in losses else weight for row, weight in zip(rows, weights)]
+
+    def apply_array(self, rows, activity_name: str, weights):
+        """
+        Vectorized apply(), for the numpy engine.
+        Args:
+            rows (ndarray): candidate rows
+            activity_name (str)
+            weights (ndarray): weight of each candidate
+        Returns:
+            ndarray: adjusted weights
+        """
+        import numpy as np
+
+        losses = self.row_losses.get(normalize_activity_name(activity_name))
+        if losses is None:
+            return weights
+        return weights * np.power(self.multiply_per_loss, [losses.get(row, 0) for row in rows.tolist()])
+
+def load_history_weights(run_store: RunStore, student_table: StudentTable, term: str, multiply_per_loss: float) -> HistoryWeights:
+    """
+    Look up the earlier terms' losses of every student in the passed table.
+    Args:
+        run_store (RunStore)
+        student_table (StudentTable)
+        term (str): the current term
+        multiply_per_loss (float): see HistoryWeights
+    Returns:
+        HistoryWeights
+    """
+    student_keys = [student_key(first_name, last_name)
+                    for first_name, last_name in zip(student_table.first_names, student_table.last_names)]
+    losses = run_store.lottery_losses(student_keys, exclude_term=term)
+    row_losses = {}
+    for row, key in enumerate(student_keys):
+        for activity_key, count in losses.get(key, {}).items():
+            row_losses.setdefault(activity_key, {})[row] = count
+    return HistoryWeights(multiply_per_loss, row_losses)
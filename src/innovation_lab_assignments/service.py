@@ -0,0 +1,390 @@
+"""
+Long-running local assignment service, for tools that assign many times a day without paying for interpreter start,
+imports, config parsing and logging setup on every run:
+
+    python -m innovation_lab_assignments.service [-c JSON file] [--port N | --unix PATH] [--jobs N]
+
+It is a small HTTP/1.1 server on 127.0.0.1 (or a Unix socket), built on asyncio streams:
+
+    POST /assign?seed=N&engine=numpy&reference_time=TIME&cap=Robotics=10&cap=Monday:Chess=none
+        The body is the form responses CSV. Every option is optional; cap overrides an activity's cap on every day,
+        or on one day with "Day:Activity", and "none" removes the cap.
+        The response streams newline-delimited JSON: first {"seed", "engine", "reference_time", "students",
+        "unassigned": {day: count}}, then {"file", "csv"} for every assignment_<day>.csv and for
+        require_manual_assignment.csv, as main writes them.
+    GET /health
+        {"status": "ok", "jobs": N}
+
+Requests are assigned concurrently in a pool of worker processes. Each worker loads the config once, reloading it
+if the file changes, and keeps the most recently uploaded StudentTables parsed, keyed by the CSV's content hash,
+so repeated uploads of the same responses (with other seeds or caps) are not parsed again.
+"""
+import asyncio
+import copy
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+from innovation_lab_assignments.functions import *
+from innovation_lab_assignments.classes import Config
+
+log_file_name = "innovation_lab_service.log"
+DEFAULT_PORT = 8765
+MAX_BODY_SIZE = 256 * 1024 * 1024 #bytes
+_WARM_TABLES = 8 #Parsed StudentTables kept per worker.
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+            413: "Payload Too Large", 500: "Internal Server Error"}
+
+def parse_caps(cap_options: [str]) -> [tuple]:
+    """
+    Parse cap options, e.g. ["Robotics=10", "Monday:Chess=none"].
+    Returns:
+        [tuple]: (day or None for every day, activity name, cap) per option. A cap of sys.maxsize is no cap.
+    Raises:
+        ValueError
+    """
+    caps = []
+    for cap_option in cap_options:
+        name, separator, cap_str = cap_option.rpartition("=")
+        if separator == "" or name == "":
+            raise ValueError(f"cap {cap_option} is not [Day:]Activity=N")
+        day, ignored_separator, activity_name = name.rpartition(":")
+        if day != "" and day.lower() not in DAYS:
+            raise ValueError(f"cap {cap_option}: no day {day}")
+        if cap_str.strip().lower() == "none":
+            cap = sys.maxsize
+        else:
+            try:
+                cap = int(cap_str)
+            except ValueError:
+                raise ValueError(f"cap {cap_option} is not a number or none")
+            if cap < 0:
+                raise ValueError(f"cap {cap_option} is negative")
+        caps.append((day or None, activity_name, cap))
+    return caps
+
+def parse_options(query: dict) -> dict:
+    """
+    Parse and check the options of an /assign request.
+    Args:
+        query (dict): from urllib.parse.parse_qs()
+    Returns:
+        dict: {"seed": int or None, "engine": str, "reference_time": datetime or None, "caps": [tuple]}
+    Raises:
+        ValueError
+    """
+    def _single(name):
+        values = query.get(name, [])
+        if len(values) > 1:
+            raise ValueError(f"{name} is given more than once")
+        return values[0] if len(values) == 1 else None
+
+    unknown_names = set(query) - {"seed", "engine", "reference_time", "cap"}
+    if len(unknown_names) > 0:
+        raise ValueError(f"unknown options: {', '.join(sorted(unknown_names))}")
+    options = {"seed": None, "engine": Config.engine_python, "reference_time": None, "caps": parse_caps(query.get("cap", []))}
+    if (seed := _single("seed")) is not None:
+        try:
+            options["seed"] = int(seed)
+        except ValueError:
+            raise ValueError(f"seed {seed} is not a number")
+    if (engine := _single("engine")) is not None:
+        if engine not in Config.engines:
+            raise ValueError(f"engine {engine} is not one of {', '.join(Config.engines)}")
+        if engine == Config.engine_numpy:
+            from innovation_lab_assignments.numpy_engine import is_numpy_available
+            if not is_numpy_available():
+                raise ValueError("The " + Config.engine_numpy + " engine requires NumPy, which is not installed.")
+        options["engine"] = engine
+    if (reference_time := _single("reference_time")) is not None:
+        try:
+            options["reference_time"] = Config._parse_reference_time(reference_time)
+        except Exception:
+            raise ValueError(f"invalid reference_time: '{reference_time}'")
+    return options
+
+def apply_caps(sheet_recs: [SheetRec], caps: [tuple]):
+    """
+    Override the caps of the passed sheets' activities. See parse_caps().
+    Raises:
+        ValueError: an activity or day is not in the sheets.
+    """
+    for day, activity_name, cap in caps:
+        is_found = False
+        for sheet_rec in sheet_recs:
+            if day is not None and day_index_of(sheet_rec.day) != day_index_of(day):
+                continue
+            for activity in sheet_rec.activities:
+                if normalize_activity_name(activity.name) == normalize_activity_name(activity_name):
+                    activity.cap = cap
+                    is_found = True
+        if not is_found:
+            raise ValueError(f"no activity {activity_name}" + (f" on {day}" if day is not None else ""))
+
+# Worker process state, set by _init_worker().
+_worker_config_state = None #(config file name, mtime_ns, size) of the loaded config.
+_worker_compiled_config = None #CompiledConfig of the loaded config.
+_worker_tables = OrderedDict() #key: content hash, value: StudentTable without selections, most recently used last.
+
+def _init_worker(config_file_name: str):
+    """
+    Worker process initializer: load the config once.
+    """
+    _load_worker_config(config_file_name)
+
+def _load_worker_config(config_file_name: str):
+    """
+    Load the config if it is not loaded yet, or its file changed since.
+    """
+    from innovation_lab_assignments.config_cache import load_compiled_config
+    global _worker_config_state, _worker_compiled_config
+    config_stat = os.stat(config_file_name)
+    config_state = (config_file_name, config_stat.st_mtime_ns, config_stat.st_size)
+    if config_state != _worker_config_state:
+        try:
+            compiled_config = load_compiled_config(config_file_name)
+        except (OSError, ValueError) as exception:
+            raise ValueError(f"Unable to load config {config_file_name}: {exception}")
+        if len(compiled_config.json_data) == 0:
+            raise ValueError(f"Unable to load config {config_file_name}")
+        _worker_compiled_config = compiled_config
+        _worker_tables.clear() #Tables are interned with the config's activity names.
+        _worker_config_state = config_state
+
+def _warm_student_table(csv_bytes: bytes) -> StudentTable:
+    """
+    Return the parsed StudentTable of the passed CSV, from this worker's warm tables if it has it.
+    Raises:
+        ValueError: the CSV is not UTF-8, a column is missing, or a record has too few columns.
+    """
+    table_key = hashlib.sha256(csv_bytes).hexdigest()
+    student_table = _worker_tables.get(table_key)
+    if student_table is not None:
+        _worker_tables.move_to_end(table_key)
+        get_metrics().count("warm_table_hits")
+        return student_table
+
+    try:
+        csv_text = csv_bytes.decode("utf-8-sig")
+    except UnicodeDecodeError as exception:
+        raise ValueError(f"the CSV is not UTF-8: {exception}")
+    csv_reader = csv.reader(io.StringIO(csv_text, newline=""))
+    header = next(csv_reader, None)
+    if header is None:
+        raise ValueError("the CSV is empty")
+    column_indexes = resolve_input_columns(header, _worker_compiled_config.input_columns)
+    student_table = StudentTable.from_rows(csv_reader, column_indexes, _worker_compiled_config.activity_names)
+    _worker_tables[table_key] = student_table
+    while len(_worker_tables) > _WARM_TABLES:
+        _worker_tables.popitem(last=False)
+    return student_table
+
+def run_assignment(config_file_name: str, csv_bytes: bytes, options: dict) -> (dict, [tuple]):
+    """
+    Assign the passed form responses. Runs in a worker process.
+    Args:
+        config_file_name (str)
+        csv_bytes (bytes): form responses CSV
+        options (dict): from parse_options()
+    Returns:
+        tuple: (dict summary, [(file name, CSV text)] output files)
+    Raises:
+        ValueError: the CSV or caps are invalid.
+    """
+    from innovation_lab_assignments.random_select import LotteryRng
+    from innovation_lab_assignments.run_context import RunContext
+    _load_worker_config(config_file_name)
+
+    # The warm table is shared by every run, so each run selects students in a copy with its own selections.
+    student_table = copy.copy(_warm_student_table(csv_bytes))
+    student_table.clear_selections()
+    if len(student_table) == 0:
+        raise ValueError("the CSV has no records")
+    seed = options["seed"] if options["seed"] is not None else random.getrandbits(64)
+    context = RunContext(_worker_compiled_config, engine=options["engine"], seed=seed, reference_time=options["reference_time"])
+    reference_time = context.reference_time
+    sheet_recs = context.get_sheet_recs()
+    apply_caps(sheet_recs, options["caps"])
+    result = assign_sheets(sheet_recs, student_table, context.engine, LotteryRng(seed), context=context)
+
+    display_names = student_table.display_names()
+    output_tables = output_day_tables(result.sheet_recs, display_names)
+    output_tables.append(require_manual_assignment_table(result, display_names))
+    output_files = []
+    for file_name, header, columns in output_tables:
+        csv_file = io.StringIO(newline="")
+        write_csv_rows(csv_file, header, columns)
+        output_files.append((file_name, csv_file.getvalue()))
+    summary = {"seed": seed, "engine": options["engine"], "reference_time": reference_time.isoformat(),
+               "students": len(student_table), "unassigned": {day: result.unassigned_count(day) for day in result.days}}
+    return summary, output_files
+
+class AssignmentService:
+    """
+    The asyncio HTTP server and its worker pool. Use start() in a running event loop, then close().
+    """
+    def __init__(self, config_file_name: str, jobs: int = 1, max_body_size: int = MAX_BODY_SIZE):
+        """
+        Args:
+            config_file_name (str): JSON config file
+            jobs (int): number of worker processes, and so of concurrently assigned requests
+            max_body_size (int): largest accepted upload, in bytes
+        """
+        self.config_file_name = os.path.abspath(config_file_name)
+        self.jobs = max(jobs, 1)
+        self.max_body_size = max_body_size
+        self._executor = None
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, unix_path: str = None):
+        """
+        Start the worker pool and the server.
+        Args:
+            host (str)
+            port (int): 0 for any free port. See address.
+            unix_path (str): Unix socket path to listen on instead of host and port.
+        """
+        self._executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_worker, initargs=(self.config_file_name,))
+        if unix_path is not None:
+            self._server = await asyncio.start_unix_server(self._handle_connection, path=unix_path)
+        else:
+            self._server = await asyncio.start_server(self._handle_connection, host, port)
+        logging.info("Assignment service listening on %s with %i jobs", self.address, self.jobs)
+
+    @property
+    def address(self):
+        """
+        Returns: the listening socket's address: (host, port), or the Unix socket path.
+        """
+        return self._server.sockets[0].getsockname()
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            #Waiting for running assignments in a thread keeps the event loop serving the other tasks.
+            await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serve one request per connection.
+        """
+        try:
+            await self._handle_request(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as exception:
+            logging.exception(f"Service request failed: {exception}")
+            if not writer.is_closing():
+                await _write_json_response(writer, 500, {"error": str(exception)})
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        request_line = (await reader.readline()).decode("latin-1").rstrip("\r\n")
+        headers = {}
+        while (header_line := (await reader.readline()).decode("latin-1").rstrip("\r\n")) != "":
+            name, ignored_separator, value = header_line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        method, ignored_separator, target = request_line.partition(" ")
+        url = urlsplit(target.rpartition(" ")[0] or target)
+
+        if url.path == "/health":
+            if method != "GET":
+                return await _write_json_response(writer, 405, {"error": "use GET"})
+            return await _write_json_response(writer, 200, {"status": "ok", "jobs": self.jobs})
+        if url.path != "/assign":
+            return await _write_json_response(writer, 404, {"error": f"no such path {url.path}"})
+        if method != "POST":
+            return await _write_json_response(writer, 405, {"error": "use POST"})
+        if "content-length" not in headers:
+            return await _write_json_response(writer, 411, {"error": "Content-Length is required"})
+        try:
+            content_length = int(headers["content-length"])
+            options = parse_options(parse_qs(url.query, keep_blank_values=True))
+        except ValueError as exception:
+            return await _write_json_response(writer, 400, {"error": str(exception)})
+        if content_length > self.max_body_size:
+            return await _write_json_response(writer, 413, {"error": f"uploads are limited to {self.max_body_size} bytes"})
+        csv_bytes = await reader.readexactly(content_length)
+
+        try:
+            summary, output_files = await asyncio.get_running_loop().run_in_executor(
+                self._executor, run_assignment, self.config_file_name, csv_bytes, options)
+        except ValueError as exception:
+            return await _write_json_response(writer, 400, {"error": str(exception)})
+
+        # Each output file is sent as its own chunk, so clients can handle the sheets as they arrive.
+        writer.write(_status_line(200) + b"Content-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+                     b"Connection: close\r\n\r\n")
+        for item in [summary] + [{"file": file_name, "csv": csv_text} for file_name, csv_text in output_files]:
+            line = json.dumps(item).encode("utf-8") + b"\n"
+            writer.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+            await writer.drain()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+def _status_line(status: int) -> bytes:
+    return f"HTTP/1.1 {status} {_REASONS[status]}\r\n".encode("ascii")
+
+async def _write_json_response(writer: asyncio.StreamWriter, status: int, body: dict):
+    body_bytes = json.dumps(body).encode("utf-8")
+    writer.write(_status_line(status) + f"Content-Type: application/json\r\nContent-Length: {len(body_bytes)}\r\n"
+                 f"Connection: close\r\n\r\n".encode("ascii") + body_bytes)
+    await writer.drain()
+
+def _parse_cmd_line_args():
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="innovation_lab_assignments.service",
+                                         description="Serves assignments over HTTP on localhost, keeping the config and parsed responses warm.")
+    arg_parser.add_argument("-c", help="Configuration file. Defaults to daily_activities_config.json.",
+                            default="daily_activities_config.json", metavar="JSON file")
+    arg_parser.add_argument("--host", default="127.0.0.1", help="Address to listen on. Defaults to 127.0.0.1.")
+    arg_parser.add_argument("--port", type=int, default=DEFAULT_PORT, metavar="N", help=f"Port to listen on. Defaults to {DEFAULT_PORT}.")
+    arg_parser.add_argument("--unix", default=None, metavar="PATH", help="Listen on the Unix socket PATH instead of a port.")
+    arg_parser.add_argument("--jobs", type=int, default=1, metavar="N",
+                            help="Number of worker processes, and so of concurrently assigned requests. Defaults to 1.")
+    return arg_parser.parse_args()
+
+def main():
+    import pathlib
+    from my_utilities import init_log
+
+    config = Config.get_instance()
+    if config.project_root == "":
+        config.project_root = str(pathlib.PurePath(__file__).parent)
+    init_log(prepend_project_root_if_required(log_file_name, config.project_root), logging_level=logging.INFO, truncate_log=True)
+
+    args = _parse_cmd_line_args()
+    config_file_name = prepend_project_root_if_required(args.c, config.project_root)
+    config.load_config_with(config_file_name)
+    if len(config.json_data) == 0:
+        return die()
+
+    async def _serve():
+        service = AssignmentService(config_file_name, args.jobs)
+        await service.start(args.host, args.port, args.unix)
+        try:
+            await service.serve_forever()
+        finally:
+            await service.close()
+
+    try:
+        asyncio.run(_serve())
+    except KeyboardInterrupt:
+        pass
+    logging.info("Done")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+Monte Carlo fairness simulation.
+Runs the main_loop assignment logic many times with different seeds, without writing any CSVs,
+and reports how often each student gets their first, second or third choice, or requires manual assignment.
+The input CSV is parsed once, and the StudentTable is sent once to each worker process.
+"""
+import copy
+import json
+import operator
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from innovation_lab_assignments.functions import *
+from innovation_lab_assignments.classes import Config
+
+log_file_name = "innovation_lab_simulation.log"
+
+class SimulationCounts:
+    """
+    Outcome counts summed over simulation runs. Counts from different workers are combined with add_counts().
+    Attributes:
+        runs (int): Number of runs counted
+        selection_counts (array): Count per student row, day and selection priority (0 is manual assignment).
+            Only days that have a sheet are counted.
+        activity_student_counts ([[int]]): Total students assigned per sheet and activity
+    """
+    def __init__(self, student_count: int, sheet_dicts: [dict], engine: str = Config.engine_python):
+        """
+        Args:
+            student_count (int)
+            sheet_dicts ([dict]): sheets from the config file
+            engine (str): with Config.engine_numpy, runs are counted with NumPy
+        """
+        self.runs = 0
+        self.selection_counts = array("q", bytes(student_count * len(DAYS) * 4 * 8))
+        self.activity_student_counts = [[0] * len(sheet_dict["activities"]) for sheet_dict in sheet_dicts]
+        self._day_indexes = sorted({day_index_of(sheet_dict["day"]) for sheet_dict in sheet_dicts})
+        self._is_numpy = engine == Config.engine_numpy
+        self._selection_indexes = None #NumPy index arrays, built by the first add_run().
+        self._count_offsets = None
+
+    def __getstate__(self):
+        # The index arrays are rebuilt when needed, rather than sent back from worker processes.
+        state = self.__dict__.copy()
+        state["_selection_indexes"] = state["_count_offsets"] = None
+        return state
+
+    def add_run(self, student_table: StudentTable, sheet_recs: [SheetRec]):
+        """
+        Count the outcome of one run.
+        """
+        self.runs += 1
+        selections = student_table.selections
+        if self._is_numpy:
+            import numpy as np
+            if self._selection_indexes is None:
+                #selections index of every counted (row, day), and the offset of its counts in selection_counts.
+                self._selection_indexes = (np.arange(len(student_table))[:, None] * len(DAYS) + self._day_indexes).ravel()
+                self._count_offsets = self._selection_indexes * 4
+            priorities = np.frombuffer(selections, dtype=np.int8)[self._selection_indexes]
+            #Each (row, day) is counted once, so the fancy-indexed add does not drop repeated indexes.
+            np.frombuffer(self.selection_counts, dtype=np.int64)[self._count_offsets + priorities] += 1
+        else:
+            selection_counts = self.selection_counts
+            for day_index in self._day_indexes:
+                for offset, priority in zip(range(day_index * 4, len(selection_counts), len(DAYS) * 4), selections[day_index::len(DAYS)]):
+                    selection_counts[offset + priority] += 1
+        for sheet_counts, sheet_rec in zip(self.activity_student_counts, sheet_recs):
+            for activity_index, activity in enumerate(sheet_rec.activities):
+                sheet_counts[activity_index] += len(activity.students)
+
+    def add_counts(self, other):
+        """
+        Add the counts of another SimulationCounts to this one.
+        """
+        self.runs += other.runs
+        if self._is_numpy:
+            import numpy as np
+            np.frombuffer(self.selection_counts, dtype=np.int64)[:] += np.frombuffer(other.selection_counts, dtype=np.int64)
+        else:
+            self.selection_counts = array("q", map(operator.add, self.selection_counts, other.selection_counts))
+        for sheet_counts, other_sheet_counts in zip(self.activity_student_counts, other.activity_student_counts):
+            for activity_index, count in enumerate(other_sheet_counts):
+                sheet_counts[activity_index] += count
+
+# Worker process state, set once per worker by _init_worker().
+_worker_state = None
+
+def _init_worker(student_table: StudentTable, sheet_dicts: [dict], engine: str, context):
+    """
+    Worker process initializer. The parsed StudentTable and the RunContext are shared by every run the worker simulates.
+    """
+    global _worker_state
+    _worker_state = (student_table, sheet_dicts, engine, context)
+
+def _simulate_runs(seeds: [int]) -> SimulationCounts:
+    """
+    Run the assignment once per seed, and count the outcomes.
+    Args:
+        seeds ([int]): one lottery seed per run
+    Returns:
+        SimulationCounts
+    """
+    from innovation_lab_assignments.random_select import LotteryRng
+    student_table, sheet_dicts, engine, context = _worker_state
+    day_indexes = [day_index_of(sheet_dict["day"]) for sheet_dict in sheet_dicts]
+    counts = SimulationCounts(len(student_table), sheet_dicts, engine)
+
+    for seed in seeds:
+        # Every run starts with no students selected.
+        student_table.clear_selections()
+        sheet_recs = [SheetRec(sheet_dict) for sheet_dict in sheet_dicts]
+        choice_index = ChoiceIndex(student_table, day_indexes) if engine == Config.engine_python else None
+        lottery_rng = LotteryRng(seed)
+        for sheet_rec in sheet_recs:
+            assign_sheet(sheet_rec, student_table, engine, lottery_rng, choice_index, context)
+        counts.add_run(student_table, sheet_recs)
+
+    return counts
+
+def run_simulation(student_table: StudentTable, sheet_dicts: [dict], runs: int, base_seed: int, engine: str = Config.engine_python,
+                   jobs: int = 1, context=None) -> SimulationCounts:
+    """
+    Simulate runs assignments. Run i uses lottery seed base_seed + i, so any single run can be reproduced
+    with main's --seed option.
+    Args:
+        student_table (StudentTable): parsed students
+        sheet_dicts ([dict]): sheets from the config file
+        runs (int): number of runs
+        base_seed (int)
+        engine (str)
+        jobs (int): number of worker processes
+        context (RunContext): weighting of every run. Defaults to random_select.default_context().
+    Returns:
+        SimulationCounts
+    """
+    from innovation_lab_assignments.random_select import default_context
+    seeds = [base_seed + i for i in range(runs)]
+    init_args = (student_table, sheet_dicts, engine, context if context is not None else default_context())
+
+    if jobs <= 1:
+        #Runs select students in a copy, so the caller's table is left as it is, as with worker processes.
+        _init_worker(copy.copy(student_table), *init_args[1:])
+        return _simulate_runs(seeds)
+
+    # Several chunks per worker keeps the workers evenly busy.
+    chunk_count = jobs * 4
+    seed_chunks = [seeds[i::chunk_count] for i in range(chunk_count) if i < runs]
+    counts = SimulationCounts(len(student_table), sheet_dicts, engine)
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=init_args) as executor:
+        for chunk_counts in executor.map(_simulate_runs, seed_chunks):
+            counts.add_counts(chunk_counts)
+    return counts
+
+def summarize(counts: SimulationCounts, student_table: StudentTable, sheet_dicts: [dict]) -> dict:
+    """
+    Turn SimulationCounts into per-student and per-activity rates.
+    Only days that have a sheet are included.
+    Args:
+        counts (SimulationCounts)
+        student_table (StudentTable)
+        sheet_dicts ([dict])
+    Returns:
+        dict: {"runs", "students", "activities"}, suitable for saving to a .json file.
+    """
+    rate_names = ["manual_assignment_rate", "first_choice_rate", "second_choice_rate", "third_choice_rate"]
+    runs = max(counts.runs, 1)
+    students = []
+    # key: (day index, activity id), value: [first choice requests, first choice hits] per in_athletics (0, 1)
+    first_choice_totals = {}
+
+    for row in range(len(student_table)):
+        student_summary = {"student_id": student_table.student_ids[row],
+                           "name": student_table.first_names[row] + " " + student_table.last_names[row],
+                           "in_athletics": student_table.in_athletics[row] == 1,
+                           "days": {}}
+        for sheet_dict in sheet_dicts:
+            day_index = day_index_of(sheet_dict["day"])
+            offset = (row * len(DAYS) + day_index) * 4
+            priority_counts = counts.selection_counts[offset: offset + 4]
+            student_summary["days"][sheet_dict["day"]] = {rate_name: priority_counts[priority] / runs
+                                                          for priority, rate_name in enumerate(rate_names)}
+            totals = first_choice_totals.setdefault((day_index, student_table.choice_id(row, day_index, 1)), [[0, 0], [0, 0]])
+            totals[student_table.in_athletics[row]][0] += counts.runs
+            totals[student_table.in_athletics[row]][1] += priority_counts[1]
+        students.append(student_summary)
+
+    def _hit_rate(requests_and_hits):
+        requests, hits = requests_and_hits
+        return hits / requests if requests > 0 else None
+
+    activities = []
+    for sheet_dict, sheet_counts in zip(sheet_dicts, counts.activity_student_counts):
+        day_index = day_index_of(sheet_dict["day"])
+        for activity_dict, student_count in zip(sheet_dict["activities"], sheet_counts):
+            activity = Activity(activity_dict)
+            totals = first_choice_totals.get((day_index, student_table.activity_id(activity.name)), [[0, 0], [0, 0]])
+            activities.append({"day": sheet_dict["day"],
+                               "activity": activity.name,
+                               "cap": activity.cap if activity.cap != sys.maxsize else None,
+                               "mean_students": student_count / runs,
+                               "first_choice_requests": (totals[0][0] + totals[1][0]) // runs,
+                               "first_choice_rate": _hit_rate([totals[0][0] + totals[1][0], totals[0][1] + totals[1][1]]),
+                               "first_choice_rate_in_athletics": _hit_rate(totals[1]),
+                               "first_choice_rate_not_in_athletics": _hit_rate(totals[0])})
+
+    return {"runs": counts.runs, "students": students, "activities": activities}
+
+def _parse_cmd_line_args():
+    import argparse
+    arg_parser = argparse.ArgumentParser(prog="innovation_lab_assignments.simulate",
+                                         description="Runs the assignment many times with different seeds, and writes per-student and per-activity choice rates as JSON.")
+    arg_parser.add_argument("input_file", metavar="<input file>", help="Name of CSV file with form responses")
+    arg_parser.add_argument("-c", help="Configuration file. Defaults to daily_activities_config.json.",
+                            default="daily_activities_config.json", metavar="JSON file")
+    arg_parser.add_argument("-o", "--output", default="simulation_results.json", metavar="JSON file",
+                            help="Results file. Defaults to simulation_results.json.")
+    arg_parser.add_argument("--runs", type=int, default=1000, metavar="N", help="Number of simulated runs. Defaults to 1000.")
+    arg_parser.add_argument("--jobs", type=int, default=1, metavar="N", help="Number of worker processes. Defaults to 1.")
+    arg_parser.add_argument("--seed", type=int, default=None, metavar="N",
+                            help="Seed of the first run; run i uses seed + i. Defaults to a new seed.")
+    arg_parser.add_argument("--engine", choices=Config.engines, default=Config.engine_python,
+                            help="Assignment engine. Defaults to python.")
+    arg_parser.add_argument("--reference-time", type=Config._parse_reference_time, default=None, metavar="TIME",
+                            help="Time that timestamp weights are calculated from. Defaults to now.")
+    arg_parser.add_argument("--no-cache", action="store_true", help="Always parse the input file, without the parsed input cache.")
+    return arg_parser.parse_args()
+
+def main():
+    import pathlib
+    import random
+    import time
+    from my_utilities import init_log
+    from innovation_lab_assignments.input_cache import load_student_table
+    from innovation_lab_assignments.run_context import RunContext
+
+    config = Config.get_instance()
+    if config.project_root == "":
+        config.project_root = str(pathlib.PurePath(__file__).parent)
+    init_log(prepend_project_root_if_required(log_file_name, config.project_root), logging_level=logging.INFO, truncate_log=True)
+
+    args = _parse_cmd_line_args()
+    config.load_config_with(prepend_project_root_if_required(args.c, config.project_root))
+    if len(config.json_data) == 0:
+        return die()
+
+    if args.engine == Config.engine_numpy:
+        from innovation_lab_assignments.numpy_engine import is_numpy_available
+        if not is_numpy_available():
+            logging.error("The " + Config.engine_numpy + " engine requires NumPy, which is not installed.")
+            return die()
+
+    student_table = load_student_table(args.input_file, config.get_activity_names(), use_cache=not args.no_cache,
+                                       input_columns=config.get_input_columns(), jobs=args.jobs)
+    logging.info("%i records to process", len(student_table))
+    if len(student_table) == 0:
+        return die()
+    log_unmatched_choices(student_table, config.get_activity_names())
+
+    base_seed = args.seed if args.seed is not None else random.getrandbits(32)
+    reference_time = args.reference_time if args.reference_time is not None else datetime.now()
+    context = RunContext.from_config(config, reference_time=reference_time, engine=args.engine, jobs=args.jobs)
+    student_table.compute_base_weights(reference_time) #Once here, instead of in every worker.
+    sheet_dicts = [sheet_dict["sheet"] for sheet_dict in config.get_sheets()]
+    logging.info("Simulating %i runs with seeds %i - %i", args.runs, base_seed, base_seed + args.runs - 1)
+
+    start_time = time.perf_counter()
+    counts = run_simulation(student_table, sheet_dicts, args.runs, base_seed, args.engine, args.jobs, context)
+    logging.info("Simulated %i runs in %.1f seconds", counts.runs, time.perf_counter() - start_time)
+
+    results = summarize(counts, student_table, sheet_dicts)
+    results["base_seed"] = base_seed
+    with open(args.output, "w") as output_file:
+        # noinspection PyTypeChecker
+        json.dump(results, output_file, indent=2)
+
+    logging.info("Done")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
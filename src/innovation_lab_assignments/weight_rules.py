@@ -0,0 +1,153 @@
+"""
+Declarative activity weight rules.
+The "weight_rules" section of the config file adjusts the lottery weights of matching students, per activity:
+
+    "weight_rules": [
+       {"activity": "Athletics", "when": {"in_athletics": true}, "add": 1e-05},
+       {"activity": "*", "when": {"in_athletics": false}, "multiply": 0.5}
+    ]
+
+"activity" is an activity name (in any case and spacing, see normalize_activity_name()), or "*" for every activity. "when" maps StudentTable columns (see RULE_COLUMNS)
+to the value a student must have for the rule to apply; without "when", the rule applies to every student.
+Each rule either adds to, or multiplies, the weight. Rules are applied in config order. Remember that students
+with smaller lottery keys win, so a larger weight lowers a student's chances.
+
+Rules are compiled once into an ActivityWeights per activity, which adjusts a whole batch of candidates in one call.
+Configs without "weight_rules" are translated from the legacy "activity_weight_factors" Athletics factor.
+"""
+import logging
+from innovation_lab_assignments.classes import normalize_activity_name
+
+# Columns that rules can test. key: rule column name, value: (StudentTable attribute, NumPy dtype name)
+RULE_COLUMNS = {"in_athletics": ("in_athletics", "bool")}
+_OPERATIONS = ("add", "multiply")
+
+class ActivityWeights:
+    """
+    Compiled weight rules of one activity.
+    Attributes:
+        steps ([tuple]): (conditions, operation, amount) per rule, in order.
+            conditions is a tuple of (StudentTable attribute, NumPy dtype name, required value).
+    """
+    def __init__(self, steps: [tuple]):
+        self.steps = steps
+
+    def apply(self, student_table, rows, weights: [float]) -> [float]:
+        """
+        Return the adjusted weights of the passed candidates.
+        Args:
+            student_table (StudentTable)
+            rows ([int]): candidate rows
+            weights ([float]): base weight of each candidate
+        Returns:
+            [float]: adjusted weights
+        """
+        for conditions, operation, amount in self.steps:
+            if len(conditions) == 0:
+                is_matches = [True] * len(rows)
+            else:
+                columns = [(getattr(student_table, attribute), value) for attribute, ignored_dtype, value in conditions]
+                is_matches = [all(column[row] == value for column, value in columns) for row in rows]
+            if operation == "add":
+                weights = [weight + amount if is_match else weight for weight, is_match in zip(weights, is_matches)]
+            else:
+                weights = [weight * amount if is_match else weight for weight, is_match in zip(weights, is_matches)]
+        return weights
+
+    def apply_array(self, student_table, rows, weights):
+        """
+        Vectorized apply(), for the numpy engine.
+        Args:
+            student_table (StudentTable)
+            rows (ndarray): candidate rows
+            weights (ndarray): base weight of each candidate
+        Returns:
+            ndarray: adjusted weights
+        """
+        import numpy as np
+
+        for conditions, operation, amount in self.steps:
+            is_matches = np.ones(len(rows), dtype=np.bool_)
+            for attribute, dtype, value in conditions:
+                column = np.frombuffer(getattr(student_table, attribute), dtype=dtype)
+                is_matches &= column[rows] == value
+            adjusted_weights = weights + amount if operation == "add" else weights * amount
+            weights = np.where(is_matches, adjusted_weights, weights)
+        return weights
+
+class WeightRules:
+    """
+    Every activity's compiled weight rules.
+    """
+    def __init__(self, activity_steps: dict, wildcard_steps: [tuple]):
+        """
+        Args:
+            activity_steps (dict): key: normalized activity name, value: [step] of the rules for that activity, including "*" rules
+            wildcard_steps ([tuple]): steps of the "*" rules, for activities without rules of their own
+        """
+        self._activity_weights = {activity_name: ActivityWeights(steps) for activity_name, steps in activity_steps.items()}
+        self._wildcard_weights = ActivityWeights(wildcard_steps) if len(wildcard_steps) > 0 else None
+
+    def for_activity(self, activity_name: str) -> ActivityWeights:
+        """
+        Returns: ActivityWeights: the passed activity's rules, or None if no rule applies to it.
+        """
+        return self._activity_weights.get(normalize_activity_name(activity_name), self._wildcard_weights)
+
+def _legacy_rules(json_data: dict) -> [dict]:
+    """
+    Translate the legacy activity_weight_factors section. Only the Athletics factor was ever applied:
+    it is added to the weight of students in athletics.
+    """
+    for weight_factor_dict in json_data.get("activity_weight_factors", []):
+        if normalize_activity_name(weight_factor_dict["activity"]) == "athletics":
+            return [{"activity": "Athletics", "when": {"in_athletics": True}, "add": weight_factor_dict["weight_factor"]}]
+    logging.error("Weight factor for athletics is None. Add weight_rules or activity_weight_factors to the config file.")
+    return []
+
+def _compile_step(rule: dict) -> tuple:
+    """
+    Returns: tuple: (conditions, operation, amount) for the passed rule, or None if the rule is invalid.
+    """
+    conditions = []
+    for column_name, value in rule.get("when", {}).items():
+        if column_name not in RULE_COLUMNS:
+            logging.error(f"Weight rule {rule} tests unknown column {column_name}. Known columns: {', '.join(RULE_COLUMNS)}.")
+            return None
+        attribute, dtype = RULE_COLUMNS[column_name]
+        conditions.append((attribute, dtype, value))
+    operations = [operation for operation in _OPERATIONS if operation in rule]
+    if len(operations) != 1 or not isinstance(rule[operations[0]], (int, float)):
+        logging.error(f"Weight rule {rule} needs exactly one numeric {' or '.join(_OPERATIONS)}.")
+        return None
+    return tuple(conditions), operations[0], rule[operations[0]]
+
+def compile_weight_rules(json_data: dict) -> WeightRules:
+    """
+    Compile the weight rules of the passed config data. Invalid rules are logged and skipped.
+    Args:
+        json_data (dict): config file contents
+    Returns:
+        WeightRules
+    """
+    rules = json_data.get("weight_rules")
+    if rules is None:
+        rules = _legacy_rules(json_data)
+
+    activity_steps = {}
+    wildcard_steps = []
+    for rule in rules:
+        step = _compile_step(rule)
+        if step is None:
+            continue
+        activity_name = rule.get("activity", "*")
+        if activity_name == "*":
+            wildcard_steps.append(step)
+            for steps in activity_steps.values():
+                steps.append(step)
+        else:
+            activity_name = normalize_activity_name(activity_name)
+            if activity_name not in activity_steps:
+                activity_steps[activity_name] = list(wildcard_steps)
+            activity_steps[activity_name].append(step)
+    return WeightRules(activity_steps, wildcard_steps)
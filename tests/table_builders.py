@@ -0,0 +1,42 @@
+"""
+Student tables and sheets shared by the tests.
+"""
+from classes import DAYS, INPUT_COLUMNS, SheetRec, StudentTable
+
+def make_table(count, activity_names=("Robotics",), rnd=None, in_athletics=False) -> StudentTable:
+    """
+    Return a StudentTable of count students, named First<i> Last<i>.
+    Args:
+        count (int): number of students
+        activity_names ([str]): without rnd, every day's first, second and third choice, repeated when shorter.
+            With rnd, the activities that every choice is drawn from.
+        rnd (random.Random): draws the choices and timestamps, or None for the same choices for every student
+        in_athletics (bool): every student's sport answer, or None to draw each one with rnd
+    Returns:
+        StudentTable
+    """
+    students_dicts = []
+    for i in range(count):
+        athletics = rnd.choice([True, False]) if in_athletics is None else in_athletics
+        timestamp = (f"10/{rnd.randint(1, 28):02d}/2024 17:50:{rnd.randint(0, 59):02d}" if rnd is not None
+                     else f"10/{i % 28 + 1:02d}/2024 17:50:{i % 60:02d}")
+        student_dict = {INPUT_COLUMNS["first_name"]: f"First{i}", INPUT_COLUMNS["last_name"]: f"Last{i}",
+                        INPUT_COLUMNS["in_athletics"]: "Yes" if athletics else "No", INPUT_COLUMNS["timestamp"]: timestamp}
+        for day in DAYS:
+            for ordinal_index, ordinal in enumerate(["first", "second", "third"]):
+                student_dict[INPUT_COLUMNS[f"{day}_{ordinal}_choice"]] = (
+                    rnd.choice(activity_names) if rnd is not None else activity_names[ordinal_index % len(activity_names)])
+        students_dicts.append(student_dict)
+    return StudentTable.from_records(students_dicts)
+
+def sheet_dict(day: str, caps: dict) -> dict:
+    """
+    Returns: dict: a config "sheet" of the passed day, with an activity per caps item (key: activity name, value: cap).
+    """
+    return {"day": day, "activities": [{"activity": name, "cap": cap} for name, cap in caps.items()]}
+
+def make_sheet_recs(caps: dict, days=("Monday",)) -> [SheetRec]:
+    """
+    Returns: [SheetRec]: a sheet_dict() sheet of the passed caps for each of the passed days.
+    """
+    return [SheetRec(sheet_dict(day, caps)) for day in days]
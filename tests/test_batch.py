@@ -0,0 +1,67 @@
+import csv
+import json
+import os
+import tempfile
+from unittest import TestCase
+from batch import *
+
+class BatchTests(TestCase):
+    def _write_files(self, temp_dir, name, student_count, cap):
+        with open(os.path.join(temp_dir, name + ".csv"), "w", newline="") as input_file:
+            csv_writer = csv.writer(input_file)
+            csv_writer.writerow(INPUT_COLUMNS.values())
+            for index in range(student_count):
+                choices = [["Robotics", "Chess", "Yoga"][(index + choice) % 3] for choice in range(12)]
+                csv_writer.writerow([f"First{index}", f"Last{index}", "No", f"10/05/2024 18:{index % 60:02d}:00"] + choices)
+        config_data = {"weight_rules": [],
+                       "sheets": [{"sheet": {"day": "Monday",
+                                             "activities": [{"activity": "Robotics", "cap": cap},
+                                                            {"activity": "Chess", "cap": cap}]}}]}
+        with open(os.path.join(temp_dir, name + ".json"), "w") as config_file:
+            json.dump(config_data, config_file)
+
+    def test_run_batch(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._write_files(temp_dir, "north", 30, 10)
+            self._write_files(temp_dir, "south", 12, 10) #Same config contents as north.
+            self._write_files(temp_dir, "east", 20, 4)
+            manifest = [{"name": "north", "input": "north.csv", "config": "north.json", "output_dir": "out/north", "seed": 1},
+                        {"name": "south", "input": "south.csv", "config": "south.json", "output_dir": "out/south"},
+                        {"name": "missing", "input": "missing.csv", "config": "north.json", "output_dir": "out/missing"},
+                        {"name": "no config", "input": "east.csv", "config": "missing.json", "output_dir": "out/east"},
+                        {"name": "east", "input": "east.csv", "config": "east.json", "output_dir": "out/east", "engine": "optimal"},
+                        {"name": "incomplete", "input": "east.csv"}]
+            manifest_name = os.path.join(temp_dir, "manifest.json")
+            with open(manifest_name, "w") as manifest_file:
+                json.dump(manifest, manifest_file)
+
+            jobs = read_manifest(manifest_name)
+            summary = run_batch(jobs, workers=2, no_cache=True)
+            self.assertEqual(summary["configs"], 2)
+            results = {result["name"]: result for result in summary["results"]}
+            self.assertEqual(list(results), [job_dict["name"] for job_dict in manifest])
+            self.assertEqual({name: result["status"] for name, result in results.items()},
+                             {"north": "ok", "south": "ok", "missing": "failed", "no config": "failed", "east": "ok", "incomplete": "failed"})
+            self.assertEqual(summary["failed"], 3)
+            self.assertEqual((results["north"]["records"], results["north"]["manual_assignments"], results["north"]["seed"]), (30, 10, 1))
+            self.assertEqual((results["south"]["records"], results["south"]["manual_assignments"]), (12, 0))
+            self.assertEqual((results["east"]["records"], results["east"]["manual_assignments"]), (20, 12))
+            self.assertIn("read_student_table", results["north"]["spans"])
+            self.assertTrue(os.path.exists(os.path.join(temp_dir, "out", "north", "assignment_Monday.csv")))
+            self.assertIn("not found", " ".join(results["missing"]["errors"]))
+
+    def test_malformed_config(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self._write_files(temp_dir, "good", 10, 5)
+            with open(os.path.join(temp_dir, "bad.json"), "w") as config_file:
+                json.dump({"sheets": [{"day": "Monday", "activities": []}]}, config_file) #No "sheet" key.
+            manifest = [{"name": "bad", "input": "good.csv", "config": "bad.json", "output_dir": "out/bad"},
+                        {"name": "good", "input": "good.csv", "config": "good.json", "output_dir": "out/good"}]
+            manifest_name = os.path.join(temp_dir, "manifest.json")
+            with open(manifest_name, "w") as manifest_file:
+                json.dump(manifest, manifest_file)
+
+            summary = run_batch(read_manifest(manifest_name), workers=1, no_cache=True)
+            results = {result["name"]: result for result in summary["results"]}
+            self.assertEqual((results["bad"]["status"], results["good"]["status"]), ("failed", "ok"))
+            self.assertIn("invalid", results["bad"]["errors"][0])
@@ -0,0 +1,99 @@
+import csv
+import os
+import random
+import tempfile
+from unittest import TestCase
+from checkpoint import *
+from config_cache import CompiledConfig
+from functions import assign_sheets, assign_new_students, incremental_loop, read_student_table
+from random_select import LotteryRng
+from run_context import RunContext
+from table_builders import make_sheet_recs
+
+class CheckpointTests(TestCase):
+    def _write_rows(self, filename, first_index, count, mode="a"):
+        rnd = random.Random(first_index)
+        with open(filename, mode, newline="") as input_file:
+            csv_writer = csv.writer(input_file)
+            if mode == "w":
+                csv_writer.writerow(INPUT_COLUMNS.values())
+            for index in range(first_index, first_index + count):
+                choices = [rnd.choice(["Robotics", "Chess", "Yoga"]) for ignored_choice in range(12)]
+                csv_writer.writerow([f"First{index}", f"Last{index}", "No", f"10/{index // 60 + 1:02d}/2024 18:{index % 60:02d}:00"] + choices)
+
+    def _full_run(self, filename, checkpoint_name) -> RunCheckpoint:
+        input_state = input_file_state(filename)
+        student_table = read_student_table(filename)
+        sheet_recs = make_sheet_recs({"Robotics": 12, "Chess": 12, "Yoga": 12}, ["Monday", "Tuesday"])
+        result = assign_sheets(sheet_recs, student_table, Config.engine_python, LotteryRng(5))
+        save_checkpoint(checkpoint_name, RunCheckpoint(result, 5, 0, datetime(2024, 11, 1), input_state))
+        return load_checkpoint(checkpoint_name)
+
+    def _assert_incremental_run(self, checkpoint, new_table, new_count):
+        earlier_placements = [[rows for ignored_name, ignored_cap, rows in activities] for ignored_day, activities in checkpoint.sheets]
+        student_table = checkpoint.student_table
+        first_new_row = len(student_table)
+        student_table.extend(new_table)
+        new_rows = range(first_new_row, len(student_table))
+        self.assertEqual(len(new_rows), new_count)
+        self.assertEqual(student_table.first_names[first_new_row], f"First{first_new_row}")
+        self.assertEqual(student_table.student_ids[first_new_row], first_new_row + 1)
+
+        result = assign_new_students(checkpoint.sheet_recs(), student_table, new_rows, LotteryRng(checkpoint.seed, 1))
+        for sheet_rec, sheet_placements in zip(result.sheet_recs, earlier_placements):
+            for activity, rows in zip(sheet_rec.activities, sheet_placements):
+                activity_rows = [student.row for student in activity.students]
+                self.assertEqual(activity_rows[: len(rows)], rows)
+                self.assertTrue(all(row in new_rows for row in activity_rows[len(rows):]))
+                self.assertLessEqual(len(activity_rows), activity.cap)
+            # New students fill the remaining seats before any of them are left unassigned.
+            if any(row in new_rows for row in result.unassigned_rows(sheet_rec.day)):
+                self.assertTrue(all(len(activity.students) == activity.cap for activity in sheet_rec.activities))
+
+    def test_appended_rows(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            self._write_rows(filename, 0, 20, "w")
+            checkpoint = self._full_run(filename, checkpoint_file_name(temp_dir))
+            self.assertEqual(len(checkpoint.student_table), 20)
+
+            self._write_rows(filename, 20, 30)
+            new_table = read_new_rows(filename, checkpoint, input_file_state(filename))
+            self._assert_incremental_run(checkpoint, new_table, 30)
+
+    def test_changed_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            self._write_rows(filename, 0, 20, "w")
+            checkpoint = self._full_run(filename, checkpoint_file_name(temp_dir))
+
+            # The export is rewritten, with one earlier response removed; only newer timestamps are new.
+            self._write_rows(filename, 1, 19, "w")
+            self._write_rows(filename, 20, 30)
+            new_table = read_new_rows(filename, checkpoint, input_file_state(filename))
+            self._assert_incremental_run(checkpoint, new_table, 30)
+
+    def test_load_checkpoint(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            checkpoint_name = checkpoint_file_name(temp_dir)
+            self.assertIsNone(load_checkpoint(checkpoint_name))
+            with open(checkpoint_name, "wb") as checkpoint_file:
+                checkpoint_file.write(b"not a checkpoint")
+            self.assertIsNone(load_checkpoint(checkpoint_name))
+
+    def test_incremental_loop_warns_on_changed_settings(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            self._write_rows(filename, 0, 20, "w")
+            checkpoint = self._full_run(filename, checkpoint_file_name(temp_dir))
+            self._write_rows(filename, 20, 10)
+            compiled_config = CompiledConfig({"sheets": [{"sheet": {"day": day,
+                                                                    "activities": [{"activity": "Robotics", "cap": 20},
+                                                                                   {"activity": "Chess", "cap": 12},
+                                                                                   {"activity": "Yoga", "cap": 12}]}}
+                                                         for day in ["Monday", "Tuesday"]]})
+            context = RunContext(compiled_config, filename, temp_dir, engine=Config.engine_numpy, no_cache=True)
+            with self.assertLogs(level="WARNING") as logs:
+                self.assertEqual(incremental_loop(checkpoint, context), 0)
+            self.assertEqual(len([line for line in logs.output if line.startswith("WARNING")]), 2)
+            self.assertEqual(load_checkpoint(checkpoint_file_name(temp_dir)).sheet_caps(), checkpoint.sheet_caps())
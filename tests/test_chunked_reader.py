@@ -0,0 +1,65 @@
+import csv
+import mmap
+import os
+import tempfile
+from unittest import TestCase
+from chunked_reader import *
+from functions import read_student_table
+
+class ChunkedReaderTests(TestCase):
+    def _write_input(self, filename, student_count):
+        with open(filename, "w", newline="") as input_file:
+            csv_writer = csv.writer(input_file)
+            csv_writer.writerow(INPUT_COLUMNS.values())
+            for index in range(student_count):
+                # Quoted newlines, quotes and commas must not split a record.
+                first_name = f'First\n"{index}",\n' if index % 3 == 0 else f"First{index}"
+                choices = [["Chess", "robotics ", f"Club {index % 7}"][(index + choice) % 3] for choice in range(12)]
+                csv_writer.writerow([first_name, f"Last{index}", "Yes" if index % 2 == 0 else "No",
+                                     f"10/05/2024 18:{index % 60:02d}:00"] + choices)
+
+    def test_split_records(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            self._write_input(filename, 50)
+            with open(filename, "rb") as input_file, mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as file_map:
+                chunks = split_records(file_map, 0, len(file_map), 9)
+                self.assertEqual(chunks[0][0], 0)
+                self.assertEqual(chunks[-1][1], len(file_map))
+                record_count = 0
+                for (start, end), (next_start, ignored_end) in zip(chunks, chunks[1:]):
+                    self.assertEqual(end, next_start)
+                for start, end in chunks:
+                    rows = list(csv.reader(file_map[start: end].decode("utf-8").splitlines(keepends=True)))
+                    self.assertTrue(all(len(row) == len(INPUT_COLUMNS) for row in rows))
+                    record_count += len(rows)
+                self.assertEqual(record_count, 51)
+
+    def test_read_student_table_chunked(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            self._write_input(filename, 200)
+            expected_table = read_student_table(filename, ["Pickleball", "Robotics"])
+            for jobs in (1, 2):
+                student_table = read_student_table_chunked(filename, ["Pickleball", "Robotics"], jobs=jobs)
+                for name in ("student_ids", "first_names", "last_names", "in_athletics", "timestamps", "choices",
+                             "selections", "activity_names"):
+                    self.assertEqual(getattr(student_table, name), getattr(expected_table, name), name)
+
+    def test_skipped_records_log_file_lines(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            self._write_input(filename, 60)
+            with open(filename, "rb") as input_file:
+                content = input_file.read()
+            bad_indexes = [10, 31, 59] #Records that are in different chunks.
+            for index in bad_indexes:
+                content = content.replace(f"Last{index},".encode("ascii"), f"Last{index},No,bad{index},".encode("ascii"), 1)
+            with open(filename, "wb") as input_file:
+                input_file.write(content)
+
+            with self.assertLogs(level="ERROR") as logs:
+                student_table = read_student_table_chunked(filename, jobs=1)
+            self.assertEqual(len(student_table), 60 - len(bad_indexes))
+            expected_lines = [content[: content.index(f"bad{index},".encode("ascii"))].count(b"\n") + 1 for index in bad_indexes]
+            self.assertEqual([int(line.split(" line ")[1].split(":")[0]) for line in logs.output], expected_lines)
@@ -81,4 +81,84 @@ class ClassTests(TestCase):
     def test_Choice_init(self):
         choice = Choice("Monday Fourth Choice", 1)
         self.assertEqual(choice.name, "Monday Fourth Choice")
-        self.assertEqual(choice.priority, 1)
\ No newline at end of file
+        self.assertEqual(choice.priority, 1)
+
+    def test_StudentTable_student_view(self):
+        student_dict = {'I am currently participating in at least one LHS sport.': 'Yes',
+                        'Monday First Choice': 'College Essays', 'Monday Second Choice': 'Serving Seniors', 'Monday Third Choice': 'SAT/ACT Prep',
+                        'Tuesday First Choice': 'Robotics', 'Tuesday Second Choice': 'Graphic Signs', 'Tuesday Third Choice': 'Robotics',
+                        'Wednesday First Choice': 'Praise Team', 'Wednesday Second Choice': 'Serving Seniors', 'Wednesday Third Choice': 'Science Fair',
+                        'Thursday First Choice': 'Morning Announcements', 'Thursday Second Choice': 'Robotics', 'Thursday Third Choice': 'Athletics',
+                        'Timestamp': '10/28/2024 17:50:32',
+                        'Type your first name': 'Scott', 'Type your last name': 'Mitchell'}
+        table = StudentTable.from_records([student_dict, student_dict])
+        student = table.student(1)
+
+        self.assertEqual(len(table), 2)
+        self.assertEqual(student.student_id, 2)
+        self.assertEqual(student.in_athletics, True)
+        self.assertEqual(student.timestamp, datetime.datetime(2024, 10, 28, 17, 50, 32))
+        self._test_student_choices(student.tuesday_choices, ["Robotics", "Graphic Signs", "Robotics"])
+        # Choice names are interned, so repeated names share an activity id.
+        self.assertEqual(table.choice_id(1, 1, 1), table.choice_id(0, 3, 2))
+
+        student.set_selection_priority_for_day(2, "Tuesday")
+        self.assertFalse(student.is_available_for_day("tuesday"))
+        self.assertTrue(table.student(0).is_available_for_day("Tuesday"))
+        self.assertEqual(student.day_selections["tuesday"], 2)
+        self.assertEqual(student, table.student(1))
+
+    def test_StudentTable_activity_name_normalization(self):
+        student_dict = {'I am currently participating in at least one LHS sport.': 'No',
+                        'Monday First Choice': ' robotics', 'Monday Second Choice': 'ROBOTICS ', 'Monday Third Choice': 'Chess',
+                        'Tuesday First Choice': 'Graphic  Signs', 'Tuesday Second Choice': 'Basket Weaving', 'Tuesday Third Choice': 'Chess',
+                        'Wednesday First Choice': 'Chess', 'Wednesday Second Choice': 'Chess', 'Wednesday Third Choice': 'Chess',
+                        'Thursday First Choice': 'Chess', 'Thursday Second Choice': 'Chess', 'Thursday Third Choice': 'basket weaving',
+                        'Timestamp': '10/28/2024 17:50:32',
+                        'Type your first name': 'Scott', 'Type your last name': 'Mitchell'}
+        table = StudentTable.from_records([student_dict], ["Robotics", "Graphic Signs", "Chess"])
+        self.assertEqual(table.activity_id(" ROBOTICS"), 0)
+        self.assertEqual(table.choice_id(0, 0, 1), 0)
+        self.assertEqual(table.choice_id(0, 0, 2), 0)
+        self.assertEqual(table.choice_id(0, 1, 1), table.activity_id("Graphic Signs"))
+        self.assertEqual(table.activity_id("Pickleball"), -1)
+        # Config activities keep their config spelling.
+        self._test_student_choices(table.student(0).monday_choices, ["Robotics", "Robotics", "Chess"])
+        self.assertEqual(table.unmatched_choices(["Robotics", "Graphic Signs", "Chess"]), {"Basket Weaving": 2})
+
+    def test_StudentTable_available_rows(self):
+        student_dict = {INPUT_COLUMNS[field]: "Chess" for field in INPUT_COLUMNS}
+        student_dict.update({INPUT_COLUMNS["in_athletics"]: "No", INPUT_COLUMNS["timestamp"]: "10/28/2024 17:50:32"})
+        table = StudentTable.from_records([student_dict] * 5)
+        self.assertEqual(list(table.available_rows(1)), [0, 1, 2, 3, 4])
+        table.set_selection(3, 1, 2)
+        table.mark_selected([0, 4], 1, 1)
+        self.assertEqual(list(table.available_rows(1)), [1, 2])
+        self.assertEqual(len(table.available_rows(0)), 5)
+        table.set_selection(0, 1, 0)
+        self.assertEqual(list(table.available_rows(1)), [0, 1, 2])
+        table.set_day_selections(1, array("b", [1, 0, 0, 0, 3]))
+        self.assertEqual(list(table.available_rows(1)), [1, 2, 3])
+
+        result = AssignmentResult([SheetRec({"day": "Tuesday", "activities": []})], table)
+        self.assertEqual(result.days, ["Tuesday"])
+        self.assertEqual(result.unassigned_count("tuesday"), 3)
+        self.assertEqual(result.unassigned_students("Tuesday"), [table.student(1), table.student(2), table.student(3)])
+        self.assertTrue(result.is_assigned(table.student(4), "Tuesday"))
+        self.assertIs(result.sheet_rec("TUESDAY"), result.sheet_recs[0])
+        table.clear_selections()
+        self.assertEqual(result.unassigned_count("Tuesday"), 5)
+
+    def test_parse_form_timestamp(self):
+        for timestamp_str in ["10/28/2024 17:50:32", "1/5/2025 7:03:09", "02/29/2024 00:00:00"]:
+            expected = datetime.datetime.strptime(timestamp_str, "%m/%d/%Y %H:%M:%S")
+            self.assertEqual(datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=parse_form_timestamp(timestamp_str)), expected)
+        for timestamp_str in ["13/01/2024 00:00:00", "2024-10-28 17:50:32", "02/30/2024 00:00:00"]:
+            self.assertRaises(ValueError, parse_form_timestamp, timestamp_str)
+
+    def test_parse_reference_time(self):
+        self.assertEqual(Config._parse_reference_time("11/29/2024 12:00:00"), datetime.datetime(2024, 11, 29, 12, 0, 0))
+        reference_time = Config._parse_reference_time("2026-03-01T00:00:00+00:00")
+        self.assertIsNone(reference_time.tzinfo)
+        self.assertEqual(reference_time, datetime.datetime(2026, 3, 1, tzinfo=datetime.timezone.utc).astimezone().replace(tzinfo=None))
+        StudentTable.from_records([]).compute_base_weights(reference_time) #Naive, so it can be compared with the timestamps.
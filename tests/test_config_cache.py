@@ -0,0 +1,57 @@
+import json
+import sys
+import os
+import tempfile
+from unittest import TestCase, mock
+from config_cache import *
+
+class ConfigCacheTests(TestCase):
+    def _write_config(self, filename, cap):
+        config_data = {"input_columns": {"in_athletics": "Do you play a school sport?", "unknown": "Unknown"},
+                       "weight_rules": [{"activity": "Athletics", "when": {"in_athletics": True}, "add": 1e-05}],
+                       "history_weighting": {"multiply_per_loss": 0.5},
+                       "sheets": [{"sheet": {"day": "Monday",
+                                             "activities": [{"activity": "Robotics", "cap": cap},
+                                                            {"activity": "Athletics", "cap": "no cap"}]}},
+                                  {"sheet": {"day": "Tuesday",
+                                             "activities": [{"activity": "Chess", "cap": 4},
+                                                            {"activity": "Robotics", "cap": cap}]}}]}
+        with open(filename, "w") as config_file:
+            json.dump(config_data, config_file)
+
+    def test_compiled_config(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "config.json")
+            self._write_config(filename, 8)
+            cache_dir = os.path.join(temp_dir, "cache")
+            compiled_config = load_compiled_config(filename, cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [os.path.basename(cache_file_name(filename, cache_dir))])
+            self.assertEqual(sorted(os.listdir(temp_dir)), ["cache", "config.json"]) #Nothing is written next to the config.
+            self.assertEqual(compiled_config.activity_names, ["Robotics", "Athletics", "Chess"])
+            self.assertEqual(compiled_config.sheets[0], ("Monday", [("Robotics", 8), ("Athletics", sys.maxsize)]))
+            self.assertIsNotNone(compiled_config.weight_rules.for_activity("Athletics"))
+            self.assertEqual(compiled_config.input_columns["in_athletics"], "Do you play a school sport?")
+            self.assertEqual(compiled_config.input_columns["timestamp"], "Timestamp")
+            self.assertNotIn("unknown", compiled_config.input_columns)
+            self.assertEqual(compiled_config.history_multiplier, 0.5)
+            sheet_recs = compiled_config.sheet_recs()
+            self.assertEqual([activity.cap for activity in sheet_recs[1].activities], [4, 8])
+
+    def test_cache_invalidation(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "config.json")
+            cache_dir = os.path.join(temp_dir, "cache")
+            self._write_config(filename, 8)
+            load_compiled_config(filename, cache_dir)
+
+            # A touched, but unchanged, file still uses the cache.
+            mtime_ns = os.stat(filename).st_mtime_ns
+            os.utime(filename, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+            with mock.patch("config_cache.compile_weight_rules", side_effect=AssertionError("compiled again")):
+                self.assertEqual(load_compiled_config(filename, cache_dir).sheets[0][1][0], ("Robotics", 8))
+
+            # An edited file is compiled again.
+            self._write_config(filename, 12)
+            os.utime(filename, ns=(mtime_ns + 2 * 10**9, mtime_ns + 2 * 10**9))
+            compiled_config = load_compiled_config(filename, cache_dir)
+            self.assertEqual(compiled_config.sheets[0][1][0], ("Robotics", 12))
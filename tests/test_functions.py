@@ -35,4 +35,112 @@ class FunctionTests(TestCase):
         # remove_students_already_selected() should return a list with only student_ids 5 - 9,
         # as student_id 1 is already in existing_activity_students.
         revised_student_list = remove_students_already_selected(existing_activity_students, student_candidates)
-        self.assertEqual(len(revised_student_list), 5)
\ No newline at end of file
+        self.assertEqual(len(revised_student_list), 5)
+
+    def test_choice_index_matches_student_scan(self):
+        student_dict = {'I am currently participating in at least one LHS sport.': 'No',
+                        'Monday First Choice': 'Robotics', 'Monday Second Choice': 'Chess',
+                        'Monday Third Choice': 'Yoga',
+                        'Tuesday First Choice': 'Chess', 'Tuesday Second Choice': 'Robotics',
+                        'Tuesday Third Choice': 'Yoga',
+                        'Wednesday First Choice': 'Yoga', 'Wednesday Second Choice': 'Chess',
+                        'Wednesday Third Choice': 'Robotics',
+                        'Thursday First Choice': 'Robotics', 'Thursday Second Choice': 'Yoga',
+                        'Thursday Third Choice': 'Chess',
+                        'Timestamp': '10/28/2024 17:50:32',
+                        'Type your first name': 'Scott', 'Type your last name': 'Mitchell'}
+        student_table = StudentTable.from_records([student_dict] * 5)
+        students = student_table.students()
+        choice_index = ChoiceIndex(student_table)
+        robotics = Activity({"activity": "Robotics", "cap": 8})
+
+        # Mark two students selected for Monday, so they drop out of Monday's candidates.
+        mark_students_selected_for_day(students[1:3], "Monday", 2, choice_index)
+
+        for day in ["Monday", "Tuesday"]:
+            for priority in range(1, 4):
+                self.assertEqual(choice_index.students_with_activity_choice(robotics, day, priority),
+                                 students_with_activity_choice(students, robotics, day, priority))
+        self.assertEqual(len(choice_index.students_with_activity_choice(robotics, "Monday", 1)), 3)
+
+    def test_read_student_table(self):
+        import csv, gzip, os, tempfile
+        input_columns = dict(INPUT_COLUMNS, in_athletics="Do you play a school sport?")
+        header = [" " + input_columns[field] for field in input_columns] + ["Extra"]
+        rows = [[f"10/05/2024 18:54:5{index}" if field == "timestamp" else "Yes" if field == "in_athletics"
+                 else f"{field}{index}" for field in input_columns] + ["ignored"] for index in range(3)]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for filename, open_function in (("responses.csv", open), ("responses.csv.gz", gzip.open)):
+                filename = os.path.join(temp_dir, filename)
+                with open_function(filename, "wt", newline="") as output_file:
+                    csv_writer = csv.writer(output_file)
+                    csv_writer.writerow(header)
+                    csv_writer.writerows([rows[0], [], rows[1], rows[2]])
+                student_table = read_student_table(filename, ["Chess"], input_columns)
+                self.assertEqual(list(student_table.student_ids), [1, 2, 3])
+                self.assertEqual(student_table.first_names, ["first_name0", "first_name1", "first_name2"])
+                self.assertEqual(list(student_table.in_athletics), [1, 1, 1])
+                self.assertEqual(student_table.activity_names[0: 3], ["Chess", "monday_first_choice0", "monday_second_choice0"])
+                self.assertEqual(student_table.activity_names[student_table.choice_id(2, 3, 3)], "thursday_third_choice2")
+                # The default columns do not match the header.
+                self.assertEqual(len(read_student_table(filename)), 0)
+
+    def test_write_output_files(self):
+        import csv, os, tempfile
+        student_dict = {INPUT_COLUMNS[field]: "Chess" for field in INPUT_COLUMNS}
+        student_dict.update({INPUT_COLUMNS["in_athletics"]: "No", INPUT_COLUMNS["timestamp"]: "10/28/2024 17:50:32",
+                             INPUT_COLUMNS["last_name"]: "Mitchell"})
+        student_table = StudentTable.from_records([dict(student_dict, **{INPUT_COLUMNS["first_name"]: f"Scott{index}"})
+                                                   for index in range(3)])
+        sheet_rec = SheetRec({"day": "Monday", "activities": [{"activity": "Chess", "cap": 2}, {"activity": "Robotics", "cap": 2}]})
+        sheet_rec.activities[0].students.extend([student_table.student(2), student_table.student(0)])
+        sheet_rec.activities[1].students.append(student_table.student(1))
+        for row in (0, 1, 2):
+            student_table.set_selection(row, 0, 1)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_output_files(AssignmentResult([sheet_rec], student_table), temp_dir)
+            self.assertEqual(sorted(os.listdir(temp_dir)), ["assignment_Monday.csv", "require_manual_assignment.csv"])
+            with open(os.path.join(temp_dir, "assignment_Monday.csv"), newline="") as csv_file:
+                self.assertEqual(list(csv.reader(csv_file)), [["Chess", "Robotics"], ["Scott2 Mitchell", "Scott1 Mitchell"],
+                                                              ["Scott0 Mitchell", ""]])
+            with open(os.path.join(temp_dir, "require_manual_assignment.csv"), newline="") as csv_file:
+                self.assertEqual(list(csv.reader(csv_file)), [["Monday"]])
+
+    def test_write_output_files_same_day(self):
+        import csv, os, tempfile
+        student_dict = {INPUT_COLUMNS[field]: "Chess" for field in INPUT_COLUMNS}
+        student_dict.update({INPUT_COLUMNS["in_athletics"]: "No", INPUT_COLUMNS["timestamp"]: "10/28/2024 17:50:32"})
+        student_table = StudentTable.from_records([dict(student_dict, **{INPUT_COLUMNS["first_name"]: f"Scott{index}"})
+                                                   for index in range(2)])
+        sheet_recs = [SheetRec({"day": "Monday", "activities": [{"activity": name, "cap": 2}]}) for name in ("Chess", "Yoga")]
+        sheet_recs[0].activities[0].students.append(student_table.student(0))
+        sheet_recs[1].activities[0].students.append(student_table.student(1))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            write_output_files(AssignmentResult(sheet_recs, student_table), temp_dir)
+            csv_name = os.path.join(temp_dir, "assignment_Monday.csv")
+            with open(csv_name, newline="") as csv_file:
+                self.assertEqual(list(csv.reader(csv_file)), [["Chess", "Yoga"], ["Scott0 Chess", "Scott1 Chess"]])
+            if os.name == "posix":
+                umask = os.umask(0)
+                os.umask(umask)
+                self.assertEqual(os.stat(csv_name).st_mode & 0o777, 0o666 & ~umask)
+
+    def test_read_student_table_skips_bad_records(self):
+        import csv, os, tempfile
+        rows = [["First0", "Last0", "No", "10/05/2024 18:54:50"] + ["Chess"] * 12,
+                ["First1", "Last1"],
+                ["First2", "Last2", "No", "not a time"] + ["Chess"] * 12,
+                ["First3", "Last3", "Yes", "10/05/2024 18:54:53"] + ["Robotics"] * 12]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            with open(filename, "w", newline="") as output_file:
+                csv_writer = csv.writer(output_file)
+                csv_writer.writerow(INPUT_COLUMNS.values())
+                csv_writer.writerows(rows)
+            with self.assertLogs(level="ERROR") as logs:
+                student_table = read_student_table(filename)
+            self.assertEqual(student_table.first_names, ["First0", "First3"])
+            self.assertEqual(list(student_table.student_ids), [1, 2])
+            self.assertEqual(len(logs.records), 2)
+            self.assertIn("line 3", logs.output[0])
+            self.assertIn("line 4", logs.output[1])
@@ -0,0 +1,86 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from input_cache import *
+
+_HEADER = ["Timestamp", "Type your first name", "Type your last name",
+           "I am currently participating in at least one LHS sport."] + \
+          [f"{day} {ordinal} Choice" for day in ("Monday", "Tuesday", "Wednesday", "Thursday")
+                                      for ordinal in ("First", "Second", "Third")]
+
+class InputCacheTests(TestCase):
+    def _write_input(self, filename, student_count):
+        with open(filename, "w") as input_file:
+            input_file.write(",".join(_HEADER) + "\n")
+            for index in range(student_count):
+                choices = ["Chess", "Robotics", "Athletics"] * 4
+                input_file.write(",".join([f"10/05/2024 18:54:{index % 60:02d}", f"F{index}", f"L{index}",
+                                           "Yes" if index % 2 == 0 else "No"] + choices) + "\n")
+
+    def _assert_tables_equal(self, table, other_table):
+        for name in ("student_ids", "timestamps", "choices", "in_athletics", "selections", "first_names", "last_names",
+                     "activity_names"):
+            self.assertEqual(getattr(table, name), getattr(other_table, name), name)
+
+    def test_cache_hit(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            cache_dir = os.path.join(temp_dir, "cache")
+            self._write_input(filename, 5)
+            parsed_table = load_student_table(filename, ["Pickleball"], cache_dir=cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            self.assertEqual(parsed_table.activity_names, ["Pickleball", "Chess", "Robotics", "Athletics"])
+
+            # The cached table is read, not the CSV.
+            with patch("innovation_lab_assignments.functions.read_student_table", side_effect=AssertionError("CSV parsed")):
+                cached_table = load_student_table(filename, ["Pickleball"], cache_dir=cache_dir)
+            self._assert_tables_equal(parsed_table, cached_table)
+            cached_table.selections[0] = 1
+            self.assertEqual(parsed_table.selections[0], 0)
+
+            # Changed responses are parsed again.
+            self._write_input(filename, 6)
+            self.assertEqual(len(load_student_table(filename, cache_dir=cache_dir)), 6)
+            self.assertEqual(len(load_student_table(filename, use_cache=False)), 6)
+
+    def test_empty_names(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            self._write_input(filename, 1)
+            table = load_student_table(filename, use_cache=False)
+            table.first_names[0] = ""
+            write_table(os.path.join(temp_dir, "one.table"), table)
+            self._assert_tables_equal(table, read_table(os.path.join(temp_dir, "one.table")))
+
+    def test_evict(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_dir = os.path.join(temp_dir, "cache")
+            for student_count in (3, 4, 5):
+                filename = os.path.join(temp_dir, f"responses{student_count}.csv")
+                self._write_input(filename, student_count)
+                load_student_table(filename, cache_dir=cache_dir)
+                newest_name = os.path.join(cache_dir, cache_key(filename) + ".table")
+            evict(cache_dir, os.path.getsize(newest_name))
+            self.assertEqual(os.listdir(cache_dir), [os.path.basename(newest_name)])
+
+    def test_corrupt_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "responses.csv")
+            cache_dir = os.path.join(temp_dir, "cache")
+            self._write_input(filename, 5)
+            parsed_table = load_student_table(filename, cache_dir=cache_dir)
+            cache_name = os.path.join(cache_dir, cache_key(filename) + ".table")
+            with open(cache_name, "rb") as cache_file:
+                cache_bytes = cache_file.read()
+
+            # Truncated, too short for the header offset, a header offset past the end, and a column past the header.
+            header_offset = int.from_bytes(cache_bytes[-8:], "little")
+            corrupt_header = cache_bytes[header_offset: -8].replace(b'"student_ids": [', b'"student_ids": [9999')
+            for corrupt_bytes in [cache_bytes[0: len(cache_bytes) // 2], MAGIC + b"\1",
+                                  cache_bytes[0: -8] + (len(cache_bytes) * 2).to_bytes(8, "little"),
+                                  cache_bytes[0: header_offset] + corrupt_header + (header_offset).to_bytes(8, "little")]:
+                with open(cache_name, "wb") as cache_file:
+                    cache_file.write(corrupt_bytes)
+                with self.assertLogs(level="WARNING"):
+                    self._assert_tables_equal(parsed_table, load_student_table(filename, cache_dir=cache_dir))
@@ -0,0 +1,39 @@
+import os
+import random
+import tempfile
+from unittest import TestCase
+from lottery_trace import *
+# Trace with the module that functions records to.
+from functions import assign_sheet, enable_trace, disable_trace
+from random_select import LotteryRng
+from table_builders import make_table, make_sheet_recs
+
+class LotteryTraceTests(TestCase):
+    def test_trace_records_every_candidate(self):
+        table = make_table(60, ["Robotics", "Chess", "Yoga"], random.Random(13))
+        sheet_rec = make_sheet_recs({"Robotics": 5, "Chess": 10, "Yoga": 50})[0]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            trace_file_name = os.path.join(temp_dir, "trace.bin")
+            enable_trace(trace_file_name, table, seed=3)
+            try:
+                assign_sheet(sheet_rec, table, Config.engine_python, LotteryRng(3), ChoiceIndex(table))
+            finally:
+                disable_trace()
+            header, columns = read_trace(trace_file_name)
+
+        self.assertEqual(header["seed"], 3)
+        self.assertEqual(len(header["students"]), 60)
+        robotics_id = table.activity_id("Robotics")
+        robotics_first_choices = [row for row in range(len(table)) if table.choice_id(row, 0, 1) == robotics_id]
+        robotics_records = [i for i in range(len(columns["row"]))
+                            if columns["priority"][i] == 1 and columns["activity_id"][i] == robotics_id]
+        self.assertEqual(sorted(columns["row"][i] for i in robotics_records), robotics_first_choices)
+        winners = [columns["row"][i] for i in robotics_records if columns["outcome"][i] == OUTCOME_WON]
+        self.assertEqual(sorted(winners), sorted(student.row for student in sheet_rec.activities[0].students))
+
+        loser_row = next(columns["row"][i] for i in robotics_records if columns["outcome"][i] == OUTCOME_LOST)
+        rows = find_rows(header, student_name=f"first{loser_row}  LAST{loser_row}")
+        self.assertEqual(rows, [loser_row])
+        lines = explain(header, columns, rows, activity_name="Robotics")
+        self.assertIn("lost the lottery", lines[1])
+        self.assertIn("5 of", lines[1])
@@ -0,0 +1,44 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from metrics import Metrics, get_metrics, enable_metrics, disable_metrics
+
+class MetricsTests(TestCase):
+    def tearDown(self):
+        disable_metrics()
+
+    def test_disabled_by_default(self):
+        metrics = get_metrics()
+        self.assertFalse(metrics.enabled)
+        with metrics.span("lottery", day="monday"):
+            metrics.count("lotteries_run")
+
+    def test_span_and_count(self):
+        metrics = enable_metrics()
+        self.assertIs(get_metrics(), metrics)
+        for _ in range(3):
+            with metrics.span("lottery", day="monday", priority=1):
+                metrics.count("lotteries_run")
+        self.assertEqual(metrics.spans[("lottery", (("day", "monday"), ("priority", 1)))][0], 3)
+        self.assertEqual(metrics.counters["lotteries_run"], 3)
+
+    def test_merge_and_write(self):
+        metrics = Metrics()
+        other = Metrics()
+        with other.span("assign_round", day="monday"):
+            other.count("candidates_scanned", 5)
+        metrics.merge(other)
+        metrics.merge(other)
+        self.assertEqual(metrics.counters["candidates_scanned"], 10)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_file_name = os.path.join(temp_dir, "metrics.json")
+            metrics.write(json_file_name)
+            with open(json_file_name) as json_file:
+                self.assertEqual(json.load(json_file)["spans"][0]["count"], 2)
+            prom_file_name = os.path.join(temp_dir, "metrics.prom")
+            metrics.write(prom_file_name)
+            with open(prom_file_name) as prom_file:
+                text = prom_file.read()
+            self.assertIn('innovation_lab_span_count_total{span="assign_round",day="monday"} 2', text)
+            self.assertIn("innovation_lab_candidates_scanned_total 10", text)
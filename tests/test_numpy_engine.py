@@ -0,0 +1,29 @@
+import random
+from unittest import TestCase, skipUnless
+from numpy_engine import *
+from config_cache import CompiledConfig
+from functions import assign_sheet_activities
+from random_select import LotteryRng
+from run_context import RunContext
+from table_builders import make_table, make_sheet_recs
+
+@skipUnless(is_numpy_available(), "NumPy is not installed")
+class NumpyEngineTests(TestCase):
+    activity_names = ["Athletics", "Robotics", "Chess", "Yoga"]
+    caps = {"Athletics": 10, "Robotics": 12, "Chess": "no cap", "Yoga": 5}
+
+    def test_numpy_engine_matches_python_engine(self):
+        context = RunContext(CompiledConfig({"weight_rules": [{"activity": "Athletics", "when": {"in_athletics": True}, "add": 1e-05}]}))
+
+        python_table = make_table(200, self.activity_names, random.Random(7), in_athletics=None)
+        python_sheet_rec = make_sheet_recs(self.caps, ["Tuesday"])[0]
+        assign_sheet_activities(python_sheet_rec, python_table, ChoiceIndex(python_table), LotteryRng(3), context)
+
+        numpy_table = make_table(200, self.activity_names, random.Random(7), in_athletics=None)
+        numpy_sheet_rec = make_sheet_recs(self.caps, ["Tuesday"])[0]
+        assign_sheet_activities_numpy(numpy_sheet_rec, numpy_table, LotteryRng(3), context)
+
+        for python_activity, numpy_activity in zip(python_sheet_rec.activities, numpy_sheet_rec.activities):
+            self.assertEqual([student.row for student in python_activity.students],
+                             [student.row for student in numpy_activity.students])
+        self.assertEqual(python_table.selections, numpy_table.selections)
@@ -0,0 +1,56 @@
+import itertools
+import random
+from unittest import TestCase
+from optimal_engine import *
+from optimal_engine import _DayFlow
+from random_select import LotteryRng
+from table_builders import make_table, make_sheet_recs
+
+class OptimalEngineTests(TestCase):
+    activity_names = ["Robotics", "Chess", "Yoga", "Woodshop"]
+
+    @staticmethod
+    def _best_outcome(student_table: StudentTable, caps: dict) -> (int, int):
+        """
+        Brute force (manual assignments, total priority) over every possible assignment.
+        """
+        options = []
+        for row in range(len(student_table)):
+            row_options = [(None, 0)]
+            for priority in range(1, 4):
+                activity_name = student_table.activity_names[student_table.choice_id(row, 0, priority)]
+                row_options.append((activity_name, priority))
+            options.append(row_options)
+
+        best_outcome = None
+        for assignment in itertools.product(*options):
+            counts = {}
+            for activity_name, ignored_priority in assignment:
+                counts[activity_name] = counts.get(activity_name, 0) + 1
+            if all(counts.get(activity_name, 0) <= cap for activity_name, cap in caps.items()):
+                outcome = (counts.get(None, 0), sum(priority for ignored_name, priority in assignment))
+                if best_outcome is None or outcome < best_outcome:
+                    best_outcome = outcome
+        return best_outcome
+
+    def test_optimal_engine_finds_best_assignment(self):
+        rnd = random.Random(17)
+        caps = {"Robotics": 2, "Chess": 1, "Yoga": 2, "Woodshop": 1}
+        for seed in range(20):
+            student_table = make_table(7, self.activity_names, rnd)
+            sheet_rec = make_sheet_recs(caps)[0]
+            assign_sheet_activities_optimal(sheet_rec, student_table, LotteryRng(seed))
+
+            manual_count = sum(1 for row in range(len(student_table)) if student_table.selection(row, 0) == 0)
+            total_priority = sum(student_table.selection(row, 0) for row in range(len(student_table)))
+            self.assertEqual((manual_count, total_priority), self._best_outcome(student_table, caps))
+            for activity in sheet_rec.activities:
+                self.assertLessEqual(len(activity.students), activity.cap)
+
+    def test_ties_move_later_lottery_entrant(self):
+        day_flow = _DayFlow([2, 1], 1000)
+        day_flow.add_row(101, {0: 1, 1: 2}, 0)
+        day_flow.add_row(102, {0: 1, 1: 2}, 1)
+        day_flow.add_row(103, {0: 1}, 2)
+        # Moving 101 or 102 to B costs the same. 102 entered the lottery later, so 102 moves.
+        self.assertEqual((day_flow.row_node[101], day_flow.row_node[102], day_flow.row_node[103]), (0, 1, 0))
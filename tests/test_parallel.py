@@ -0,0 +1,28 @@
+import random
+from unittest import TestCase
+from parallel import *
+from functions import assign_sheet
+from random_select import LotteryRng
+from table_builders import make_table, make_sheet_recs
+
+class ParallelTests(TestCase):
+    activity_names = ["Robotics", "Chess", "Yoga"]
+    caps = {"Robotics": 10, "Chess": 15, "Yoga": 20}
+
+    def test_parallel_matches_sequential(self):
+        lottery_rng = LotteryRng(101)
+
+        sequential_table = make_table(80, self.activity_names, random.Random(11))
+        sequential_sheet_recs = make_sheet_recs(self.caps, ["Monday", "Tuesday", "Wednesday"])
+        for sheet_rec in sequential_sheet_recs:
+            assign_sheet(sheet_rec, sequential_table, Config.engine_python, lottery_rng)
+
+        parallel_table = make_table(80, self.activity_names, random.Random(11))
+        parallel_sheet_recs = make_sheet_recs(self.caps, ["Monday", "Tuesday", "Wednesday"])
+        assign_sheets_in_parallel(parallel_sheet_recs, parallel_table, lottery_rng, Config.engine_python, 2)
+
+        for sequential_sheet_rec, parallel_sheet_rec in zip(sequential_sheet_recs, parallel_sheet_recs):
+            for sequential_activity, parallel_activity in zip(sequential_sheet_rec.activities, parallel_sheet_rec.activities):
+                self.assertEqual([student.row for student in sequential_activity.students],
+                                 [student.row for student in parallel_activity.students])
+        self.assertEqual(sequential_table.selections, parallel_table.selections)
@@ -0,0 +1,34 @@
+import random
+from unittest import TestCase
+from random_select import *
+from random_select import _calculate_weight_using_timestamp
+from table_builders import make_table
+
+class RandomSelectTests(TestCase):
+    def test_select_lottery_winners_matches_randomize_students(self):
+        students = make_table(50).students()
+        activity = Activity({"activity": "Robotics", "cap": 8})
+
+        random.seed(42)
+        randomized_students = randomize_students(students, activity)
+        random.seed(42)
+        lottery_winners = select_lottery_winners(students, activity, 8)
+
+        self.assertEqual(len(randomized_students), 50)
+        self.assertEqual(lottery_winners, randomized_students[0:8])
+
+    def test_LotteryRng_substreams(self):
+        lottery_rng = LotteryRng(1234)
+        first_draws = [lottery_rng.substream("Monday", 1, "Robotics").random() for _ in range(2)]
+        self.assertEqual(first_draws[0], first_draws[1])
+        # The same lottery from an equal LotteryRng, e.g. in another process, draws the same values.
+        self.assertEqual(LotteryRng(1234).substream("monday", 1, "Robotics").random(), first_draws[0])
+        self.assertNotEqual(lottery_rng.substream("Monday", 2, "Robotics").random(), first_draws[0])
+        self.assertNotEqual(LotteryRng(4321).substream("Monday", 1, "Robotics").random(), first_draws[0])
+
+    def test_base_weights_match_timestamp_weights(self):
+        students = make_table(30).students()
+        set_reference_time(datetime(2024, 11, 29, 12, 0, 0))
+        base_weights = students[0].table.base_weights_for(get_reference_time())
+        for student in students:
+            self.assertEqual(base_weights[student.row], _calculate_weight_using_timestamp(student.timestamp))
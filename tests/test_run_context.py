@@ -0,0 +1,98 @@
+import csv
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from unittest import TestCase
+from run_context import *
+from classes import INPUT_COLUMNS
+from config_cache import CompiledConfig
+from functions import main_loop
+
+class RunContextTests(TestCase):
+    def _write_input(self, filename, student_count):
+        with open(filename, "w", newline="") as input_file:
+            csv_writer = csv.writer(input_file)
+            csv_writer.writerow(INPUT_COLUMNS.values())
+            for index in range(student_count):
+                choices = [["Robotics", "Chess", "Yoga"][(index + choice) % 3] for choice in range(12)]
+                csv_writer.writerow([f"First{index}", f"Last{index}", "Yes" if index % 2 == 0 else "No",
+                                     f"10/05/2024 18:{index % 60:02d}:00"] + choices)
+
+    def _compiled_config(self, athletics_multiply) -> CompiledConfig:
+        return CompiledConfig({"weight_rules": [{"activity": "*", "when": {"in_athletics": True}, "multiply": athletics_multiply}],
+                               "sheets": [{"sheet": {"day": day,
+                                                     "activities": [{"activity": "Robotics", "cap": 6},
+                                                                    {"activity": "Chess", "cap": 6},
+                                                                    {"activity": "Yoga", "cap": 6}]}}
+                                          for day in ["Monday", "Tuesday"]]})
+
+    def _read_outputs(self, output_dir) -> dict:
+        outputs = {}
+        for file_name in sorted(os.listdir(output_dir)):
+            if file_name.endswith(".csv"):
+                with open(os.path.join(output_dir, file_name)) as output_file:
+                    outputs[file_name] = output_file.read()
+        return outputs
+
+    def test_concurrent_runs(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_file_name = os.path.join(temp_dir, "responses.csv")
+            self._write_input(input_file_name, 40)
+            reference_time = datetime(2024, 11, 29, 12, 0, 0)
+
+            def _contexts(name):
+                return [RunContext(self._compiled_config(athletics_multiply), input_file_name, os.path.join(temp_dir, name, str(index)),
+                                   seed=index, reference_time=reference_time, no_cache=True)
+                        for index, athletics_multiply in enumerate([0.001, 1000.0, 1.0, 0.001])]
+
+            sequential_contexts = _contexts("sequential")
+            for context in sequential_contexts:
+                os.makedirs(context.output_dir_name)
+                self.assertEqual(main_loop(context), 0)
+            concurrent_contexts = _contexts("concurrent")
+            for context in concurrent_contexts:
+                os.makedirs(context.output_dir_name)
+            with ThreadPoolExecutor(max_workers=len(concurrent_contexts)) as executor:
+                self.assertEqual(list(executor.map(main_loop, concurrent_contexts)), [0] * len(concurrent_contexts))
+
+            sequential_outputs = [self._read_outputs(context.output_dir_name) for context in sequential_contexts]
+            self.assertEqual([self._read_outputs(context.output_dir_name) for context in concurrent_contexts], sequential_outputs)
+            self.assertNotEqual(sequential_outputs[0], sequential_outputs[1]) #The weight rules differ.
+
+    def test_from_config(self):
+        config = Config.get_instance()
+        config.json_data = {"sheets": [{"sheet": {"day": "Monday", "activities": [{"activity": "Chess", "cap": 3}]}}]}
+        config.seed = 5
+        context = RunContext.from_config(config, engine=Config.engine_optimal)
+        config.json_data = {}
+        config.seed = None
+        self.assertEqual((context.seed, context.engine, context.get_activity_names()), (5, Config.engine_optimal, ["Chess"]))
+        self.assertIsNotNone(context.reference_time)
+
+    def test_load_config_with_replaces_weight_rules(self):
+        config = Config.get_instance()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for weight_factor in [2, 3]:
+                filename = os.path.join(temp_dir, f"config{weight_factor}.json")
+                with open(filename, "w") as config_file:
+                    json.dump({"activity_weight_factors": [{"activity": "Athletics", "weight_factor": weight_factor}]}, config_file)
+                config.load_config_with(filename)
+                self.assertEqual(config.get_weight_rules().for_activity("athletics").steps,
+                                 [((("in_athletics", "bool", True),), "add", weight_factor)])
+            with self.assertLogs(level="ERROR"):
+                config.load_config_with(os.path.join(temp_dir, "missing.json"))
+                self.assertIsNone(config.get_weight_rules().for_activity("Athletics"))
+            self.assertEqual(config.json_data, {})
+
+    def test_main_loop_leaves_context_unchanged(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_file_name = os.path.join(temp_dir, "responses.csv")
+            self._write_input(input_file_name, 40)
+            compiled_config = self._compiled_config(1.0)
+            compiled_config.history_multiplier = 0.5
+            context = RunContext(compiled_config, input_file_name, temp_dir, seed=1, no_cache=True,
+                                 store_file_name=os.path.join(temp_dir, "runs.sqlite"), term="2025-spring")
+            self.assertEqual(main_loop(context), 0)
+            self.assertIsNone(context.history_weights)
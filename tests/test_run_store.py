@@ -0,0 +1,53 @@
+import os
+import tempfile
+from unittest import TestCase
+from run_store import *
+from functions import assign_sheets
+from random_select import LotteryRng, set_history_weights, lottery_weights_and_keys
+from table_builders import make_table, make_sheet_recs
+
+class RunStoreTests(TestCase):
+    def _assign(self, run_store, term):
+        student_table = make_table(8, ["Robotics", "Chess", "Yoga"])
+        sheet_recs = make_sheet_recs({"Robotics": 2, "Chess": 2, "Yoga": 2})
+        result = assign_sheets(sheet_recs, student_table, Config.engine_python, LotteryRng(3))
+        run_store.save_run(result, term, seed=2 ** 64 - 1)
+        return result
+
+    def test_lottery_losses(self):
+        with tempfile.TemporaryDirectory() as temp_dir, RunStore(os.path.join(temp_dir, "runs.sqlite")) as run_store:
+            result = self._assign(run_store, "2024-fall")
+            self._assign(run_store, "2025-spring")
+            self._assign(run_store, "2025-spring") #Only the latest run of a term counts.
+            self.assertEqual(len(run_store.term_runs()), 2)
+
+            student_table = result.student_table
+            keys = [student_key(first_name, last_name) for first_name, last_name in zip(student_table.first_names, student_table.last_names)]
+            losses = run_store.lottery_losses(keys, exclude_term="2025-spring")
+            for row, key in enumerate(keys):
+                priority = student_table.selection(row, 0)
+                expected = {activity_key: 1 for activity_key, choice_priority in (("robotics", 1), ("chess", 2), ("yoga", 3))
+                            if priority == 0 or choice_priority < priority}
+                self.assertEqual(losses.get(key, {}), expected)
+            lost_key = next(key for row, key in enumerate(keys) if student_table.selection(row, 0) != 1)
+            self.assertEqual(run_store.lottery_losses([lost_key])[lost_key]["robotics"], 2)
+            self.assertEqual(run_store.oversubscribed_activities(), [("Robotics", 2, 2), ("Chess", 0, 2), ("Yoga", 0, 2)])
+
+    def test_history_weights(self):
+        with tempfile.TemporaryDirectory() as temp_dir, RunStore(os.path.join(temp_dir, "runs.sqlite")) as run_store:
+            result = self._assign(run_store, "2024-fall")
+            student_table = result.student_table
+            history_weights = load_history_weights(run_store, student_table, "2025-spring", 0.5)
+            lost_rows = [row for row in range(len(student_table)) if student_table.selection(row, 0) != 1]
+            self.assertEqual(sorted(history_weights.row_losses["robotics"]), lost_rows)
+
+            students = [student_table.student(row) for row in range(len(student_table))]
+            activity = Activity({"activity": "Robotics", "cap": 2})
+            base_weights, ignored_keys = lottery_weights_and_keys(students, activity)
+            set_history_weights(history_weights)
+            try:
+                weights, ignored_keys = lottery_weights_and_keys(students, activity)
+            finally:
+                set_history_weights(None)
+            for row, (base_weight, weight) in enumerate(zip(base_weights, weights)):
+                self.assertAlmostEqual(weight, base_weight * 0.5 if row in lost_rows else base_weight)
@@ -0,0 +1,88 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+from service import *
+
+class ServiceTests(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        config_name = os.path.join(self._temp_dir.name, "config.json")
+        config_data = {"weight_rules": [],
+                       "sheets": [{"sheet": {"day": day,
+                                             "activities": [{"activity": "Robotics", "cap": 5},
+                                                            {"activity": "Chess", "cap": 5},
+                                                            {"activity": "Yoga", "cap": 5}]}}
+                                  for day in ["Monday", "Tuesday"]]}
+        with open(config_name, "w") as config_file:
+            json.dump(config_data, config_file)
+        self.service = AssignmentService(config_name, jobs=2)
+        await self.service.start("127.0.0.1", 0)
+
+    async def asyncTearDown(self):
+        await self.service.close()
+        self._temp_dir.cleanup()
+
+    def _csv_bytes(self, student_count) -> bytes:
+        csv_file = io.StringIO(newline="")
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(INPUT_COLUMNS.values())
+        for index in range(student_count):
+            choices = [["Robotics", "Chess", "Yoga"][(index + choice) % 3] for choice in range(12)]
+            csv_writer.writerow([f"First{index}", f"Last{index}", "No", f"10/05/2024 18:{index % 60:02d}:00"] + choices)
+        return csv_file.getvalue().encode("utf-8")
+
+    async def _request(self, method, target, body=b"") -> (int, bytes):
+        host, port = self.service.address[0: 2]
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n".encode("ascii") + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (header_line := (await reader.readline()).decode("latin-1").strip()) != "":
+            name, ignored_separator, value = header_line.partition(":")
+            headers[name.lower()] = value.strip()
+        if headers.get("transfer-encoding") == "chunked":
+            response_body = b""
+            while (chunk_size := int(await reader.readline(), 16)) > 0:
+                response_body += await reader.readexactly(chunk_size)
+                await reader.readexactly(2)
+        else:
+            response_body = await reader.readexactly(int(headers["content-length"]))
+        writer.close()
+        return status, response_body
+
+    async def _assign(self, query) -> (dict, dict):
+        status, response_body = await self._request("POST", "/assign?" + query, self._csv_bytes(40))
+        self.assertEqual(status, 200, response_body)
+        lines = [json.loads(line) for line in response_body.splitlines()]
+        return lines[0], {line["file"]: list(csv.reader(io.StringIO(line["csv"]))) for line in lines[1:]}
+
+    async def test_assign(self):
+        status, response_body = await self._request("GET", "/health")
+        self.assertEqual((status, json.loads(response_body)["status"]), (200, "ok"))
+
+        # Concurrent requests, in both workers.
+        query = "reference_time=2024-11-29T12:00:00&cap=Monday:Robotics=2&cap=Chess=none"
+        results = await asyncio.gather(*[self._assign(f"seed={seed}&{query}") for seed in (1, 2, 1)])
+        summary, files = results[0]
+        self.assertEqual(results[2], results[0])
+        self.assertEqual((summary["seed"], summary["students"]), (1, 40))
+        self.assertEqual(sorted(files), ["assignment_Monday.csv", "assignment_Tuesday.csv", "require_manual_assignment.csv"])
+        monday_rows = files["assignment_Monday.csv"]
+        self.assertEqual(monday_rows[0], ["Robotics", "Chess", "Yoga"])
+        self.assertEqual(sum(1 for row in monday_rows[1:] if row[0] != ""), 2)
+        self.assertGreater(sum(1 for row in monday_rows[1:] if row[1] != ""), 5)
+        manual_rows = files["require_manual_assignment.csv"]
+        self.assertEqual(sum(1 for row in manual_rows[1:] if row[0] != ""), summary["unassigned"]["Monday"])
+
+    async def test_bad_requests(self):
+        self.assertEqual((await self._request("POST", "/assign?engine=fast", self._csv_bytes(5)))[0], 400)
+        self.assertEqual((await self._request("POST", "/assign?cap=Painting=3", self._csv_bytes(5)))[0], 400)
+        self.assertEqual((await self._request("POST", "/assign?cap=Funday:Chess=1", self._csv_bytes(5)))[0], 400)
+        self.assertEqual((await self._request("POST", "/assign", b"not,a,form\r\n"))[0], 400)
+        self.assertEqual((await self._request("GET", "/assign"))[0], 405)
+        self.assertEqual((await self._request("GET", "/missing"))[0], 404)
@@ -0,0 +1,43 @@
+import random
+from unittest import TestCase
+from simulate import *
+from numpy_engine import is_numpy_available
+from random_select import LotteryRng
+from table_builders import make_table, sheet_dict
+
+class SimulateTests(TestCase):
+    activity_names = ["Robotics", "Chess", "Yoga"]
+
+    def test_run_simulation_counts_every_run(self):
+        sheet_dicts = [sheet_dict("Monday", {"Robotics": 5, "Chess": 5, "Yoga": 5})]
+        student_table = make_table(30, self.activity_names, random.Random(5))
+        counts = run_simulation(student_table, sheet_dicts, 6, 100)
+        self.assertFalse(any(student_table.selections)) #The runs select students in a copy.
+
+        # A one-run simulation with seed 102 is the same as a single assignment with seed 102.
+        single_run_table = make_table(30, self.activity_names, random.Random(5))
+        sheet_rec = SheetRec(sheet_dicts[0])
+        assign_sheet(sheet_rec, single_run_table, Config.engine_python, LotteryRng(102))
+        single_run_counts = run_simulation(make_table(30, self.activity_names, random.Random(5)), sheet_dicts, 1, 102)
+        for row in range(len(single_run_table)):
+            offset = row * len(DAYS) * 4
+            self.assertEqual(single_run_counts.selection_counts[offset + single_run_table.selection(row, 0)], 1)
+            self.assertEqual(sum(single_run_counts.selection_counts[offset + 4: offset + len(DAYS) * 4]), 0) #Days without a sheet.
+
+        results = summarize(counts, student_table, sheet_dicts)
+        self.assertEqual(results["runs"], 6)
+        self.assertEqual(counts.activity_student_counts, [[30, 30, 30]])
+        for student_summary in results["students"]:
+            self.assertAlmostEqual(sum(student_summary["days"]["Monday"].values()), 1.0)
+        manual_rates = [student_summary["days"]["Monday"]["manual_assignment_rate"] for student_summary in results["students"]]
+        self.assertAlmostEqual(sum(manual_rates), 15)
+
+    def test_counts_match_across_jobs_and_engines(self):
+        sheet_dicts = [sheet_dict(day, {"Robotics": 8, "Chess": 8, "Yoga": 8}) for day in ["Monday", "Wednesday"]]
+        student_table = make_table(40, self.activity_names, random.Random(9))
+        counts = run_simulation(student_table, sheet_dicts, 8, 300)
+        self.assertEqual(run_simulation(student_table, sheet_dicts, 8, 300, jobs=2).selection_counts, counts.selection_counts)
+        if is_numpy_available():
+            numpy_counts = run_simulation(student_table, sheet_dicts, 8, 300, Config.engine_numpy, jobs=2)
+            self.assertEqual(numpy_counts.selection_counts, counts.selection_counts)
+            self.assertEqual(numpy_counts.activity_student_counts, counts.activity_student_counts)
@@ -0,0 +1,40 @@
+import random
+from unittest import TestCase, skipUnless
+from weight_rules import *
+from classes import StudentTable
+from numpy_engine import is_numpy_available
+from table_builders import make_table
+
+class WeightRulesTests(TestCase):
+    def test_legacy_athletics_factor(self):
+        table = make_table(20, rnd=random.Random(17), in_athletics=None)
+        rows = list(range(len(table)))
+        weights = [0.5] * len(rows)
+        weight_rules = compile_weight_rules({"activity_weight_factors": [{"activity": "Athletics", "weight_factor": 0.25}]})
+        self.assertIsNone(weight_rules.for_activity("Robotics"))
+        adjusted_weights = weight_rules.for_activity("Athletics").apply(table, rows, weights)
+        self.assertEqual(adjusted_weights, [0.75 if table.in_athletics[row] else 0.5 for row in rows])
+
+    def test_rules_apply_in_config_order(self):
+        table = make_table(20, rnd=random.Random(17), in_athletics=None)
+        rows = list(range(len(table)))
+        weight_rules = compile_weight_rules({"weight_rules": [{"activity": "*", "multiply": 2},
+                                                              {"activity": "Chess", "when": {"in_athletics": False}, "add": 1},
+                                                              {"activity": "*", "when": {"in_athletics": True}, "multiply": 10},
+                                                              {"activity": "Chess", "when": {"unknown": 1}, "add": 1}]})
+        self.assertEqual(weight_rules.for_activity("Robotics").apply(table, rows, [1.0] * len(rows)),
+                         [20.0 if table.in_athletics[row] else 2.0 for row in rows])
+        self.assertEqual(weight_rules.for_activity("Chess").apply(table, rows, [1.0] * len(rows)),
+                         [20.0 if table.in_athletics[row] else 3.0 for row in rows])
+
+    @skipUnless(is_numpy_available(), "NumPy is not installed")
+    def test_apply_array_matches_apply(self):
+        import numpy as np
+        table = make_table(50, rnd=random.Random(17), in_athletics=None)
+        rows = list(range(0, len(table), 2))
+        weights = [random.Random(row).random() for row in rows]
+        weight_rules = compile_weight_rules({"weight_rules": [{"activity": "Athletics", "when": {"in_athletics": True}, "add": 1e-05},
+                                                              {"activity": "Athletics", "multiply": 3}]})
+        activity_weights = weight_rules.for_activity("Athletics")
+        self.assertEqual(activity_weights.apply_array(table, np.array(rows), np.array(weights)).tolist(),
+                         activity_weights.apply(table, rows, weights))